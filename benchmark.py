@@ -0,0 +1,205 @@
+"""Benchmark do pipeline do dashboard com dados sintéticos no formato de performance_logistica.
+
+O gerador é determinístico (seed) e produz os problemas comuns dos arquivos importados:
+datas em formatos misturados, com espaços, 31/09, seriais do Excel e valores inválidos,
+e contagens com separador de milhar / vírgula decimal. Cada etapa é cronometrada em separado:
+leitura do CSV, limpeza, gravação no SQLite, mesclagem de um .db pelo SQL, filtros, página
+da tabela detalhada, somas acumuladas dos KPIs, agregações de cada visão, taxa de retenção,
+exportações e montagem das figuras Plotly.
+
+Executar `python benchmark.py [--rows 10000 100000 1000000] [--out benchmark.json]`
+grava o relatório em JSON (um registro por tamanho, com o tempo de cada etapa em segundos).
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+import export
+import ingest
+import metrics
+import queries
+import rangesums
+import views
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+
+
+def generate_rows(rows, years=(2023, 2024, 2025), carriers=30, operations=('LML', 'Direta', 'Reversa', 'Outros'), seed=42):
+    """DataFrame "sujo", como um CSV exportado de planilha (todas as colunas em texto)."""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(f'{min(years)}-01-01')
+    days = (pd.Timestamp(f'{max(years)}-12-31') - start).days + 1
+    # Cada dia do intervalo é formatado uma vez e repetido pelo índice sorteado
+    dias = pd.date_range(start, periods=days, freq='D')
+    dia = rng.integers(0, days, rows)
+    br, iso = dias.strftime('%d/%m/%Y').to_numpy()[dia], dias.strftime('%Y-%m-%d').to_numpy()[dia]
+    serial = (dias - pd.Timestamp(ingest.EXCEL_ORIGIN)).days.astype(str).to_numpy()[dia]
+    ano = dias.strftime('%Y').to_numpy()[dia]
+
+    # Datas em formatos variados: dd/mm/aaaa, ISO, com espaços, seriais do Excel, 31/09 e inválidas
+    kind = rng.choice(6, rows, p=[0.6, 0.2, 0.05, 0.1, 0.03, 0.02])
+    texto = np.where(kind == 1, iso, br)
+    texto = np.where(kind == 2, ' ' + br + ' ', texto)
+    texto = np.where(kind == 3, serial, texto)
+    texto = np.where(kind == 4, '31/09/' + ano, texto)
+    texto = np.where(kind == 5, rng.choice(['', 'sem data', '99/99/9999'], rows), texto)
+
+    liberados = rng.integers(0, 3000, rows)
+    malha = rng.integers(0, 40, rows)
+    # Contagens como texto, parte com separador de milhar ("1.234") e parte com vírgula decimal ("12,0")
+    simples = liberados.astype(str)
+    milhar = (liberados // 1000).astype(str) + '.' + np.char.zfill((liberados % 1000).astype(str), 3)
+    lib_texto = np.where(liberados >= 1000, milhar, simples)
+    lib_texto = np.where(rng.random(rows) < 0.1, simples + ',0', lib_texto)
+
+    return pd.DataFrame({
+        'Data': texto,
+        'Transportadora': rng.choice([f'Transportadora {i:02d}' for i in range(carriers)], rows),
+        'Operação': rng.choice(list(operations), rows),
+        'Liberados': lib_texto,
+        'Malha': malha.astype(str),
+    })
+
+
+def _timed(results, stage, func, *args, **kwargs):
+    started = time.perf_counter()
+    value = func(*args, **kwargs)
+    results[stage] = round(time.perf_counter() - started, 4)
+    return value
+
+
+def _figures(datasets, atual):
+    """Figuras equivalentes às do dashboard, a partir dos mesmos conjuntos de dados."""
+    return [
+        px.bar(datasets['transportadoras'], x='LIBERADOS', y='TRANSPORTADORA', orientation='h', text_auto=True),
+        px.bar(datasets['transportadoras'], x='MALHA', y='TRANSPORTADORA', orientation='h', text_auto=True),
+        px.funnel(views.funnel(atual), x='number', y='stage', color='stage'),
+        px.density_heatmap(datasets['heatmap'], x='Dia_Semana', y='TRANSPORTADORA', z='MALHA_PCT',
+                           category_orders={"Dia_Semana": views.ORDER_DAYS}),
+        px.bar(datasets['diario'], x='DATA', y='LIBERADOS', color='TRANSPORTADORA', barmode='group', text_auto=True),
+        px.bar(datasets['diario'], x='DATA', y='MALHA_PCT', color='TRANSPORTADORA'),
+        px.pie(datasets['operacoes'], names='OPERAÇÃO', values='LIBERADOS', hole=0.4),
+        px.pie(datasets['transportadoras'], names='TRANSPORTADORA', values='LIBERADOS', hole=0.4),
+        px.bar(datasets['mensal'], x='Mês_Ano', y='LIBERADOS', color='TRANSPORTADORA', barmode='group', text_auto=True),
+        px.bar(datasets['mensal'], x='Mês_Ano', y='MALHA_PCT', color='TRANSPORTADORA'),
+        px.bar(datasets['anual'], x='Ano', y='LIBERADOS', color='TRANSPORTADORA', barmode='group', text_auto=True),
+        px.bar(datasets['anual'], x='Ano', y='MALHA_PCT', color='TRANSPORTADORA'),
+    ]
+
+
+def run_pipeline(rows, export_formats=tuple(export.EXPORT_FORMATS), seed=42):
+    """Executa e cronometra todas as etapas para `rows` linhas. Retorna o registro do relatório."""
+    etapas = {}
+    raw = _timed(etapas, 'gerar', generate_rows, rows, seed=seed)
+    csv_bytes = raw.to_csv(sep=';', index=False).encode()
+
+    def load_csv():
+        file = io.BytesIO(csv_bytes)
+        return pd.read_csv(file, sep=ingest.sniff_delimiter(file), dtype=str)
+
+    df = _timed(etapas, 'ler_csv', load_csv)
+    df, linhas_invalidas = _timed(etapas, 'limpar', ingest.clean_frame, df)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = queries.create_database_engine(f"sqlite:///{os.path.join(tmp, 'benchmark.db')}")
+        queries.ensure_schema(engine)
+
+        def save():
+            with queries.begin_write(engine) as conn:
+                queries.append_rows(conn, df)
+            queries.ensure_schema(engine)
+
+        _timed(etapas, 'gravar_sqlite', save)
+
+        # O mesmo conteúdo enviado como .db (no formato que o dashboard grava), mesclado pelo
+        # SQLite em um banco novo (ver queries.merge_database)
+        upload_engine = queries.create_database_engine(f"sqlite:///{os.path.join(tmp, 'upload.db')}")
+        with upload_engine.begin() as conn:
+            df.to_sql(queries.TABLE_NAME, conn, index=False)
+        upload_engine.dispose()
+        merge_engine = queries.create_database_engine(f"sqlite:///{os.path.join(tmp, 'mesclado.db')}")
+        queries.ensure_schema(merge_engine)
+
+        def merge():
+            with queries.connect_write(merge_engine) as conn:
+                with conn.begin():
+                    queries.merge_database(conn, os.path.join(tmp, 'upload.db'))
+                queries.run_after_transaction(conn)
+            queries.ensure_schema(merge_engine)
+
+        _timed(etapas, 'mesclar_db', merge)
+        merge_engine.dispose()
+
+        min_date, max_date = queries.date_bounds(engine, queries.QueryFilters())
+        transportadoras = queries.distinct_values(engine, 'TRANSPORTADORA')
+        # Filtro típico: último ano, metade das transportadoras e uma operação
+        filters = queries.make_filters([max_date.year], None, None, ['LML'], transportadoras[::2])
+        _timed(etapas, 'filtrar_sql', queries.fetch_rows, engine, filters)
+        total_linhas = _timed(etapas, 'contar_linhas', queries.count_rows, engine, filters)
+        _timed(etapas, 'paginar_sql', queries.fetch_page, engine, filters, 'DATA', False, 0, 100, total_linhas)
+
+        def run(query_name, *args):
+            return getattr(queries, query_name)(engine, *args)
+
+        all_rows = queries.QueryFilters()
+        sums = _timed(etapas, 'somas_acumuladas', rangesums.DailyPrefixSums.load, engine)
+        atual, _, _ = _timed(etapas, 'agregar_kpis', views.kpis, sums.totals, all_rows, min_date, max_date)
+        window_start = max_date - pd.Timedelta(days=views.DAILY_WINDOW_DAYS - 1)
+        datasets = {
+            'transportadoras': _timed(etapas, 'agregar_transportadoras', views.carrier_totals, run, all_rows),
+            'operacoes': _timed(etapas, 'agregar_operacoes', views.operation_totals, run, all_rows),
+            'heatmap': _timed(etapas, 'agregar_heatmap', views.weekday_heatmap, run, all_rows),
+            'diario': _timed(etapas, 'agregar_diario', views.daily_totals, run,
+                             all_rows.replace(start_date=window_start, end_date=max_date)),
+            'mensal': _timed(etapas, 'agregar_mensal', views.monthly_totals, run, all_rows),
+            'anual': _timed(etapas, 'agregar_anual', views.yearly_totals, run, all_rows),
+        }
+        _timed(etapas, 'taxa_retencao', metrics.retention_rate, df['LIBERADOS'], df['MALHA'])
+
+        for fmt in export_formats:
+            _timed(etapas, f'exportar_{fmt}', export.export_report, engine, filters, fmt)
+
+        figures = _timed(etapas, 'montar_figuras', _figures, datasets, atual)
+        figuras_bytes = sum(len(fig.to_json()) for fig in figures)
+        engine.dispose()
+
+    return {'linhas': rows, 'linhas_invalidas': linhas_invalidas, 'figuras_bytes': figuras_bytes, 'etapas': etapas}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline do dashboard com dados sintéticos.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help="tamanhos a medir (padrão: 10k, 100k e 1M)")
+    parser.add_argument('--formats', nargs='*', default=list(export.EXPORT_FORMATS), choices=list(export.EXPORT_FORMATS),
+                        help="formatos de exportação a medir")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='benchmark.json', help="arquivo do relatório JSON")
+    args = parser.parse_args(argv)
+
+    report = {
+        'gerado_em': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'seed': args.seed,
+        'resultados': [],
+    }
+    for rows in args.rows:
+        resultado = run_pipeline(rows, args.formats, args.seed)
+        report['resultados'].append(resultado)
+        print(f"{rows:>10,} linhas: " + ", ".join(f"{k}={v:.3f}s" for k, v in resultado['etapas'].items()), file=sys.stderr)
+
+    with open(args.out, 'w', encoding='utf-8') as fp:
+        json.dump(report, fp, ensure_ascii=False, indent=2)
+    print(f"Relatório gravado em {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,736 +1,948 @@
-import streamlit as st
-import pandas as pd
-import plotly.express as px
-import io
-import os
-import tempfile
-from sqlalchemy import create_engine, inspect
-from pandas.api.types import is_datetime64_any_dtype
-
-# --- Configuração da Página ---
-st.set_page_config(page_title="Dashboard de Logística", page_icon="🚚", layout="wide")
-
-# --- 1. CARREGAMENTO E TRATAMENTO DE DADOS ---
-
-# CONFIGURAÇÃO DO BANCO DE DADOS
-DATABASE_URL = "sqlite:///dados.db"
-TABLE_NAME = 'performance_logistica'
-
-# @st.cache_resource: Otimização de performance.
-# Mantém a conexão com o banco aberta na memória para não reconectar a cada clique do usuário.
-@st.cache_resource
-def get_database_engine(url):
-    return create_engine(url)
-
-engine = get_database_engine(DATABASE_URL)
-
-# --- INICIALIZAÇÃO DOS DADOS NA MEMÓRIA (SESSION STATE) ---
-# O Session State é a "memória de curto prazo" do usuário.
-# Usamos isso para que os dados não sumam quando o usuário clica em um filtro.
-if 'df_dados' not in st.session_state:
-    try:
-        # Lê do banco local
-        df_start = pd.read_sql(f"SELECT * FROM {TABLE_NAME}", con=engine, parse_dates=['DATA'])
-        # Garante tipos corretos
-        df_start.columns = df_start.columns.str.strip().str.upper()
-        if 'DATA' in df_start.columns:
-            df_start['DATA'] = pd.to_datetime(df_start['DATA'])
-        st.session_state['df_dados'] = df_start
-    except Exception:
-        # Se der erro (ex: banco não existe), inicia vazio
-        st.session_state['df_dados'] = pd.DataFrame(columns=['DATA', 'TRANSPORTADORA', 'OPERAÇÃO', 'LIBERADOS', 'MALHA'])
-
-# Função para salvar dados carregados via Upload no banco de dados persistente
-def save_uploaded_data(df, replace=False):
-    try:
-        # Colunas esperadas
-        expected_cols = ['DATA', 'TRANSPORTADORA', 'OPERAÇÃO', 'LIBERADOS', 'MALHA']
-        # Filtra colunas existentes no DF carregado
-        cols_to_save = [c for c in expected_cols if c in df.columns]
-        
-        if cols_to_save:
-            if replace:
-                st.session_state['df_dados'] = df[cols_to_save].copy()
-            else:
-                st.session_state['df_dados'] = pd.concat([st.session_state['df_dados'], df[cols_to_save]], ignore_index=True)
-            
-            # Remove duplicatas exatas para evitar sujeira nos dados
-            st.session_state['df_dados'] = st.session_state['df_dados'].drop_duplicates()
-            
-            # Salva no banco físico também para persistir
-            st.session_state['df_dados'].to_sql(TABLE_NAME, engine, if_exists='replace', index=False)
-            st.sidebar.success(f"✅ Dados atualizados e salvos!")
-        else:
-            st.sidebar.error("❌ O arquivo não contém as colunas necessárias.")
-    except Exception as e:
-        st.sidebar.error(f"❌ Erro ao salvar: {e}")
-
-# Função CRÍTICA: Limpeza de dados. É aqui que corrigimos erros comuns de digitação e formatação.
-def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    """Realiza a limpeza e padronização dos dados."""
-    # Padronizar nomes das colunas
-    df.columns = df.columns.str.strip().str.upper()
-
-    if 'DATA' in df.columns:
-        # Só executa a limpeza pesada se NÃO for data ainda
-        if not is_datetime64_any_dtype(df['DATA']):
-            # 1. Converter para string e limpar espaços
-            df['DATA'] = df['DATA'].astype(str).str.strip()
-            
-            # 2. Corrigir erro comum 31/09
-            df['DATA'] = df['DATA'].str.replace('31/09', '30/09', regex=False)
-            
-            # 3. Tentar converter formato padrão (Dia/Mês/Ano)
-            # errors='coerce' transforma o que falhar em NaT (Not a Time)
-            dates_iso = pd.to_datetime(df['DATA'], dayfirst=True, errors='coerce')
-            
-            # 4. Recuperar datas que falharam (NaT) tentando ler como Serial Excel (números)
-            # Isso recupera as linhas que o Excel salvou como número (ex: 45321)
-            mask_nat = dates_iso.isna()
-            if mask_nat.any():
-                try:
-                    # Tenta converter strings numéricas para float e depois para data (Excel base 1899-12-30)
-                    numeric_dates = pd.to_numeric(df.loc[mask_nat, 'DATA'], errors='coerce')
-                    recovered = pd.to_datetime(numeric_dates, unit='D', origin='1899-12-30')
-                    dates_iso = dates_iso.fillna(recovered)
-                except:
-                    pass
-            
-            df['DATA'] = dates_iso
-            
-            # Verifica e remove linhas que continuam inválidas
-            linhas_invalidas = df['DATA'].isna().sum()
-            if linhas_invalidas > 0:
-                st.warning(f"⚠️ Atenção: {linhas_invalidas} linhas foram removidas pois a coluna 'DATA' contém valores inválidos ou vazios.")
-                df = df.dropna(subset=['DATA'])
-
-    # Garantir numéricos
-    for col in ['LIBERADOS', 'MALHA']:
-        if col in df.columns:
-            if df[col].dtype == 'object':
-                df[col] = df[col].astype(str).str.replace('.', '', regex=False).str.replace(',', '.')
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-    
-    return df
-
-# Função robusta para ler diferentes tipos de arquivo (CSV, Excel, SQLite)
-def load_data(uploaded_file=None):
-    df = None
-    # 1. Tenta carregar do upload
-    if uploaded_file is not None:
-        try:
-            if uploaded_file.name.endswith('.csv'):
-                # Lógica robusta para CSV (ponto e vírgula ou vírgula)
-                # Tenta ler com ';', se falhar (poucas colunas), tenta com ','
-                try:
-                    df = pd.read_csv(uploaded_file, sep=';')
-                    if df.shape[1] < 2:
-                        uploaded_file.seek(0)
-                        df = pd.read_csv(uploaded_file, sep=',')
-                except:
-                    uploaded_file.seek(0)
-                    df = pd.read_csv(uploaded_file, sep=None, engine='python')
-            elif uploaded_file.name.endswith('.db'):
-                with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp:
-                    tmp.write(uploaded_file.getvalue())
-                    tmp_path = tmp.name
-                
-                try:
-                    temp_engine = create_engine(f"sqlite:///{tmp_path}")
-                    inspector = inspect(temp_engine)
-                    tables = inspector.get_table_names()
-                    # Remove tabelas internas do SQLite se existirem
-                    tables = [t for t in tables if t != 'sqlite_sequence']
-                    
-                    if tables:
-                        # Tenta achar a tabela pelo nome (ignorando maiúsculas/minúsculas) ou pega a primeira
-                        target_table = next((t for t in tables if t.lower() == TABLE_NAME.lower()), tables[0])
-                        
-                        # Identifica colunas de data para leitura correta (igual ao carregamento local)
-                        columns_info = inspector.get_columns(target_table)
-                        date_cols = [c['name'] for c in columns_info if c['name'].upper() == 'DATA']
-                        
-                        df = pd.read_sql(f"SELECT * FROM '{target_table}'", con=temp_engine, parse_dates=date_cols)
-                    else:
-                        st.error("O arquivo .db não contém tabelas de dados válidas.")
-                    temp_engine.dispose()
-                except Exception as e:
-                    st.error(f"Erro ao ler o arquivo .db: {e}")
-                finally:
-                    if os.path.exists(tmp_path):
-                        os.remove(tmp_path)
-            else:
-                df = pd.read_excel(uploaded_file)
-        except Exception as e:
-            st.error(f"Erro ao ler o arquivo: {e}")
-            return None
-    # 2. Carrega da Memória (Session State)
-    else:
-        if 'df_dados' in st.session_state:
-            df = st.session_state['df_dados'].copy()
-
-    if df is not None:
-        df = clean_dataframe(df)
-
-    return df
-
-# --- FUNÇÕES AUXILIARES DE CÁLCULO ---
-def calculate_retention_rate(row):
-    """Calcula a taxa de retenção: (Malha / Total Geral) * 100."""
-    total = row['LIBERADOS'] + row['MALHA']
-    if total == 0: return 0.0
-    return round((row['MALHA'] / total) * 100, 2)
-
-# --- NOVA FUNÇÃO: EXPORTAR PARA EXCEL ---
-@st.cache_data
-def convert_df_to_excel(df):
-    """Converte o DataFrame filtrado para um arquivo Excel em memória."""
-    output = io.BytesIO()
-    # Engine 'openpyxl' é necessária para escrever .xlsx
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Relatorio')
-    return output.getvalue()
-
-# --- 2. BARRA LATERAL (UPLOAD E FILTROS) ---
-
-# Tenta carregar logo localmente
-script_dir = os.path.dirname(os.path.abspath(__file__))
-files_in_dir = os.listdir(script_dir)
-possible_logos = ["logo.png", "logo.jpg", "logo.jpeg"]
-found_logo = next((f for f in files_in_dir if f.lower() in possible_logos), None)
-local_logo = os.path.join(script_dir, found_logo) if found_logo else None
-
-logo_image = None
-if local_logo:
-    logo_image = local_logo
-    st.sidebar.image(local_logo)
-else:
-    # Fallback para o GIF se não tiver logo local
-    st.sidebar.image("https://media3.giphy.com/media/v1.Y2lkPTc5MGI3NjExNzVseGVsdWtocmNidGU3MDZtYzdmcm1kMzMxM3VhZGJjYzJuNGZiMSZlcD12MV9pbnRlcm5hbF9naWZfYnlfaWQmY3Q9cw/hR12JVvN9GftOzxqGd/giphy.gif", width=150)
-
-# --- SISTEMA DE LOGIN (BARRA LATERAL) ---
-# Controla se o usuário pode editar dados ou apenas visualizar
-if 'logged_in' not in st.session_state:
-    st.session_state['logged_in'] = False
-
-def check_login():
-    if st.session_state['logged_in']:
-        if st.sidebar.button("🔓 Sair (Logout)"):
-            st.session_state['logged_in'] = False
-            st.rerun()
-        return True
-    
-    st.sidebar.markdown("### 🔒 Acesso Restrito")
-    senha = st.sidebar.text_input("Senha de Admin", type="password")
-    if st.sidebar.button("Entrar"):
-        if senha == "admin123":  # Defina sua senha aqui
-            st.session_state['logged_in'] = True
-            st.rerun()
-        else:
-            st.sidebar.error("Senha incorreta.")
-    return False
-
-acesso_liberado = check_login()
-
-uploaded_file = None
-
-if acesso_liberado:
-    st.sidebar.header("Importar Dados")
-    uploaded_file = st.sidebar.file_uploader("Carregar arquivo (CSV, Excel ou DB)", type=['csv', 'xlsx', 'db'])
-
-    # --- FORMULÁRIO DE INSERÇÃO ---
-    st.sidebar.markdown("---")
-    st.sidebar.header("Inserir Dados Manualmente")
-    with st.sidebar.form("form_insercao", clear_on_submit=True):
-        f_data = st.date_input("Data", format="DD/MM/YYYY")
-        f_transp = st.text_input("Transportadora")
-        f_op = st.selectbox("Operação", ["LML", "Direta", "Reversa", "Outros"])
-        f_lib = st.number_input("Liberados (Vol)", min_value=0, step=1)
-        f_malha = st.number_input("Malha (Qtd)", min_value=0, step=1)
-        
-        btn_salvar = st.form_submit_button("Salvar Registro")
-        
-        if btn_salvar:
-            if not f_transp:
-                st.sidebar.warning("⚠️ O campo 'Transportadora' é obrigatório.")
-            else:
-                new_row = {'DATA': [pd.to_datetime(f_data)], 'TRANSPORTADORA': [f_transp], 'LIBERADOS': [f_lib], 'MALHA': [f_malha], 'OPERAÇÃO': [f_op]}
-                df_new = pd.DataFrame(new_row)
-                
-                try:
-                    # Salva no banco de dados
-                    df_new.to_sql(TABLE_NAME, engine, if_exists='append', index=False)
-                    # Atualiza session state
-                    st.session_state['df_dados'] = pd.concat([st.session_state['df_dados'], df_new], ignore_index=True)
-                    st.success("Salvo no Banco de Dados com sucesso!")
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Erro ao salvar no banco: {e}")
-
-df = load_data(uploaded_file)
-
-if df is None or df.empty:
-    st.info("O banco de dados está vazio. Utilize o menu lateral para carregar um arquivo ou inserir dados manualmente.")
-    st.stop()
-
-if acesso_liberado:
-    # Botão para salvar dados importados no banco (aparece apenas se houver upload)
-    if uploaded_file is not None:
-        replace_data = st.sidebar.checkbox("Substituir todo o banco de dados", help="Marque para apagar o banco atual e criar um novo com este arquivo.")
-        if st.sidebar.button("💾 Converter/Salvar em dados.db"):
-            save_uploaded_data(df, replace=replace_data)
-
-    # Botão para baixar o banco de dados atualizado
-    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp:
-        temp_engine = create_engine(f"sqlite:///{tmp.name}")
-        st.session_state['df_dados'].to_sql(TABLE_NAME, temp_engine, if_exists='replace', index=False)
-        
-        with open(tmp.name, "rb") as fp:
-            st.sidebar.download_button(
-                label="📥 Baixar dados.db (Backup)",
-                data=fp,
-                file_name="dados.db",
-                mime="application/x-sqlite3"
-            )
-
-    st.sidebar.header("Filtros")
-
-    # Filtro de Ano
-    anos_disponiveis = sorted(df['DATA'].dt.year.unique(), reverse=True)
-    anos_selecionados = st.sidebar.multiselect(
-        "Ano",
-        options=anos_disponiveis,
-        default=anos_disponiveis
-    )
-
-    # Filtro de Data
-    min_date = df['DATA'].min()
-    max_date = df['DATA'].max()
-    start_date, end_date = st.sidebar.date_input(
-        "Selecione o Período",
-        [min_date, max_date],
-        min_value=min_date,
-        max_value=max_date,
-        format="DD/MM/YYYY"
-    )
-
-    # Filtro de Operação
-    operacoes = st.sidebar.multiselect(
-        "Tipo de Operação",
-        options=df['OPERAÇÃO'].unique(),
-        default=df['OPERAÇÃO'].unique()
-    )
-
-    # Filtro de Transportadora
-    transportadoras = st.sidebar.multiselect(
-        "Transportadora",
-        options=df['TRANSPORTADORA'].unique(),
-        default=df['TRANSPORTADORA'].unique()
-    )
-
-    # Botão para recarregar dados (Limpar Cache)
-    if st.sidebar.button("🔄 Atualizar Dados (DB)"):
-        del st.session_state['df_dados']
-        st.rerun()
-
-    st.sidebar.markdown("---")
-    st.sidebar.markdown("Desenvolvido por **Clayton S. Silva**")
-
-else:
-    # --- MODO LEITURA (SEM LOGIN) ---
-    # Define filtros padrão para que o dashboard funcione
-    min_date = df['DATA'].min()
-    max_date = df['DATA'].max()
-    start_date, end_date = min_date, max_date
-    operacoes = df['OPERAÇÃO'].unique()
-    transportadoras = df['TRANSPORTADORA'].unique()
-    anos_selecionados = df['DATA'].dt.year.unique()
-    
-    st.sidebar.info("ℹ️ Faça login para acessar filtros e ferramentas de edição.")
-
-# --- APLICAÇÃO DOS FILTROS ---
-# Aplicar Filtros
-df_filtered = df[
-    (df['DATA'].dt.year.isin(anos_selecionados)) &
-    (df['DATA'] >= pd.to_datetime(start_date)) &
-    (df['DATA'] <= pd.to_datetime(end_date)) &
-    (df['OPERAÇÃO'].isin(operacoes)) &
-    (df['TRANSPORTADORA'].isin(transportadoras))
-].copy()
-
-# Criar colunas de período
-df_filtered['Mês_Ano'] = df_filtered['DATA'].dt.strftime('%Y-%m')
-df_filtered['Ano'] = df_filtered['DATA'].dt.strftime('%Y')
-
-# --- CONSTRUÇÃO DE TEXTOS DINÂMICOS (PARA TÍTULOS) ---
-if not df_filtered.empty:
-    periodo_label = f"{pd.to_datetime(start_date).strftime('%d/%m/%Y')} a {pd.to_datetime(end_date).strftime('%d/%m/%Y')}"
-    anos_label = ", ".join(map(str, sorted(df_filtered['DATA'].dt.year.unique())))
-else:
-    periodo_label = "Sem dados"
-    anos_label = "-"
-
-# --- NOVA FUNCIONALIDADE: BOTÃO DE DOWNLOAD DO RELATÓRIO FILTRADO ---
-if acesso_liberado and not df_filtered.empty:
-    st.sidebar.markdown("---")
-    st.sidebar.header("📥 Exportar Relatório")
-    excel_data = convert_df_to_excel(df_filtered)
-    st.sidebar.download_button(
-        label="Baixar Dados Filtrados (.xlsx)",
-        data=excel_data,
-        file_name="relatorio_logistica_filtrado.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-
-# --- 3. DASHBOARD PRINCIPAL ---
-if logo_image:
-    st.image(logo_image, width=200)
-
-# --- ANIMAÇÃO CAMINHÃO ---
-st.markdown("""
-<style>
-@keyframes drive {
-    0% { margin-left: 100%; }
-    100% { margin-left: -100px; }
-}
-.truck-anim {
-    font-size: 40px;
-    animation: drive 15s linear infinite;
-}
-</style>
-<div style="width: 100%; overflow: hidden;">
-    <div class="truck-anim">🚚</div>
-</div>
-""", unsafe_allow_html=True)    
-
-st.title(f"📊 Dashboard Controle de Malha Fina e Liberados ({anos_label})")
-st.markdown(f"##### 🗓️ Período de Análise: {periodo_label}")
-
-
-
-# --- CONTEXTO DO PROCESSO (NOVO) ---
-with st.expander("ℹ️ Entenda o Processo de Malha Fina (Auditoria)"):
-    st.markdown("""
-    **Fluxo Operacional Padrão:**
-    
-    1.   **Carregamento:** A transportadora realiza o carregamento dos produtos e o veículo se dirige à **Portaria de Saída**.
-    2.  🎲 **Sorteio Aleatório:** Na portaria, é realizado um sorteio individual para cada veículo.
-    3.  🚦 **Resultado:**
-        *   🟢 **Liberado:** O veículo segue viagem normalmente.
-        *   🔴 **Malha (Retenção):** O veículo deve retornar ao **Setor de Retorno** para uma **Nova Conferência**.
-    4.  📋 **Conclusão:** Após a reconferência, se não houver divergências, o veículo é liberado. Caso contrário, a divergência é relatada.
-    """)
-
-# --- CÁLCULO DE KPIS E DELTAS (COMPARATIVO) ---
-# Período Atual
-total_liberados = df_filtered['LIBERADOS'].sum()
-total_malha = df_filtered['MALHA'].sum()
-total_veiculos = total_liberados + total_malha
-taxa_malha_global = (total_malha / total_veiculos * 100) if total_veiculos > 0 else 0
-
-# Período Anterior (para cálculo do Delta)
-periodo_dias = (pd.to_datetime(end_date) - pd.to_datetime(start_date)).days + 1
-data_inicio_prev = pd.to_datetime(start_date) - pd.Timedelta(days=periodo_dias)
-data_fim_prev = pd.to_datetime(start_date) - pd.Timedelta(days=1)
-
-df_prev = df[
-    (df['DATA'] >= data_inicio_prev) &
-    (df['DATA'] <= data_fim_prev) &
-    (df['OPERAÇÃO'].isin(operacoes)) &
-    (df['TRANSPORTADORA'].isin(transportadoras))
-]
-
-total_veiculos_prev = df_prev['LIBERADOS'].sum() + df_prev['MALHA'].sum()
-total_liberados_prev = df_prev['LIBERADOS'].sum()
-total_malha_prev = df_prev['MALHA'].sum()
-taxa_malha_prev = (total_malha_prev / total_veiculos_prev * 100) if total_veiculos_prev > 0 else 0
-
-col1, col2, col3, col4 = st.columns(4)
-col1.metric("Fluxo Total (Veículos)", f"{total_veiculos:,.0f}", f"{total_veiculos - total_veiculos_prev:,.0f} vs período anterior")
-col2.metric("Veículos Liberados", f"{total_liberados:,.0f}", f"{total_liberados - total_liberados_prev:,.0f} vs período anterior")
-col3.metric("Retidos em Malha", f"{total_malha:,.0f}", f"{total_malha - total_malha_prev:,.0f} vs período anterior", delta_color="inverse")
-col4.metric("Taxa de Retenção Global", f"{taxa_malha_global:.2f}%", f"{taxa_malha_global - taxa_malha_prev:.2f} p.p.", delta_color="inverse")
-
-st.markdown("---")
-
-st.subheader("🏆 Rankings")
-col_r1, col_r2 = st.columns(2)
-
-with col_r1:
-    top_vol = df_filtered.groupby('TRANSPORTADORA')['LIBERADOS'].sum().reset_index().sort_values(by='LIBERADOS', ascending=True)
-    fig_top_vol = px.bar(top_vol, x='LIBERADOS', y='TRANSPORTADORA', orientation='h', text_auto=True, title=f"Ranking de Fluxo ({periodo_label})", color='LIBERADOS', color_continuous_scale='Teal')
-    fig_top_vol.update_traces(textfont_size=14)
-    fig_top_vol.update_layout(template="plotly_white", xaxis_title="Volume Liberado", yaxis_title=None, showlegend=False)
-    st.plotly_chart(fig_top_vol, key="rank_vol", width="stretch")
-    st.caption("📝 **Fluxo:** Volume total de veículos que saíram liberados (sem auditoria).")
-
-with col_r2:
-    top_malha = df_filtered.groupby('TRANSPORTADORA')['MALHA'].sum().reset_index().sort_values(by='MALHA', ascending=True)
-    fig_top_malha = px.bar(top_malha, x='MALHA', y='TRANSPORTADORA', orientation='h', text_auto=True, title=f"Ranking de Retenção ({periodo_label})", color='MALHA', color_continuous_scale='Reds')
-    fig_top_malha.update_traces(textfont_size=14)
-    fig_top_malha.update_layout(template="plotly_white", xaxis_title="Qtd. Veículos Retidos", yaxis_title=None, showlegend=False)
-    st.plotly_chart(fig_top_malha, key="rank_malha", width="stretch")
-    st.caption("📝 **Retenção:** Quantidade absoluta de veículos parados para auditoria (Malha Fina).")
-
-with st.expander("💡 Guia Rápido: Como ler os Rankings?"):
-    st.markdown("""
-    *   **Ranking de Fluxo:** Mostra quem opera mais. Útil para dimensionar recursos de pátio e conferentes.
-    *   **Ranking de Retenção:** Mostra quem mais cai na malha em **números absolutos**. 
-        *   ⚠️ *Atenção:* Uma transportadora pode estar no topo aqui apenas porque tem muito volume. Para ver quem tem a *pior performance relativa* (quem "falha" mais proporcionalmente), consulte os gráficos de **Taxa de Retenção (%)** nas abas abaixo.
-    """)
-
-# Abas para análises
-tab_geral, tab_dia, tab_mes, tab_ano = st.tabs(["🔍 Visão Geral & Risco", "📅 Visão Diária", "📆 Visão Mensal", "📅 Visão Anual"])
-
-with tab_geral:
-    st.subheader("Visão Geral Integrada")
-    
-    # --- NOVO GRÁFICO: FUNIL DO PROCESSO ---
-    # Mostra visualmente o "Sorteio"
-    col_funnel, col_heatmap = st.columns(2)
-    
-    with col_funnel:
-        st.markdown("##### 🎲 Fluxo do Sorteio (Funil)")
-        data_funnel = dict(
-            number=[total_veiculos, total_liberados, total_malha],
-            stage=["Veículos na Portaria", "🟢 Liberados (Viagem)", "🔴 Retidos (Malha Fina)"]
-        )
-        fig_funnel = px.funnel(data_funnel, x='number', y='stage', color='stage', 
-                               color_discrete_map={"Veículos na Portaria": "#2E86C1", "🟢 Liberados (Viagem)": "#27AE60", "🔴 Retidos (Malha Fina)": "#C0392B"})
-        fig_funnel.update_layout(showlegend=False, template="plotly_white")
-        st.plotly_chart(fig_funnel, width="stretch")
-
-    with col_heatmap:
-        st.markdown("##### 🔥 Mapa de Calor: Risco por Dia da Semana")
-        # Prepara dados para heatmap: Dia da Semana x Transportadora
-        df_heat = df_filtered.copy()
-        df_heat['Dia_Semana'] = df_heat['DATA'].dt.day_name()
-        # Traduzir dias se necessário, ou usar ordem
-        order_days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        df_heat_group = df_heat.groupby(['Dia_Semana', 'TRANSPORTADORA'])[['LIBERADOS', 'MALHA']].sum().reset_index()
-        
-        # Calcula % usando a função auxiliar
-        df_heat_group['MALHA_PCT'] = df_heat_group.apply(calculate_retention_rate, axis=1)
-        
-        fig_heat = px.density_heatmap(df_heat_group, x='Dia_Semana', y='TRANSPORTADORA', z='MALHA_PCT', 
-                                      category_orders={"Dia_Semana": order_days},
-                                      color_continuous_scale='Reds', title="Intensidade de Retenção (%)")
-        fig_heat.update_layout(template="plotly_white")
-        st.plotly_chart(fig_heat, width="stretch")
-
-    with st.expander("💡 Análise de Risco e Fluxo (Como interpretar?)"):
-        st.markdown("""
-        *   **Fluxo do Sorteio (Funil):** Mostra a proporção de veículos que seguem viagem direta vs. aqueles desviados para o **Setor de Retorno**. Uma base vermelha larga indica gargalo na reconferência.
-        *   **Mapa de Calor (Heatmap):** Identifica dias críticos na operação.
-            *   🔥 **Cor Intensa:** Indica que, naquele dia da semana, a transportadora tem alta incidência de ida para Malha.
-            *   🕵️ **Ação:** Investigar se há padrões viciados (ex: toda sexta-feira a taxa sobe) ou problemas específicos na expedição.
-        """)
-
-    st.markdown("---")
-    
-    # Filtro de Data Específico para a Visão Geral (Padrão: Últimos 5 dias)
-    df_geral_view = df_filtered.copy()
-    periodo_g_label = periodo_label # Default
-    if not df_filtered.empty:
-        max_date_g = df_filtered['DATA'].max()
-        min_date_g = df_filtered['DATA'].min()
-        # Define padrão: últimos 5 dias
-        default_start = max_date_g - pd.Timedelta(days=4)
-        if default_start < min_date_g: default_start = min_date_g
-        
-        dates_g = st.date_input(
-            "📅 Filtrar Período (Gráficos Diários)",
-            value=[default_start, max_date_g],
-            min_value=min_date_g,
-            max_value=max_date_g,
-            key="filter_geral_dates"
-        )
-        
-        if len(dates_g) == 2:
-            df_geral_view = df_filtered[(df_filtered['DATA'] >= pd.to_datetime(dates_g[0])) & (df_filtered['DATA'] <= pd.to_datetime(dates_g[1]))]
-            periodo_g_label = f"{pd.to_datetime(dates_g[0]).strftime('%d/%m')} a {pd.to_datetime(dates_g[1]).strftime('%d/%m')}"
-
-    col_g1, col_g2 = st.columns(2)
-    with col_g1:
-        fig_vol_dia_g = px.bar(df_geral_view, x='DATA', y='LIBERADOS', color='TRANSPORTADORA', barmode='group', title=f"Fluxo de Saída por Dia ({periodo_g_label})", text_auto=True)
-        fig_vol_dia_g.update_xaxes(tickformat="%d/%m/%Y")
-        fig_vol_dia_g.update_traces(textfont_size=14)
-        fig_vol_dia_g.update_layout(template="plotly_white", xaxis_title="Data", yaxis_title="Volume")
-        st.plotly_chart(fig_vol_dia_g, key="geral_vol_dia", width="stretch")
-        st.caption("📊 **Volume Operacional:** Quantidade de veículos liberados dia a dia.")
-    with col_g2:
-        df_dia_malha_g = df_geral_view.groupby(['DATA', 'TRANSPORTADORA'])[['LIBERADOS', 'MALHA']].sum().reset_index()
-        # Cálculo da Taxa de Retenção (%) usando função auxiliar
-        df_dia_malha_g['MALHA_PCT'] = df_dia_malha_g.apply(calculate_retention_rate, axis=1)
-        
-        fig_malha_dia_g = px.bar(df_dia_malha_g, x='DATA', y='MALHA_PCT', color='TRANSPORTADORA', title=f"Taxa de Retenção % por Dia ({periodo_g_label})")
-        fig_malha_dia_g.update_xaxes(tickformat="%d/%m/%Y")
-        fig_malha_dia_g.update_traces(texttemplate='%{y:.2f}%', textposition='auto', textfont_size=14)
-        fig_malha_dia_g.update_layout(template="plotly_white", xaxis_title="Data", yaxis_title="Retenção (%)")
-        st.plotly_chart(fig_malha_dia_g, key="geral_malha_dia", width="stretch")
-        st.caption("🛡️ **Intensidade da Fiscalização:** Porcentagem de veículos auditados em relação ao total de saídas.")
-    
-    with st.expander("💡 Análise de Tendência Diária (O que observar?)"):
-        st.markdown("""
-        *   📊 **Fluxo de Saída (Volume):** Acompanhe a quantidade de veículos processados na portaria. Quedas podem indicar falta de carga ou problemas sistêmicos.
-        *   🛡️ **Taxa de Retenção (%):** Monitora a severidade do sorteio.
-            *   📈 **Picos:** Indicam que muitos veículos foram enviados para reconferência naquele dia, o que pode gerar atrasos e filas no retorno.
-            *   📉 **Zeros:** Dias com 0% de malha sugerem falha no sistema de sorteio (todos passaram direto).
-        """)
-
-    st.markdown("---")
-    st.subheader("Distribuição Operacional")
-    col_g3, col_g4 = st.columns(2)
-    with col_g3:
-        fig_pie_op = px.pie(df_filtered, names='OPERAÇÃO', values='LIBERADOS', title=f"Volume por Operação ({periodo_label})", hole=0.4)
-        fig_pie_op.update_traces(textinfo='percent+label')
-        st.plotly_chart(fig_pie_op, key="pie_op", width="stretch")
-    with col_g4:
-        fig_pie_transp = px.pie(df_filtered, names='TRANSPORTADORA', values='LIBERADOS', title=f"Share de Volume ({periodo_label})", hole=0.4)
-        fig_pie_transp.update_traces(textinfo='percent+label', textposition='inside')
-        st.plotly_chart(fig_pie_transp, key="pie_transp", width="stretch")
-    
-    with st.expander("💡 Análise de Distribuição"):
-        st.markdown("""
-        *   **Por Operação:** Verifica se o esforço de fiscalização está proporcional ao volume de cada tipo de operação (LML, Direta, etc.).
-        *   **Share de Transportadora:** Mostra a representatividade de cada empresa. Transportadoras com maior fatia do gráfico devem ter atenção redobrada, pois qualquer desvio impacta muito o resultado global da unidade.
-        """)
-
-with tab_dia:
-    st.subheader("Análise Diária")
-    st.markdown("ℹ️ *Esta visão permite isolar dias específicos para entender o que aconteceu em datas com anomalias identificadas na Visão Geral.*")
-    
-    # Filtro Independente
-    modo_filtro = st.radio("Modo de Visualização:", ["Semana Atual (Automático)", "Selecionar Dia Específico (Independente)"], horizontal=True)
-    dia_label = ""
-    
-    if "Independente" in modo_filtro:
-        # Cria um dataframe base ignorando o filtro de data global, mas mantendo filtros de categoria
-        df_base_indep = df[
-            (df['OPERAÇÃO'].isin(operacoes)) &
-            (df['TRANSPORTADORA'].isin(transportadoras))
-        ].copy()
-        
-        if not df_base_indep.empty:
-            datas_disponiveis = sorted(df_base_indep['DATA'].dt.date.unique())
-            data_selecionada = st.date_input(
-                "Selecione a Data:", 
-                value=datas_disponiveis[-1], 
-                min_value=min(datas_disponiveis), 
-                max_value=max(datas_disponiveis)
-            )
-            df_dia_view = df_base_indep[df_base_indep['DATA'].dt.date == data_selecionada]
-            dia_label = data_selecionada.strftime('%d/%m/%Y')
-        else:
-            df_dia_view = pd.DataFrame()
-            st.warning("Não há dados disponíveis para os filtros de Operação/Transportadora selecionados.")
-    else:
-        # Lógica original (Semana Atual baseada no filtro global)
-        df_dia_view = df_filtered.copy()
-        if not df_dia_view.empty:
-            max_date = df_dia_view['DATA'].max()
-            start_of_week = max_date - pd.Timedelta(days=max_date.weekday())
-            df_dia_view = df_dia_view[df_dia_view['DATA'] >= start_of_week]
-            dia_label = f"Semana de {start_of_week.strftime('%d/%m')} a {max_date.strftime('%d/%m')}"
-
-    col_d1, col_d2 = st.columns(2)
-    with col_d1:
-        fig_vol_dia = px.bar(df_dia_view, x='DATA', y='LIBERADOS', color='TRANSPORTADORA', barmode='group', title=f"Fluxo de Saída ({dia_label})", text_auto=True)
-        fig_vol_dia.update_xaxes(tickformat="%d/%m/%Y")
-        fig_vol_dia.update_traces(textfont_size=14)
-        fig_vol_dia.update_layout(template="plotly_white", xaxis_title="Data", yaxis_title="Volume")
-        st.plotly_chart(fig_vol_dia, key="dia_vol", width="stretch")
-        st.caption("📊 **Volume:** Quantidade de veículos liberados por dia.")
-    with col_d2:
-        df_dia_malha = df_dia_view.groupby(['DATA', 'TRANSPORTADORA'])[['LIBERADOS', 'MALHA']].sum().reset_index()
-        # Cálculo da Taxa de Retenção (%) usando função auxiliar
-        df_dia_malha['MALHA_PCT'] = df_dia_malha.apply(calculate_retention_rate, axis=1)
-        
-        fig_malha_dia = px.bar(df_dia_malha, x='DATA', y='MALHA_PCT', color='TRANSPORTADORA', title=f"Taxa de Retenção % ({dia_label})")
-        fig_malha_dia.update_xaxes(tickformat="%d/%m/%Y")
-        fig_malha_dia.update_traces(texttemplate='%{y:.2f}%', textposition='auto', textfont_size=14)
-        fig_malha_dia.update_layout(template="plotly_white", xaxis_title="Data", yaxis_title="Retenção (%)")
-        st.plotly_chart(fig_malha_dia, key="dia_malha", width="stretch")
-        st.caption("🛡️ **Auditoria:** % de veículos retidos sobre o total.")
-
-with tab_mes:
-    st.subheader("Análise Mensal")
-    st.markdown("ℹ️ *Utilize esta visão para identificar sazonalidade (meses de pico) e se a performance das transportadoras está sendo Liberada ou seguindo a malha ao longo do ano.*")
-    
-    # Filtro de Meses
-    meses_disponiveis = sorted(df_filtered['Mês_Ano'].unique())
-    # Define padrão como os últimos 3 meses
-    padrao_meses = meses_disponiveis[-3:] if len(meses_disponiveis) >= 3 else meses_disponiveis
-    meses_selecionados = st.multiselect("Selecione os Meses para Visualizar:", options=meses_disponiveis, default=padrao_meses)
-    
-    if meses_selecionados:
-        df_mes_filtered = df_filtered[df_filtered['Mês_Ano'].isin(meses_selecionados)]
-    else:
-        df_mes_filtered = df_filtered
-        
-    df_mes = df_mes_filtered.groupby(['Mês_Ano', 'TRANSPORTADORA'])[['LIBERADOS', 'MALHA']].sum().reset_index()
-    col_m1, col_m2 = st.columns(2)
-    with col_m1:
-        fig_vol_mes = px.bar(df_mes, x='Mês_Ano', y='LIBERADOS', color='TRANSPORTADORA', barmode='group', title=f"Fluxo de Saída por Mês ({anos_label})", text_auto=True)
-        fig_vol_mes.update_traces(textfont_size=14)
-        fig_vol_mes.update_layout(template="plotly_white", xaxis_title="Mês", yaxis_title="Volume")
-        st.plotly_chart(fig_vol_mes, key="mes_vol", width="stretch")
-        st.caption("📊 **Sazonalidade:** Volume acumulado de liberados por mês.")
-    with col_m2:
-        # Cálculo da Taxa de Retenção (%) usando função auxiliar
-        df_mes['MALHA_PCT'] = df_mes.apply(calculate_retention_rate, axis=1)
-        
-        fig_malha_mes = px.bar(df_mes, x='Mês_Ano', y='MALHA_PCT', color='TRANSPORTADORA', title=f"Taxa de Retenção % por Mês ({anos_label})")
-        fig_malha_mes.update_traces(texttemplate='%{y:.2f}%', textposition='auto', textfont_size=14)
-        fig_malha_mes.update_layout(template="plotly_white", xaxis_title="Mês", yaxis_title="Retenção (%)")
-        st.plotly_chart(fig_malha_mes, key="mes_malha", width="stretch")
-        st.caption("🛡️ **Tendência:** Variação mensal da taxa de retenção na malha fina.")
-
-with tab_ano:
-    st.subheader("Análise Anual")
-    st.markdown("ℹ️ *Visão consolidada para relatórios gerenciais de longo prazo.*")
-    df_ano = df_filtered.groupby(['Ano', 'TRANSPORTADORA'])[['LIBERADOS', 'MALHA']].sum().reset_index()
-    col_a1, col_a2 = st.columns(2)
-    with col_a1:
-        fig_vol_ano = px.bar(df_ano, x='Ano', y='LIBERADOS', color='TRANSPORTADORA', barmode='group', title=f"Fluxo de Saída por Ano ({anos_label})", text_auto=True)
-        fig_vol_ano.update_traces(textfont_size=14)
-        fig_vol_ano.update_layout(template="plotly_white", xaxis_title="Ano", yaxis_title="Volume")
-        st.plotly_chart(fig_vol_ano, key="ano_vol", width="stretch")
-        st.caption("📊 **Histórico:** Volume total de liberados por ano.")
-    with col_a2:
-        # Cálculo da Taxa de Retenção (%) usando função auxiliar
-        df_ano['MALHA_PCT'] = df_ano.apply(calculate_retention_rate, axis=1)
-        
-        fig_malha_ano = px.bar(df_ano, x='Ano', y='MALHA_PCT', color='TRANSPORTADORA', title=f"Taxa de Retenção % por Ano ({anos_label})")
-        fig_malha_ano.update_traces(texttemplate='%{y:.2f}%', textposition='auto', textfont_size=14)
-        fig_malha_ano.update_layout(template="plotly_white", xaxis_title="Ano", yaxis_title="Retenção (%)")
-        st.plotly_chart(fig_malha_ano, key="ano_malha", width="stretch")
-        st.caption("🛡️ **Consolidado:** Taxa média anual de retenção para auditoria.")
-
-# --- 4. TABELA DE DADOS ---
-with st.expander("Ver Dados Detalhados"):
-    # Prepara dataframe para exibição com cálculos idênticos ao Excel
-    df_display = df_filtered.copy()
-    df_display['TOTAL GERAL'] = df_display['LIBERADOS'] + df_display['MALHA']
-    
-    # Aplica a lógica de arredondamento usando a função auxiliar
-    df_display['% MALHA'] = df_display.apply(calculate_retention_rate, axis=1)
-
-    st.data_editor(
-        df_display.sort_values(by=['DATA', 'TRANSPORTADORA']),
-        width="stretch",
-        disabled=True, # Apenas leitura por enquanto, mas com UX de planilha
-        column_config={
-            "DATA": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
-            "% MALHA": st.column_config.NumberColumn("% Malha", format="%.2f%%"),
-            "TOTAL GERAL": st.column_config.NumberColumn("Total Geral", format="%d")
-        }
-    )
-
-# Assinatura
-st.markdown("---")
-st.markdown("<div style='text-align: center'>Desenvolvido por <b>Clayton S. Silva</b></div>", unsafe_allow_html=True)
-
-
-
-##  streamlit run app.py
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+import atexit
+import os
+import shutil
+import tempfile
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.pool import StaticPool
+
+import export
+import ingest
+import jobs
+import metrics
+import profiling
+import queries
+import rangesums
+import views
+import writer
+
+# --- Configuração da Página ---
+st.set_page_config(page_title="Dashboard de Logística", page_icon="🚚", layout="wide")
+
+# --- MEDIÇÃO DE DESEMPENHO ---
+# Cada execução do script é dividida em etapas (profile.mark); o registro vai para o
+# log de tempos (profiling.py) e a última execução aparece no painel do administrador.
+if 'sessao_id' not in st.session_state:
+    st.session_state['sessao_id'] = os.urandom(4).hex()
+profile = profiling.RerunProfile(session=st.session_state['sessao_id'])
+profile.mark("conexão e esquema")
+
+# --- 1. CARREGAMENTO E TRATAMENTO DE DADOS ---
+
+# CONFIGURAÇÃO DO BANCO DE DADOS
+DATABASE_URL = "sqlite:///dados.db"
+TABLE_NAME = queries.TABLE_NAME
+
+# @st.cache_resource: Otimização de performance.
+# Mantém a conexão com o banco aberta na memória para não reconectar a cada clique do usuário.
+# O banco fica em modo WAL: as leituras não esperam pelas escritas (ver queries.py).
+@st.cache_resource
+def get_database_engine(url):
+    return queries.create_database_engine(url)
+
+engine = get_database_engine(DATABASE_URL)
+
+# Os dados NÃO são mais carregados inteiros na sessão: os filtros e agregações
+# são executados no banco (ver queries.py) e só os resultados chegam ao pandas.
+
+# --- CACHE COMPARTILHADO ENTRE SESSÕES ---
+# Os resultados das consultas ficam em um cache único do processo (st.cache_resource),
+# compartilhado por todas as sessões sem cópia. A chave inclui a versão dos dados,
+# então uma entrada só deixa de ser usada quando uma escrita incrementa essa versão.
+# IMPORTANTE: os DataFrames retornados são somente leitura. Use .assign/.copy em vez de alterá-los.
+@st.cache_resource(max_entries=512, show_spinner=False)
+def shared_query(_engine, source_key, data_version, query_name, *args):
+    # Resultado pré-calculado em lote (python views.py), se houver um desta versão dos dados
+    if source_key == DATABASE_URL:
+        cached = views.cached_result(_engine, data_version, query_name, args)
+        if cached is not None:
+            return cached
+    return getattr(queries, query_name)(_engine, *args)
+
+# Somas acumuladas diárias (rangesums.py): os totais dos KPIs de qualquer período saem
+# delas sem consultar o banco. Montadas uma vez por fonte e versão dos dados.
+@st.cache_resource(max_entries=4, show_spinner=False)
+def kpi_sums(_engine, source_key, data_version):
+    return rangesums.DailyPrefixSums.load(_engine)
+
+# --- FILA DE ESCRITA ---
+# Todas as escritas no banco passam por um único thread escritor do processo (writer.py),
+# compartilhado pelas sessões: escritas simultâneas vão em lote para uma só transação e
+# nenhuma recebe "database is locked". Depois de cada lote o escritor garante o esquema
+# (índices de uma tabela recém-criada e estatísticas dos índices).
+def after_write(_engine):
+    queries.ensure_schema(_engine)
+
+# Na criação da fila (primeira execução do processo) o esquema é conferido por ela mesma:
+# tabela de controle, tabelas de resumo e índices usados pelos filtros.
+@st.cache_resource
+def get_write_queue(_engine):
+    write_queue = writer.WriteQueue(_engine, after_commit=lambda: after_write(_engine))
+    write_queue.run(queries.apply_schema, refresh=False)
+    return write_queue
+
+write_queue = get_write_queue(engine)
+
+# Colunas esperadas na tabela de performance
+EXPECTED_COLS = ['DATA', 'TRANSPORTADORA', 'OPERAÇÃO', 'LIBERADOS', 'MALHA']
+
+def insert_new_rows(conn, df, cols, replace=False):
+    """Grava apenas as linhas novas do DataFrame (executada pela fila de escrita, em uma transação).
+
+    Retorna (df_inserido, linhas_ignoradas). As linhas repetidas, no próprio arquivo ou já
+    no banco, são descartadas pela impressão digital de cada linha (queries.append_rows),
+    sem reler as linhas do banco.
+    """
+    if replace:
+        queries.clear_rows(conn)
+    inserted = queries.append_rows(conn, df[cols])
+    return inserted, len(df) - len(inserted)
+
+# Função CRÍTICA: Limpeza de dados. É aqui que corrigimos erros comuns de digitação e formatação.
+# A limpeza em si fica em ingest.py (usada também pela importação em blocos).
+def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """Realiza a limpeza e padronização dos dados."""
+    df, linhas_invalidas = ingest.clean_frame(df)
+    if linhas_invalidas > 0:
+        st.warning(f"⚠️ Atenção: {linhas_invalidas} linhas foram removidas pois a coluna 'DATA' contém valores inválidos ou vazios.")
+    return df
+
+# Função robusta para ler diferentes tipos de arquivo (CSV, Excel, SQLite)
+def load_data(uploaded_file=None):
+    df = None
+    # 1. Tenta carregar do upload
+    if uploaded_file is not None:
+        try:
+            if uploaded_file.name.endswith('.csv'):
+                # Lógica robusta para CSV (ponto e vírgula ou vírgula)
+                # Detecta o separador uma única vez a partir de uma amostra do início do arquivo
+                try:
+                    df = pd.read_csv(uploaded_file, sep=ingest.sniff_delimiter(uploaded_file), dtype=str)
+                except:
+                    uploaded_file.seek(0)
+                    df = pd.read_csv(uploaded_file, sep=None, engine='python', dtype=str)
+            elif uploaded_file.name.endswith('.db'):
+                with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp:
+                    tmp.write(uploaded_file.getvalue())
+                    tmp_path = tmp.name
+                
+                try:
+                    temp_engine = create_engine(f"sqlite:///{tmp_path}")
+                    inspector = inspect(temp_engine)
+                    tables = inspector.get_table_names()
+                    # Remove tabelas internas do SQLite se existirem
+                    tables = [t for t in tables if t != 'sqlite_sequence']
+                    
+                    if tables:
+                        # Tenta achar a tabela pelo nome (ignorando maiúsculas/minúsculas) ou pega a primeira
+                        target_table = next((t for t in tables if t.lower() == TABLE_NAME.lower()), tables[0])
+                        
+                        # Identifica colunas de data para leitura correta (igual ao carregamento local)
+                        columns_info = inspector.get_columns(target_table)
+                        date_cols = [c['name'] for c in columns_info if c['name'].upper() == 'DATA']
+                        
+                        df = pd.read_sql(f"SELECT * FROM '{target_table}'", con=temp_engine, parse_dates=date_cols)
+                    else:
+                        st.error("O arquivo .db não contém tabelas de dados válidas.")
+                    temp_engine.dispose()
+                except Exception as e:
+                    st.error(f"Erro ao ler o arquivo .db: {e}")
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            else:
+                df = pd.read_excel(uploaded_file)
+        except Exception as e:
+            st.error(f"Erro ao ler o arquivo: {e}")
+            return None
+
+    if df is not None:
+        df = clean_dataframe(df)
+
+    return df
+
+# Pré-visualização de um upload: os dados do arquivo vão para um SQLite em memória,
+# assim o dashboard usa exatamente as mesmas consultas do banco principal.
+def get_preview(uploaded_file):
+    preview = st.session_state.get('preview')
+    if preview is None or preview['file_id'] != uploaded_file.file_id:
+        df_upload = load_data(uploaded_file)
+        preview_engine = None
+        if df_upload is not None and not df_upload.empty:
+            preview_engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={'check_same_thread': False})
+            cols = [c for c in EXPECTED_COLS if c in df_upload.columns]
+            df_upload[cols].to_sql(TABLE_NAME, preview_engine, index=False)
+            queries.ensure_schema(preview_engine)
+        preview = {'file_id': uploaded_file.file_id, 'df': df_upload, 'engine': preview_engine}
+        st.session_state['preview'] = preview
+    return preview['df'], preview['engine']
+
+# --- IMPORTAÇÕES EM SEGUNDO PLANO ---
+# Salvar um upload cria uma importação (jobs.py) executada por um thread de trabalho do
+# processo: o arquivo é lido, limpo e gravado em blocos pela fila de escrita enquanto a
+# sessão continua navegando. O painel da barra lateral acompanha o progresso e, quando a
+# importação termina, reexecuta o app para exibir a nova versão dos dados. Vários arquivos
+# (ou um .zip) de uma vez viram uma importação em lote, lida em paralelo em processos.
+# Acima deste tamanho o arquivo vai direto para a importação em blocos, sem pré-visualização.
+STREAMING_THRESHOLD_MB = 20
+JOB_POLL_S = 1
+
+@st.cache_resource
+def get_import_jobs(_engine):
+    return jobs.ImportJobs(write_queue, insert_new_rows, EXPECTED_COLS)
+
+import_jobs = get_import_jobs(engine)
+
+def render_import_jobs(acompanhando):
+    """Progresso das últimas importações da sessão (chamado como fragmento enquanto houver uma ativa)."""
+    session_jobs = [import_jobs.get(job_id) for job_id in st.session_state['importacoes'][-3:]]
+    session_jobs = [job for job in session_jobs if job is not None]
+    for job in reversed(session_jobs):
+        contadores = (f"{job.lidas:,} lidas · {job.limpas:,} limpas · {job.inseridas:,} inseridas · "
+                      f"{job.ignoradas:,} ignoradas (duplicadas) · {job.rejeitadas:,} rejeitadas (data inválida)")
+        st.markdown(f"**{job.name}** · importação `{job.job_id}` · {job.status} ({job.elapsed():.0f}s)")
+        com_erro = [arquivo['arquivo'] for arquivo in job.arquivos if arquivo['erro']]
+        if job.status == jobs.DONE and com_erro:
+            st.warning(f"⚠️ Dados salvos, exceto {len(com_erro)} arquivo(s) com erro (veja o resumo). {contadores}")
+        elif job.status == jobs.DONE:
+            st.success(f"✅ Dados salvos! {contadores}")
+        elif job.status == jobs.CANCELLED and job.blocos_gravados:
+            st.warning(f"⚠️ Importação cancelada; os {job.blocos_gravados:,} blocos já gravados permanecem no banco. "
+                       f"{contadores}")
+        elif job.status == jobs.CANCELLED:
+            st.warning(f"⚠️ Importação cancelada; nada foi gravado no banco. {contadores}")
+        elif job.status == jobs.FAILED:
+            st.error(f"❌ Erro ao importar: {job.error}")
+        else:
+            st.progress(job.fraction, text=contadores)
+            if st.button("Cancelar importação", key=f"cancelar_{job.job_id}", disabled=job.cancel_requested):
+                job.cancel()
+        if job.arquivos:
+            # Importação em lote: linhas aceitas e rejeitadas de cada arquivo
+            resumo = pd.DataFrame(job.arquivos).rename(columns={
+                'arquivo': 'Arquivo', 'lidas': 'Lidas', 'rejeitadas': 'Rejeitadas', 'inseridas': 'Inseridas',
+                'ignoradas': 'Ignoradas', 'erro': 'Erro'})
+            st.dataframe(resumo, hide_index=True)
+    # Uma importação acompanhada terminou: reexecuta o app inteiro para ler a nova versão dos dados
+    if acompanhando and all(job.done for job in session_jobs):
+        st.rerun()
+
+# --- BACKUP DO BANCO ---
+# Snapshots gerados com a API de backup do SQLite (sem pandas), um por versão dos dados.
+# Cada processo usa sua própria pasta temporária (apagada na saída), então dois dashboards
+# na mesma máquina não apagam os arquivos um do outro.
+BACKUP_PREFIX = "dados_v"
+
+@st.cache_resource
+def get_backup_dir():
+    path = tempfile.mkdtemp(prefix="dashboard_backups_")
+    atexit.register(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def build_backup(_engine, data_version):
+    """Gera (uma vez por versão dos dados) o snapshot do banco e apaga os anteriores."""
+    backup_dir = get_backup_dir()
+    path = os.path.join(backup_dir, f"{BACKUP_PREFIX}{data_version}.db")
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    queries.backup_to_file(_engine, tmp_path)
+    os.replace(tmp_path, path)
+    # Limpeza automática dos snapshots de versões antigas (só os gerados aqui)
+    for name in os.listdir(backup_dir):
+        if name.startswith(BACKUP_PREFIX) and name != os.path.basename(path):
+            try:
+                os.remove(os.path.join(backup_dir, name))
+            except OSError:
+                pass
+    return path
+
+def read_backup(engine, data_version):
+    with open(build_backup(engine, data_version), "rb") as fp:
+        return fp.read()
+
+# --- FUNÇÕES AUXILIARES DE CÁLCULO ---
+# A taxa de retenção e os totais/deltas são calculados de forma vetorizada em metrics.py
+
+# --- NOVA FUNÇÃO: EXPORTAR RELATÓRIO ---
+# Gerado só no clique do botão, escrevendo as linhas em blocos (export.py).
+# A chave do cache são os filtros e a versão dos dados, sem hashear o DataFrame.
+@st.cache_data(max_entries=8, show_spinner=False)
+def build_report(_engine, source_key, data_version, filters, fmt):
+    """Arquivo do relatório filtrado no formato pedido (xlsx, csv ou parquet)."""
+    return export.export_report(_engine, filters, fmt)
+
+# --- 2. BARRA LATERAL (UPLOAD E FILTROS) ---
+profile.mark("barra lateral e upload")
+
+# Tenta carregar logo localmente
+script_dir = os.path.dirname(os.path.abspath(__file__))
+files_in_dir = os.listdir(script_dir)
+possible_logos = ["logo.png", "logo.jpg", "logo.jpeg"]
+found_logo = next((f for f in files_in_dir if f.lower() in possible_logos), None)
+local_logo = os.path.join(script_dir, found_logo) if found_logo else None
+
+logo_image = None
+if local_logo:
+    logo_image = local_logo
+    st.sidebar.image(local_logo)
+else:
+    # Fallback para o GIF se não tiver logo local
+    st.sidebar.image("https://media3.giphy.com/media/v1.Y2lkPTc5MGI3NjExNzVseGVsdWtocmNidGU3MDZtYzdmcm1kMzMxM3VhZGJjYzJuNGZiMSZlcD12MV9pbnRlcm5hbF9naWZfYnlfaWQmY3Q9cw/hR12JVvN9GftOzxqGd/giphy.gif", width=150)
+
+# --- SISTEMA DE LOGIN (BARRA LATERAL) ---
+# Controla se o usuário pode editar dados ou apenas visualizar
+if 'logged_in' not in st.session_state:
+    st.session_state['logged_in'] = False
+
+def check_login():
+    if st.session_state['logged_in']:
+        if st.sidebar.button("🔓 Sair (Logout)"):
+            st.session_state['logged_in'] = False
+            st.rerun()
+        return True
+    
+    st.sidebar.markdown("### 🔒 Acesso Restrito")
+    senha = st.sidebar.text_input("Senha de Admin", type="password")
+    if st.sidebar.button("Entrar"):
+        if senha == "admin123":  # Defina sua senha aqui
+            st.session_state['logged_in'] = True
+            st.rerun()
+        else:
+            st.sidebar.error("Senha incorreta.")
+    return False
+
+acesso_liberado = check_login()
+
+uploaded_file = None
+batch_files = []
+streaming_import = False
+if 'importacoes' not in st.session_state:
+    st.session_state['importacoes'] = []
+
+if acesso_liberado:
+    st.sidebar.header("Importar Dados")
+    uploaded_files = st.sidebar.file_uploader("Carregar arquivos (CSV, Excel, DB ou ZIP)", type=['csv', 'xlsx', 'db', 'zip'],
+                                              accept_multiple_files=True)
+    # Um arquivo segue com pré-visualização; vários (ou um .zip) formam uma importação em lote
+    if len(uploaded_files) == 1 and not uploaded_files[0].name.lower().endswith('.zip'):
+        uploaded_file = uploaded_files[0]
+    elif uploaded_files:
+        batch_files = uploaded_files
+        st.sidebar.caption(f"{len(batch_files)} arquivo(s): importação em lote, lida em paralelo e gravada de uma vez, sem pré-visualização.")
+    if uploaded_file is not None:
+        streaming_import = st.sidebar.checkbox(
+            "Importar em blocos (arquivos grandes)",
+            value=uploaded_file.size > STREAMING_THRESHOLD_MB * 1024 * 1024,
+            help="Lê e grava o arquivo em blocos, em segundo plano, sem carregá-lo inteiro na memória nem pré-visualizá-lo. O dashboard continua exibindo o banco atual enquanto a importação avança."
+        )
+
+    # --- FORMULÁRIO DE INSERÇÃO ---
+    st.sidebar.markdown("---")
+    st.sidebar.header("Inserir Dados Manualmente")
+    # Grade com várias linhas (ex.: o dia de todas as transportadoras): editar não reexecuta
+    # o script (form); as linhas são validadas juntas e gravadas em uma única transação,
+    # com uma só invalidação dos caches. A grade volta vazia trocando a chave do editor.
+    if 'grade_insercao' not in st.session_state:
+        st.session_state['grade_insercao'] = 0
+    aviso_insercao = st.session_state.pop('aviso_insercao', None)
+    if aviso_insercao:
+        st.sidebar.success(aviso_insercao)
+    with st.sidebar.form("form_insercao"):
+        grade = st.data_editor(
+            ingest.empty_entries(),
+            key=f"grade_insercao_{st.session_state['grade_insercao']}",
+            num_rows="dynamic",
+            hide_index=True,
+            column_config={
+                'DATA': st.column_config.DateColumn("Data", format="DD/MM/YYYY", default=pd.Timestamp.today().date(), required=True),
+                'TRANSPORTADORA': st.column_config.TextColumn("Transportadora", required=True),
+                'OPERAÇÃO': st.column_config.SelectboxColumn("Operação", options=["LML", "Direta", "Reversa", "Outros"], default="LML", required=True),
+                'LIBERADOS': st.column_config.NumberColumn("Liberados (Vol)", min_value=0, step=1, default=0),
+                'MALHA': st.column_config.NumberColumn("Malha (Qtd)", min_value=0, step=1, default=0),
+            },
+        )
+
+        btn_salvar = st.form_submit_button("Salvar Registros")
+
+        if btn_salvar:
+            df_new, erros = ingest.validate_entries(grade)
+            if erros:
+                st.sidebar.warning("⚠️ Nada foi salvo. Corrija as linhas:\n\n" + "\n".join(f"- {erro}" for erro in erros))
+            elif df_new.empty:
+                st.sidebar.warning("⚠️ Preencha ao menos uma linha.")
+            else:
+                try:
+                    # Todas as linhas em uma única escrita (uma transação na fila de escrita)
+                    df_inserted, skipped = write_queue.run(insert_new_rows, df_new, list(df_new.columns))
+                    st.session_state['grade_insercao'] += 1
+                    st.session_state['aviso_insercao'] = f"✅ {len(df_inserted)} registro(s) salvo(s) no Banco de Dados, {skipped} ignorado(s) (duplicados)."
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Erro ao salvar no banco: {e}")
+
+# Pré-visualização do upload (exceto na importação em blocos, que não carrega o arquivo inteiro)
+df, preview_engine = (None, None)
+if uploaded_file is not None and not streaming_import:
+    df, preview_engine = get_preview(uploaded_file)
+
+if acesso_liberado and (uploaded_file is not None or batch_files):
+    # Botão para salvar dados importados no banco (aparece apenas se houver upload)
+    replace_data = st.sidebar.checkbox("Substituir todo o banco de dados", help="Marque para apagar o banco atual e criar um novo com este arquivo.")
+    if st.sidebar.button("💾 Converter/Salvar em dados.db"):
+        # A gravação roda em segundo plano; o progresso aparece no painel abaixo
+        if batch_files:
+            name = batch_files[0].name if len(batch_files) == 1 else f"{len(batch_files)} arquivos"
+            job = import_jobs.import_batch(name, [(f.name, f.getvalue()) for f in batch_files], replace=replace_data)
+        elif not streaming_import and (df is None or not any(c in df.columns for c in EXPECTED_COLS)):
+            job = None
+            st.sidebar.error("❌ O arquivo não contém as colunas necessárias.")
+        elif uploaded_file.name.endswith('.db'):
+            # Bancos .db são mesclados pelo próprio SQLite, sem passar pelo DataFrame da prévia
+            job = import_jobs.import_database(uploaded_file.name, uploaded_file.getvalue(), replace=replace_data)
+        elif streaming_import:
+            job = import_jobs.import_file(uploaded_file.name, uploaded_file.getvalue(), replace=replace_data)
+        else:
+            job = import_jobs.import_frame(uploaded_file.name, df, replace=replace_data)
+        if job is not None:
+            st.session_state['importacoes'].append(job.job_id)
+
+if acesso_liberado and st.session_state['importacoes']:
+    acompanhando = any(not job.done for job in map(import_jobs.get, st.session_state['importacoes']) if job is not None)
+    with st.sidebar:
+        st.markdown("---")
+        if acompanhando:
+            st.fragment(render_import_jobs, run_every=JOB_POLL_S)(acompanhando)
+        else:
+            render_import_jobs(acompanhando)
+
+# Fonte das consultas: o banco principal ou, se houver upload, o arquivo carregado
+profile.mark("limites e filtros")
+db_version = queries.get_data_version(engine)
+if uploaded_file is not None and not streaming_import:
+    query_engine = preview_engine
+    source_key, data_version = uploaded_file.file_id, 0
+else:
+    query_engine = engine
+    source_key, data_version = DATABASE_URL, db_version
+
+def run_query(query_name, *args):
+    """Executa uma função de queries.py passando pelo cache compartilhado."""
+    return shared_query(query_engine, source_key, data_version, query_name, *args)
+
+min_date, max_date = (None, None)
+if query_engine is not None and queries.table_exists(query_engine):
+    min_date, max_date = run_query('date_bounds', queries.QueryFilters())
+
+if min_date is None:
+    st.info("O banco de dados está vazio. Utilize o menu lateral para carregar um arquivo ou inserir dados manualmente.")
+    st.stop()
+
+if acesso_liberado:
+    # Botão para baixar o banco de dados atualizado.
+    # O backup só é gerado quando o botão é clicado (data recebe uma função)
+    # e fica em cache até a próxima escrita no banco.
+    st.sidebar.download_button(
+        label="📥 Baixar dados.db (Backup)",
+        data=lambda version=db_version, sessao=profile.session: profiling.timed_call(
+            "backup", read_backup, engine, version, session=sessao),
+        file_name="dados.db",
+        mime="application/x-sqlite3"
+    )
+
+    st.sidebar.header("Filtros")
+
+    # Filtro de Ano
+    anos_disponiveis = sorted((int(a) for a in run_query('distinct_values', 'Ano')), reverse=True)
+    anos_selecionados = st.sidebar.multiselect(
+        "Ano",
+        options=anos_disponiveis,
+        default=anos_disponiveis
+    )
+
+    # Filtro de Data
+    start_date, end_date = st.sidebar.date_input(
+        "Selecione o Período",
+        [min_date, max_date],
+        min_value=min_date,
+        max_value=max_date,
+        format="DD/MM/YYYY"
+    )
+
+    # Filtro de Operação
+    opcoes_operacao = run_query('distinct_values', 'OPERAÇÃO')
+    operacoes = st.sidebar.multiselect(
+        "Tipo de Operação",
+        options=opcoes_operacao,
+        default=opcoes_operacao
+    )
+
+    # Filtro de Transportadora
+    opcoes_transportadora = run_query('distinct_values', 'TRANSPORTADORA')
+    transportadoras = st.sidebar.multiselect(
+        "Transportadora",
+        options=opcoes_transportadora,
+        default=opcoes_transportadora
+    )
+
+    # Botão para recarregar dados do banco
+    if st.sidebar.button("🔄 Atualizar Dados (DB)"):
+        # Recalcula os resumos e descarta o cache compartilhado
+        # (útil se o dados.db foi alterado fora do dashboard)
+        write_queue.run(queries.apply_schema, refresh=False)
+        write_queue.run(queries.refill_rollups)
+        shared_query.clear()
+        kpi_sums.clear()
+        st.rerun()
+
+    # Tempo e memória de cada etapa da execução anterior (o log completo, se ligado, fica em profiling.LOG_PATH)
+    ultimo_perfil = st.session_state.get('ultimo_perfil')
+    if ultimo_perfil:
+        with st.sidebar.expander("⏱️ Desempenho da última execução"):
+            st.caption(f"Total: {ultimo_perfil['total_s']:.3f} s · Memória do processo: {ultimo_perfil['memoria_rss_mb']} MB")
+            st.dataframe(
+                pd.DataFrame(ultimo_perfil['etapas']),
+                hide_index=True,
+                column_config={
+                    "etapa": "Etapa",
+                    "segundos": st.column_config.NumberColumn("Tempo (s)", format="%.3f"),
+                    "memoria_mb": st.column_config.NumberColumn("Δ Memória (MB)", format="%.2f"),
+                }
+            )
+
+    st.sidebar.markdown("---")
+    st.sidebar.markdown("Desenvolvido por **Clayton S. Silva**")
+
+else:
+    # --- MODO LEITURA (SEM LOGIN) ---
+    # Sem filtros de categoria/ano (None = todos); o período é o histórico completo
+    start_date, end_date = min_date, max_date
+    operacoes = None
+    transportadoras = None
+    anos_selecionados = None
+    
+    st.sidebar.info("ℹ️ Faça login para acessar filtros e ferramentas de edição.")
+
+# Agrupamento opcional das transportadoras menores nos gráficos (limita legendas e séries)
+top_n = st.sidebar.number_input(
+    "Transportadoras nos gráficos (Top N + Outras)", min_value=0, max_value=50, value=0, step=1,
+    help="0 mostra todas. Com N > 0, as demais transportadoras são somadas em \"Outras\"."
+)
+
+# --- APLICAÇÃO DOS FILTROS ---
+# Os filtros viram um WHERE parametrizado; cada visão pede ao banco só o agrupamento de que precisa.
+# Os conjuntos de dados de cada gráfico são montados em views.py (os mesmos do pré-cálculo em lote).
+filters = views.period_filters(min_date, max_date, anos_selecionados, start_date, end_date, operacoes, transportadoras)
+anos_filtrados = [int(a) for a in run_query('distinct_values', 'Ano', filters)]
+has_filtered_data = bool(anos_filtrados)
+
+# --- CONSTRUÇÃO DE TEXTOS DINÂMICOS (PARA TÍTULOS) ---
+if has_filtered_data:
+    periodo_label = f"{pd.to_datetime(start_date).strftime('%d/%m/%Y')} a {pd.to_datetime(end_date).strftime('%d/%m/%Y')}"
+    anos_label = ", ".join(map(str, anos_filtrados))
+else:
+    periodo_label = "Sem dados"
+    anos_label = "-"
+
+# --- NOVA FUNCIONALIDADE: BOTÃO DE DOWNLOAD DO RELATÓRIO FILTRADO ---
+if acesso_liberado and has_filtered_data:
+    st.sidebar.markdown("---")
+    st.sidebar.header("📥 Exportar Relatório")
+    formato = st.sidebar.radio(
+        "Formato", list(export.EXPORT_FORMATS),
+        format_func=lambda f: export.EXPORT_FORMATS[f][0], horizontal=True
+    )
+    # O arquivo só é montado quando o botão é clicado (data recebe uma função)
+    st.sidebar.download_button(
+        label=f"Baixar Dados Filtrados (.{formato})",
+        data=lambda args=(query_engine, source_key, data_version, filters, formato), sessao=profile.session: profiling.timed_call(
+            f"exportacao_{args[-1]}", build_report, *args, session=sessao),
+        file_name=f"relatorio_logistica_filtrado.{formato}",
+        mime=export.EXPORT_FORMATS[formato][1]
+    )
+
+# --- 3. DASHBOARD PRINCIPAL ---
+profile.mark("kpis")
+if logo_image:
+    st.image(logo_image, width=200)
+
+# --- ANIMAÇÃO CAMINHÃO ---
+st.markdown("""
+<style>
+@keyframes drive {
+    0% { margin-left: 100%; }
+    100% { margin-left: -100px; }
+}
+.truck-anim {
+    font-size: 40px;
+    animation: drive 15s linear infinite;
+}
+</style>
+<div style="width: 100%; overflow: hidden;">
+    <div class="truck-anim">🚚</div>
+</div>
+""", unsafe_allow_html=True)    
+
+st.title(f"📊 Dashboard Controle de Malha Fina e Liberados ({anos_label})")
+st.markdown(f"##### 🗓️ Período de Análise: {periodo_label}")
+
+
+
+# --- CONTEXTO DO PROCESSO (NOVO) ---
+with st.expander("ℹ️ Entenda o Processo de Malha Fina (Auditoria)"):
+    st.markdown("""
+    **Fluxo Operacional Padrão:**
+    
+    1.   **Carregamento:** A transportadora realiza o carregamento dos produtos e o veículo se dirige à **Portaria de Saída**.
+    2.  🎲 **Sorteio Aleatório:** Na portaria, é realizado um sorteio individual para cada veículo.
+    3.  🚦 **Resultado:**
+        *   🟢 **Liberado:** O veículo segue viagem normalmente.
+        *   🔴 **Malha (Retenção):** O veículo deve retornar ao **Setor de Retorno** para uma **Nova Conferência**.
+    4.  📋 **Conclusão:** Após a reconferência, se não houver divergências, o veículo é liberado. Caso contrário, a divergência é relatada.
+    """)
+
+# --- CÁLCULO DE KPIS E DELTAS (COMPARATIVO) ---
+# Período atual e período anterior de mesma duração (para cálculo do Delta)
+somas_kpi = kpi_sums(query_engine, source_key, data_version)
+atual, anterior, delta = views.kpis(somas_kpi.totals, filters, start_date, end_date)
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Fluxo Total (Veículos)", f"{atual['veiculos']:,.0f}", f"{delta['veiculos']:,.0f} vs período anterior")
+col2.metric("Veículos Liberados", f"{atual['liberados']:,.0f}", f"{delta['liberados']:,.0f} vs período anterior")
+col3.metric("Retidos em Malha", f"{atual['malha']:,.0f}", f"{delta['malha']:,.0f} vs período anterior", delta_color="inverse")
+col4.metric("Taxa de Retenção Global", f"{atual['taxa']:.2f}%", f"{delta['taxa']:.2f} p.p.", delta_color="inverse")
+
+st.markdown("---")
+
+st.subheader("🏆 Rankings")
+col_r1, col_r2 = st.columns(2)
+
+profile.mark("rankings")
+# Totais por transportadora (usado nos rankings e no gráfico de share)
+df_transp_all = views.carrier_totals(run_query, filters)
+transportadoras_grafico = views.top_carriers(df_transp_all, top_n)
+df_transp = views.group_other_carriers(df_transp_all, transportadoras_grafico)
+
+with col_r1:
+    top_vol = df_transp[['TRANSPORTADORA', 'LIBERADOS']].sort_values(by='LIBERADOS', ascending=True)
+    fig_top_vol = px.bar(top_vol, x='LIBERADOS', y='TRANSPORTADORA', orientation='h', text_auto=True, title=f"Ranking de Fluxo ({periodo_label})", color='LIBERADOS', color_continuous_scale='Teal')
+    fig_top_vol.update_traces(textfont_size=14)
+    fig_top_vol.update_layout(template="plotly_white", xaxis_title="Volume Liberado", yaxis_title=None, showlegend=False)
+    st.plotly_chart(fig_top_vol, key="rank_vol", width="stretch")
+    st.caption("📝 **Fluxo:** Volume total de veículos que saíram liberados (sem auditoria).")
+
+with col_r2:
+    top_malha = df_transp[['TRANSPORTADORA', 'MALHA']].sort_values(by='MALHA', ascending=True)
+    fig_top_malha = px.bar(top_malha, x='MALHA', y='TRANSPORTADORA', orientation='h', text_auto=True, title=f"Ranking de Retenção ({periodo_label})", color='MALHA', color_continuous_scale='Reds')
+    fig_top_malha.update_traces(textfont_size=14)
+    fig_top_malha.update_layout(template="plotly_white", xaxis_title="Qtd. Veículos Retidos", yaxis_title=None, showlegend=False)
+    st.plotly_chart(fig_top_malha, key="rank_malha", width="stretch")
+    st.caption("📝 **Retenção:** Quantidade absoluta de veículos parados para auditoria (Malha Fina).")
+
+with st.expander("💡 Guia Rápido: Como ler os Rankings?"):
+    st.markdown("""
+    *   **Ranking de Fluxo:** Mostra quem opera mais. Útil para dimensionar recursos de pátio e conferentes.
+    *   **Ranking de Retenção:** Mostra quem mais cai na malha em **números absolutos**. 
+        *   ⚠️ *Atenção:* Uma transportadora pode estar no topo aqui apenas porque tem muito volume. Para ver quem tem a *pior performance relativa* (quem "falha" mais proporcionalmente), consulte os gráficos de **Taxa de Retenção (%)** nas abas abaixo.
+    """)
+
+# --- FRAGMENTOS DAS ABAS ---
+# Os controles locais das abas (período dos gráficos diários, modo da visão diária e meses)
+# reexecutam só o próprio fragmento: KPIs, rankings e as demais abas não são recalculados.
+# Os filtros e rótulos da barra lateral chegam prontos como argumentos.
+@st.fragment
+def render_geral_daily(filters, has_filtered_data, periodo_label, transportadoras_grafico):
+    # Filtro de Data Específico para a Visão Geral (Padrão: Últimos 5 dias)
+    filters_geral = filters
+    periodo_g_label = periodo_label # Default
+    if has_filtered_data:
+        # Define padrão: últimos 5 dias
+        min_date_g, max_date_g, default_start = views.daily_window(run_query, filters)
+        
+        dates_g = st.date_input(
+            "📅 Filtrar Período (Gráficos Diários)",
+            value=[default_start, max_date_g],
+            min_value=min_date_g,
+            max_value=max_date_g,
+            key="filter_geral_dates"
+        )
+        
+        if len(dates_g) == 2:
+            filters_geral = filters.replace(start_date=dates_g[0], end_date=dates_g[1])
+            periodo_g_label = f"{pd.to_datetime(dates_g[0]).strftime('%d/%m')} a {pd.to_datetime(dates_g[1]).strftime('%d/%m')}"
+
+    # Totais e taxa de retenção por dia e transportadora no período escolhido.
+    # Períodos longos são somados por semana e séries densas são desenhadas em WebGL,
+    # para o tamanho das figuras não crescer com o período.
+    df_dia_malha_g = views.group_other_carriers(views.daily_totals(run_query, filters_geral), transportadoras_grafico)
+    df_dia_malha_g, semanal_g = views.limit_daily_resolution(df_dia_malha_g)
+    denso_g = len(df_dia_malha_g) > views.DENSE_POINTS
+    unidade_g = "Semana" if semanal_g else "Dia"
+
+    col_g1, col_g2 = st.columns(2)
+    with col_g1:
+        if denso_g:
+            fig_vol_dia_g = px.line(df_dia_malha_g, x='DATA', y='LIBERADOS', color='TRANSPORTADORA', title=f"Fluxo de Saída por {unidade_g} ({periodo_g_label})", render_mode='webgl')
+        else:
+            fig_vol_dia_g = px.bar(df_dia_malha_g, x='DATA', y='LIBERADOS', color='TRANSPORTADORA', barmode='group', title=f"Fluxo de Saída por {unidade_g} ({periodo_g_label})", text_auto=True)
+            fig_vol_dia_g.update_traces(textfont_size=14)
+        fig_vol_dia_g.update_xaxes(tickformat="%d/%m/%Y")
+        fig_vol_dia_g.update_layout(template="plotly_white", xaxis_title="Data", yaxis_title="Volume")
+        st.plotly_chart(fig_vol_dia_g, key="geral_vol_dia", width="stretch")
+        st.caption("📊 **Volume Operacional:** Quantidade de veículos liberados dia a dia.")
+    with col_g2:
+        if denso_g:
+            fig_malha_dia_g = px.line(df_dia_malha_g, x='DATA', y='MALHA_PCT', color='TRANSPORTADORA', title=f"Taxa de Retenção % por {unidade_g} ({periodo_g_label})", render_mode='webgl')
+        else:
+            fig_malha_dia_g = px.bar(df_dia_malha_g, x='DATA', y='MALHA_PCT', color='TRANSPORTADORA', title=f"Taxa de Retenção % por {unidade_g} ({periodo_g_label})")
+            fig_malha_dia_g.update_traces(texttemplate='%{y:.2f}%', textposition='auto', textfont_size=14)
+        fig_malha_dia_g.update_xaxes(tickformat="%d/%m/%Y")
+        fig_malha_dia_g.update_layout(template="plotly_white", xaxis_title="Data", yaxis_title="Retenção (%)")
+        st.plotly_chart(fig_malha_dia_g, key="geral_malha_dia", width="stretch")
+        st.caption("🛡️ **Intensidade da Fiscalização:** Porcentagem de veículos auditados em relação ao total de saídas.")
+
+@st.fragment
+def render_tab_dia(filters, has_filtered_data, start_date, operacoes, transportadoras, transportadoras_grafico):
+    st.subheader("Análise Diária")
+    st.markdown("ℹ️ *Esta visão permite isolar dias específicos para entender o que aconteceu em datas com anomalias identificadas na Visão Geral.*")
+    
+    # Filtro Independente
+    modo_filtro = st.radio("Modo de Visualização:", ["Semana Atual (Automático)", "Selecionar Dia Específico (Independente)"], horizontal=True)
+    dia_label = ""
+    
+    # Totais por dia e transportadora da visão escolhida (vazio até haver dados)
+    df_dia_malha = pd.DataFrame(columns=['DATA', 'TRANSPORTADORA', 'LIBERADOS', 'MALHA', 'MALHA_PCT'])
+    
+    if "Independente" in modo_filtro:
+        # Ignora o filtro de data global, mas mantém os filtros de categoria
+        filters_indep = views.independent_filters(operacoes, transportadoras)
+        min_date_indep, max_date_indep = run_query('date_bounds', filters_indep)
+        
+        if min_date_indep is not None:
+            data_selecionada = st.date_input(
+                "Selecione a Data:", 
+                value=max_date_indep.date(), 
+                min_value=min_date_indep.date(), 
+                max_value=max_date_indep.date()
+            )
+            filters_dia = filters_indep.replace(start_date=data_selecionada, end_date=data_selecionada)
+            df_dia_malha = views.group_other_carriers(views.daily_totals(run_query, filters_dia), transportadoras_grafico)
+            dia_label = data_selecionada.strftime('%d/%m/%Y')
+        else:
+            st.warning("Não há dados disponíveis para os filtros de Operação/Transportadora selecionados.")
+    else:
+        # Lógica original (Semana Atual baseada no filtro global)
+        if has_filtered_data:
+            df_dia_malha, start_of_week, max_date = views.current_week(run_query, filters, start_date)
+            df_dia_malha = views.group_other_carriers(df_dia_malha, transportadoras_grafico)
+            dia_label = f"Semana de {start_of_week.strftime('%d/%m')} a {max_date.strftime('%d/%m')}"
+
+    col_d1, col_d2 = st.columns(2)
+    with col_d1:
+        fig_vol_dia = px.bar(df_dia_malha, x='DATA', y='LIBERADOS', color='TRANSPORTADORA', barmode='group', title=f"Fluxo de Saída ({dia_label})", text_auto=True)
+        fig_vol_dia.update_xaxes(tickformat="%d/%m/%Y")
+        fig_vol_dia.update_traces(textfont_size=14)
+        fig_vol_dia.update_layout(template="plotly_white", xaxis_title="Data", yaxis_title="Volume")
+        st.plotly_chart(fig_vol_dia, key="dia_vol", width="stretch")
+        st.caption("📊 **Volume:** Quantidade de veículos liberados por dia.")
+    with col_d2:
+        fig_malha_dia = px.bar(df_dia_malha, x='DATA', y='MALHA_PCT', color='TRANSPORTADORA', title=f"Taxa de Retenção % ({dia_label})")
+        fig_malha_dia.update_xaxes(tickformat="%d/%m/%Y")
+        fig_malha_dia.update_traces(texttemplate='%{y:.2f}%', textposition='auto', textfont_size=14)
+        fig_malha_dia.update_layout(template="plotly_white", xaxis_title="Data", yaxis_title="Retenção (%)")
+        st.plotly_chart(fig_malha_dia, key="dia_malha", width="stretch")
+        st.caption("🛡️ **Auditoria:** % de veículos retidos sobre o total.")
+
+@st.fragment
+def render_tab_mes(filters, anos_label, transportadoras_grafico):
+    st.subheader("Análise Mensal")
+    st.markdown("ℹ️ *Utilize esta visão para identificar sazonalidade (meses de pico) e se a performance das transportadoras está sendo Liberada ou seguindo a malha ao longo do ano.*")
+    
+    # Totais e taxa de retenção por mês e transportadora (agrupado no banco)
+    df_mes_all = views.group_other_carriers(views.monthly_totals(run_query, filters), transportadoras_grafico)
+    
+    # Filtro de Meses
+    meses_disponiveis = sorted(df_mes_all['Mês_Ano'].unique())
+    # Define padrão como os últimos 3 meses
+    padrao_meses = meses_disponiveis[-3:] if len(meses_disponiveis) >= 3 else meses_disponiveis
+    meses_selecionados = st.multiselect("Selecione os Meses para Visualizar:", options=meses_disponiveis, default=padrao_meses)
+    
+    if meses_selecionados:
+        df_mes = df_mes_all[df_mes_all['Mês_Ano'].isin(meses_selecionados)]
+    else:
+        df_mes = df_mes_all
+        
+    col_m1, col_m2 = st.columns(2)
+    with col_m1:
+        fig_vol_mes = px.bar(df_mes, x='Mês_Ano', y='LIBERADOS', color='TRANSPORTADORA', barmode='group', title=f"Fluxo de Saída por Mês ({anos_label})", text_auto=True)
+        fig_vol_mes.update_traces(textfont_size=14)
+        fig_vol_mes.update_layout(template="plotly_white", xaxis_title="Mês", yaxis_title="Volume")
+        st.plotly_chart(fig_vol_mes, key="mes_vol", width="stretch")
+        st.caption("📊 **Sazonalidade:** Volume acumulado de liberados por mês.")
+    with col_m2:
+        fig_malha_mes = px.bar(df_mes, x='Mês_Ano', y='MALHA_PCT', color='TRANSPORTADORA', title=f"Taxa de Retenção % por Mês ({anos_label})")
+        fig_malha_mes.update_traces(texttemplate='%{y:.2f}%', textposition='auto', textfont_size=14)
+        fig_malha_mes.update_layout(template="plotly_white", xaxis_title="Mês", yaxis_title="Retenção (%)")
+        st.plotly_chart(fig_malha_mes, key="mes_malha", width="stretch")
+        st.caption("🛡️ **Tendência:** Variação mensal da taxa de retenção na malha fina.")
+
+# Tabela detalhada paginada: só a página visível sai do banco (queries.fetch_page), já na
+# ordem escolhida, e TOTAL GERAL / % MALHA são calculados só para ela.
+# Trocar página, ordem ou tamanho reexecuta apenas este fragmento.
+DETAIL_PAGE_SIZES = [50, 100, 500, 1000]
+
+@st.fragment
+def render_detail_table(filters):
+    total_linhas = run_query('count_rows', filters)
+    if total_linhas == 0:
+        st.info("Nenhum registro encontrado para os filtros selecionados.")
+        return
+
+    col_ordem, col_sentido, col_tamanho, col_pagina = st.columns([2, 1, 1, 1])
+    with col_ordem:
+        ordenar_por = st.selectbox("Ordenar por", list(queries.DETAIL_SORT_EXPRESSIONS), key="detalhe_ordem")
+    with col_sentido:
+        decrescente = st.toggle("Decrescente", key="detalhe_decrescente")
+    with col_tamanho:
+        tamanho = st.selectbox("Linhas por página", DETAIL_PAGE_SIZES, index=1, key="detalhe_tamanho")
+    total_paginas = -(-total_linhas // tamanho)
+    # Com outro filtro ou tamanho de página a página guardada pode não existir mais
+    if st.session_state.get("detalhe_pagina", 1) > total_paginas:
+        st.session_state["detalhe_pagina"] = total_paginas
+    with col_pagina:
+        pagina = st.number_input("Página", min_value=1, max_value=total_paginas, step=1, key="detalhe_pagina")
+
+    df_pagina = run_query('fetch_page', filters, ordenar_por, decrescente, pagina - 1, tamanho, total_linhas)
+    # Prepara dataframe para exibição com cálculos idênticos ao Excel
+    df_display = metrics.with_totals(df_pagina)
+
+    st.data_editor(
+        df_display,
+        width="stretch",
+        hide_index=True,
+        disabled=True, # Apenas leitura por enquanto, mas com UX de planilha
+        column_config={
+            "DATA": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+            "% MALHA": st.column_config.NumberColumn("% Malha", format="%.2f%%"),
+            "TOTAL GERAL": st.column_config.NumberColumn("Total Geral", format="%d")
+        }
+    )
+    inicio = (pagina - 1) * tamanho
+    st.caption(f"Linhas {inicio + 1:,} a {inicio + len(df_pagina):,} de {total_linhas:,} · página {pagina:,} de {total_paginas:,}")
+
+# Abas para análises
+tab_geral, tab_dia, tab_mes, tab_ano = st.tabs(["🔍 Visão Geral & Risco", "📅 Visão Diária", "📆 Visão Mensal", "📅 Visão Anual"])
+
+profile.mark("visão geral")
+with tab_geral:
+    st.subheader("Visão Geral Integrada")
+    
+    # --- NOVO GRÁFICO: FUNIL DO PROCESSO ---
+    # Mostra visualmente o "Sorteio"
+    col_funnel, col_heatmap = st.columns(2)
+    
+    with col_funnel:
+        st.markdown("##### 🎲 Fluxo do Sorteio (Funil)")
+        data_funnel = views.funnel(atual)
+        fig_funnel = px.funnel(data_funnel, x='number', y='stage', color='stage', 
+                               color_discrete_map={"Veículos na Portaria": "#2E86C1", "🟢 Liberados (Viagem)": "#27AE60", "🔴 Retidos (Malha Fina)": "#C0392B"})
+        fig_funnel.update_layout(showlegend=False, template="plotly_white")
+        st.plotly_chart(fig_funnel, width="stretch")
+
+    with col_heatmap:
+        st.markdown("##### 🔥 Mapa de Calor: Risco por Dia da Semana")
+        # Dia da Semana x Transportadora (agrupado no banco), com a % calculada de forma vetorizada
+        df_heat_group = views.group_other_carriers(views.weekday_heatmap(run_query, filters), transportadoras_grafico)
+        
+        fig_heat = px.density_heatmap(df_heat_group, x='Dia_Semana', y='TRANSPORTADORA', z='MALHA_PCT', 
+                                      category_orders={"Dia_Semana": views.ORDER_DAYS},
+                                      color_continuous_scale='Reds', title="Intensidade de Retenção (%)")
+        fig_heat.update_layout(template="plotly_white")
+        st.plotly_chart(fig_heat, width="stretch")
+
+    with st.expander("💡 Análise de Risco e Fluxo (Como interpretar?)"):
+        st.markdown("""
+        *   **Fluxo do Sorteio (Funil):** Mostra a proporção de veículos que seguem viagem direta vs. aqueles desviados para o **Setor de Retorno**. Uma base vermelha larga indica gargalo na reconferência.
+        *   **Mapa de Calor (Heatmap):** Identifica dias críticos na operação.
+            *   🔥 **Cor Intensa:** Indica que, naquele dia da semana, a transportadora tem alta incidência de ida para Malha.
+            *   🕵️ **Ação:** Investigar se há padrões viciados (ex: toda sexta-feira a taxa sobe) ou problemas específicos na expedição.
+        """)
+
+    st.markdown("---")
+    
+    render_geral_daily(filters, has_filtered_data, periodo_label, transportadoras_grafico)
+
+    with st.expander("💡 Análise de Tendência Diária (O que observar?)"):
+        st.markdown("""
+        *   📊 **Fluxo de Saída (Volume):** Acompanhe a quantidade de veículos processados na portaria. Quedas podem indicar falta de carga ou problemas sistêmicos.
+        *   🛡️ **Taxa de Retenção (%):** Monitora a severidade do sorteio.
+            *   📈 **Picos:** Indicam que muitos veículos foram enviados para reconferência naquele dia, o que pode gerar atrasos e filas no retorno.
+            *   📉 **Zeros:** Dias com 0% de malha sugerem falha no sistema de sorteio (todos passaram direto).
+        """)
+
+    st.markdown("---")
+    st.subheader("Distribuição Operacional")
+    col_g3, col_g4 = st.columns(2)
+    with col_g3:
+        df_op = views.operation_totals(run_query, filters)
+        fig_pie_op = px.pie(df_op, names='OPERAÇÃO', values='LIBERADOS', title=f"Volume por Operação ({periodo_label})", hole=0.4)
+        fig_pie_op.update_traces(textinfo='percent+label')
+        st.plotly_chart(fig_pie_op, key="pie_op", width="stretch")
+    with col_g4:
+        fig_pie_transp = px.pie(df_transp, names='TRANSPORTADORA', values='LIBERADOS', title=f"Share de Volume ({periodo_label})", hole=0.4)
+        fig_pie_transp.update_traces(textinfo='percent+label', textposition='inside')
+        st.plotly_chart(fig_pie_transp, key="pie_transp", width="stretch")
+    
+    with st.expander("💡 Análise de Distribuição"):
+        st.markdown("""
+        *   **Por Operação:** Verifica se o esforço de fiscalização está proporcional ao volume de cada tipo de operação (LML, Direta, etc.).
+        *   **Share de Transportadora:** Mostra a representatividade de cada empresa. Transportadoras com maior fatia do gráfico devem ter atenção redobrada, pois qualquer desvio impacta muito o resultado global da unidade.
+        """)
+
+profile.mark("visão diária")
+with tab_dia:
+    render_tab_dia(filters, has_filtered_data, start_date, operacoes, transportadoras, transportadoras_grafico)
+
+profile.mark("visão mensal")
+with tab_mes:
+    render_tab_mes(filters, anos_label, transportadoras_grafico)
+
+profile.mark("visão anual")
+with tab_ano:
+    st.subheader("Análise Anual")
+    st.markdown("ℹ️ *Visão consolidada para relatórios gerenciais de longo prazo.*")
+    df_ano = views.group_other_carriers(views.yearly_totals(run_query, filters), transportadoras_grafico)
+    col_a1, col_a2 = st.columns(2)
+    with col_a1:
+        fig_vol_ano = px.bar(df_ano, x='Ano', y='LIBERADOS', color='TRANSPORTADORA', barmode='group', title=f"Fluxo de Saída por Ano ({anos_label})", text_auto=True)
+        fig_vol_ano.update_traces(textfont_size=14)
+        fig_vol_ano.update_layout(template="plotly_white", xaxis_title="Ano", yaxis_title="Volume")
+        st.plotly_chart(fig_vol_ano, key="ano_vol", width="stretch")
+        st.caption("📊 **Histórico:** Volume total de liberados por ano.")
+    with col_a2:
+        fig_malha_ano = px.bar(df_ano, x='Ano', y='MALHA_PCT', color='TRANSPORTADORA', title=f"Taxa de Retenção % por Ano ({anos_label})")
+        fig_malha_ano.update_traces(texttemplate='%{y:.2f}%', textposition='auto', textfont_size=14)
+        fig_malha_ano.update_layout(template="plotly_white", xaxis_title="Ano", yaxis_title="Retenção (%)")
+        st.plotly_chart(fig_malha_ano, key="ano_malha", width="stretch")
+        st.caption("🛡️ **Consolidado:** Taxa média anual de retenção para auditoria.")
+
+# --- 4. TABELA DE DADOS ---
+profile.mark("tabela detalhada")
+# Com on_change="rerun" o conteúdo só é executado com o expander aberto
+detalhes = st.expander("Ver Dados Detalhados", key="expander_detalhes", on_change="rerun")
+with detalhes:
+    if detalhes.open:
+        render_detail_table(filters)
+
+# Assinatura
+st.markdown("---")
+st.markdown("<div style='text-align: center'>Desenvolvido por <b>Clayton S. Silva</b></div>", unsafe_allow_html=True)
+
+st.session_state['ultimo_perfil'] = profile.finish()
+
+
+
+##  streamlit run app.py
@@ -0,0 +1,76 @@
+"""Exportação do relatório filtrado em xlsx, CSV ou Parquet.
+
+As linhas vêm do banco em blocos (queries.iter_rows) e são escritas à medida que chegam:
+o Excel usa um workbook write-only do openpyxl e o Parquet um ParquetWriter do pyarrow,
+então a memória depende do tamanho do bloco e não do número de linhas exportadas.
+"""
+import io
+
+import queries
+
+# formato -> (rótulo no dashboard, mime type)
+EXPORT_FORMATS = {
+    'xlsx': ('Excel (.xlsx)', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('CSV (.csv)', 'text/csv'),
+    'parquet': ('Parquet (.parquet)', 'application/vnd.apache.parquet'),
+}
+EXPORT_CHUNK_SIZE = 20_000
+
+
+def _write_xlsx(chunks, output):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Relatorio')
+    header_written = False
+    for chunk in chunks:
+        if not header_written:
+            sheet.append(list(chunk.columns))
+            header_written = True
+        chunk = chunk.assign(DATA=chunk['DATA'].dt.date)
+        for row in chunk.itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(output)
+
+
+def _write_csv(chunks, output):
+    # Mesmo padrão dos arquivos importados (';', vírgula decimal, dd/mm/aaaa),
+    # para que o relatório possa ser reimportado sem ajustes
+    text = io.TextIOWrapper(output, encoding='utf-8-sig', newline='')
+    header = True
+    for chunk in chunks:
+        chunk.to_csv(text, sep=';', decimal=',', index=False, header=header, date_format='%d/%m/%Y')
+        header = False
+    text.flush()
+    text.detach()
+
+
+def _write_parquet(chunks, output):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Esquema fixo para que todos os blocos sejam compatíveis
+    # (contagens como double: o SQLite aceita valores fracionários nessas colunas)
+    arrow_schema = pa.schema([
+        ('DATA', pa.timestamp('ms')),
+        ('TRANSPORTADORA', pa.string()),
+        ('OPERAÇÃO', pa.string()),
+        ('LIBERADOS', pa.float64()),
+        ('MALHA', pa.float64()),
+        ('Mês_Ano', pa.string()),
+        ('Ano', pa.string()),
+    ])
+    with pq.ParquetWriter(output, arrow_schema) as writer:
+        for chunk in chunks:
+            chunk = chunk.astype({'LIBERADOS': float, 'MALHA': float})
+            writer.write_table(pa.Table.from_pandas(chunk, schema=arrow_schema, preserve_index=False))
+
+
+WRITERS = {'xlsx': _write_xlsx, 'csv': _write_csv, 'parquet': _write_parquet}
+
+
+def export_report(engine, filters, fmt, chunksize=EXPORT_CHUNK_SIZE):
+    """Gera o relatório das linhas do filtro no formato pedido e retorna os bytes do arquivo."""
+    output = io.BytesIO()
+    WRITERS[fmt](queries.iter_rows(engine, filters, chunksize), output)
+    return output.getvalue()
@@ -0,0 +1,334 @@
+"""Leitura e limpeza de arquivos importados (CSV, Excel e SQLite), sem depender do Streamlit.
+
+clean_frame concentra a limpeza usada pelo dashboard (clean_dataframe) e pela
+importação em blocos: iter_chunks lê o arquivo em pedaços de tamanho fixo, para que
+a memória usada dependa do tamanho do bloco e não do tamanho do arquivo.
+read_clean_file e expand_archives servem à importação em lote (vários arquivos e .zip).
+"""
+import csv
+import io
+import os
+import sqlite3
+import tempfile
+import zipfile
+
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype
+
+import schema
+
+CANDIDATE_DELIMITERS = ';,\t|'
+SAMPLE_SIZE = 64 * 1024
+CHUNK_SIZE = 50_000
+
+# Formatos testados (nesta ordem) antes da inferência do pandas. O com microssegundos é o
+# que o próprio dashboard grava (um backup .db reimportado); pela inferência com dia
+# primeiro, datas ISO até o dia 12 sairiam com dia e mês trocados
+KNOWN_DATE_FORMATS = ['%d/%m/%Y', '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%d/%m/%Y %H:%M:%S',
+                      '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%d %H:%M', '%Y/%m/%d',
+                      '%d-%m-%Y', '%d.%m.%Y']
+# Valores que começam como data ISO (ano primeiro) e não casaram com os formatos acima
+# (fuso horário, 'T' sem segundos...) são lidos como ISO 8601, nunca com dia primeiro
+ISO_DATE_PATTERN = r'^\d{4}[-/]\d{1,2}[-/]\d{1,2}(?:[T ]|$)'
+# Números nesta faixa são lidos direto como serial do Excel (1954 a 2119);
+# os demais passam antes pela inferência, como na limpeza original
+EXCEL_SERIAL_RANGE = (20000, 80000)
+EXCEL_ORIGIN = '1899-12-30'
+# Número com '.' de milhar ('1.234', '12.345.678,5'); nos demais o '.' é o decimal ('10.0', '1.5')
+THOUSANDS_PATTERN = r'^\s*-?\d{1,3}(?:\.\d{3})+(?:,\d*)?\s*$'
+
+
+def _naive(dates):
+    """Remove o fuso (UTC) de datas lidas com utc=True; a coluna DATA não guarda fuso."""
+    return dates.dt.tz_localize(None)
+
+
+def parse_date_column(values, date_formats=None):
+    """Converte a coluna DATA parseando cada valor distinto uma única vez.
+
+    Os valores distintos passam pelos formatos conhecidos, depois pelo serial do Excel,
+    pela leitura ISO 8601 e, por último, pela inferência do pandas (dia primeiro); o resultado é mapeado de volta
+    para as linhas. `date_formats` é um dicionário por arquivo: guarda o formato detectado
+    em 'DATA' para que os próximos blocos do mesmo arquivo o testem primeiro.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    # 1. Converter para string e limpar espaços / 2. Corrigir erro comum 31/09
+    texts = pd.Series(uniques, dtype=object).astype(str).str.strip().str.replace('31/09', '30/09', regex=False)
+    parsed = pd.Series(pd.NaT, index=texts.index, dtype='datetime64[ns]')
+
+    # 3. Formatos explícitos, começando pelo já detectado neste arquivo
+    cached = (date_formats or {}).get('DATA')
+    formats = ([cached] if cached else []) + [f for f in KNOWN_DATE_FORMATS if f != cached]
+    best_format, best_hits = None, 0
+    for fmt in formats:
+        pending = parsed.isna()
+        if not pending.any():
+            break
+        attempt = pd.to_datetime(texts[pending], format=fmt, errors='coerce')
+        hits = int(attempt.notna().sum())
+        if hits:
+            parsed[pending] = attempt
+        if hits > best_hits:
+            best_format, best_hits = fmt, hits
+
+    # 4. Serial do Excel (ex: 45321) dentro de uma faixa de datas plausível
+    pending = parsed.isna()
+    if pending.any():
+        numbers = pd.to_numeric(texts[pending], errors='coerce')
+        serial = numbers[numbers.between(*EXCEL_SERIAL_RANGE)]
+        if not serial.empty:
+            parsed[serial.index] = pd.to_datetime(serial, unit='D', origin=EXCEL_ORIGIN)
+
+    # 5. Demais datas ISO; com fuso, convertidas para UTC e guardadas sem fuso
+    pending = parsed.isna() & texts.str.match(ISO_DATE_PATTERN)
+    if pending.any():
+        parsed[pending] = _naive(pd.to_datetime(texts[pending], format='ISO8601', utc=True, errors='coerce'))
+
+    # 6. O que sobrar segue a limpeza original: inferência (Dia/Mês/Ano) e, para o que
+    # falhar (NaT), nova tentativa como serial do Excel
+    pending = parsed.isna()
+    if pending.any():
+        parsed[pending] = _naive(pd.to_datetime(texts[pending], format='mixed', dayfirst=True, utc=True,
+                                                errors='coerce'))
+        pending = parsed.isna()
+        if pending.any():
+            try:
+                numeric_dates = pd.to_numeric(texts[pending], errors='coerce')
+                parsed[pending] = pd.to_datetime(numeric_dates, unit='D', origin=EXCEL_ORIGIN)
+            except:
+                pass
+
+    if date_formats is not None and best_format:
+        date_formats['DATA'] = best_format
+    return pd.Series(parsed.to_numpy()[codes], index=values.index)
+
+
+def clean_frame(df, date_formats=None):
+    """Realiza a limpeza e padronização dos dados.
+
+    Retorna (df_limpo, linhas_invalidas): linhas com DATA inválida ou vazia são removidas
+    e contadas, para que quem chama decida como avisar o usuário. `date_formats` é o
+    cache de formato de data do arquivo (ver parse_date_column).
+    """
+    # Padronizar nomes das colunas
+    df.columns = df.columns.astype(str).str.strip().str.upper()
+    linhas_invalidas = 0
+
+    if 'DATA' in df.columns:
+        # Só executa a limpeza pesada se NÃO for data ainda
+        if not is_datetime64_any_dtype(df['DATA']):
+            # Cada valor distinto é convertido uma única vez (logs têm poucas datas distintas)
+            df['DATA'] = parse_date_column(df['DATA'], date_formats)
+
+            # Verifica e remove linhas que continuam inválidas
+            linhas_invalidas = int(df['DATA'].isna().sum())
+            if linhas_invalidas > 0:
+                df = df.dropna(subset=['DATA'])
+
+    # Garantir numéricos
+    for col in ['LIBERADOS', 'MALHA']:
+        if col in df.columns:
+            # No pandas 3 colunas de texto têm dtype 'str' em vez de object
+            if df[col].dtype == 'object' or isinstance(df[col].dtype, pd.StringDtype):
+                # Decidido valor a valor, para o resultado não depender de como o arquivo
+                # foi dividido em blocos
+                texts = df[col].astype(str)
+                milhar = texts.str.match(THOUSANDS_PATTERN)
+                texts = texts.where(~milhar, texts.str.replace('.', '', regex=False))
+                df[col] = texts.str.replace(',', '.', regex=False)
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+
+    # Tipos compactos (categóricas, inteiros sem sinal e datas no dia) para reduzir a memória
+    return schema.compact_frame(df), linhas_invalidas
+
+
+# Colunas da grade de inserção manual, na ordem exibida
+ENTRY_COLUMNS = ['DATA', 'TRANSPORTADORA', 'OPERAÇÃO', 'LIBERADOS', 'MALHA']
+
+
+def empty_entries():
+    """Grade de inserção manual vazia, já com os tipos de cada coluna."""
+    return pd.DataFrame({
+        'DATA': pd.Series(dtype='datetime64[ns]'),
+        'TRANSPORTADORA': pd.Series(dtype=object),
+        'OPERAÇÃO': pd.Series(dtype=object),
+        'LIBERADOS': pd.Series(dtype='Int64'),
+        'MALHA': pd.Series(dtype='Int64'),
+    })
+
+
+def validate_entries(grid):
+    """Valida juntas as linhas digitadas na grade de inserção manual.
+
+    Linhas totalmente vazias são ignoradas. Retorna (linhas, erros): as linhas prontas
+    para gravar e as mensagens de erro, com o número da linha na grade. Se houver algum
+    erro nada deve ser gravado.
+    """
+    grid = grid.reset_index(drop=True)
+    grid = grid[grid.notna().any(axis=1)]
+    rows = pd.DataFrame({
+        'DATA': pd.to_datetime(grid['DATA'], errors='coerce').dt.normalize(),
+        'TRANSPORTADORA': grid['TRANSPORTADORA'].astype(object).where(grid['TRANSPORTADORA'].notna(), '').astype(str).str.strip(),
+        'OPERAÇÃO': grid['OPERAÇÃO'],
+        'LIBERADOS': pd.to_numeric(grid['LIBERADOS'], errors='coerce').fillna(0),
+        'MALHA': pd.to_numeric(grid['MALHA'], errors='coerce').fillna(0),
+    })
+
+    problems = [
+        (rows['DATA'].isna(), "data vazia ou inválida"),
+        (rows['TRANSPORTADORA'] == '', "transportadora obrigatória"),
+        (rows['OPERAÇÃO'].isna(), "operação obrigatória"),
+        ((rows['LIBERADOS'] < 0) | (rows['MALHA'] < 0), "quantidades não podem ser negativas"),
+        ((rows['LIBERADOS'] % 1 != 0) | (rows['MALHA'] % 1 != 0), "quantidades devem ser números inteiros"),
+    ]
+    erros = [f"Linha {i + 1}: {message}" for i in rows.index for mask, message in problems if mask[i]]
+    if not erros:
+        rows = rows.astype({'LIBERADOS': 'int64', 'MALHA': 'int64'})
+    return rows, erros
+
+
+def sniff_delimiter(file, sample_size=SAMPLE_SIZE):
+    """Detecta o separador do CSV lendo só uma amostra do início do arquivo.
+
+    A posição do arquivo é restaurada ao final.
+    """
+    position = file.tell()
+    sample = file.read(sample_size)
+    file.seek(position)
+    if isinstance(sample, bytes):
+        sample = sample.decode('utf-8', errors='ignore')
+    lines = sample.splitlines()
+    if not lines:
+        return ','
+
+    # O cabeçalho (DATA;TRANSPORTADORA;...) quase sempre basta para decidir
+    counts = {d: lines[0].count(d) for d in CANDIDATE_DELIMITERS}
+    best = max(counts, key=counts.get)
+    if counts[best] and list(counts.values()).count(counts[best]) == 1:
+        return best
+    try:
+        # Descarta a última linha, que pode ter sido cortada pela amostra
+        complete = '\n'.join(lines[:-1] if len(lines) > 1 else lines)
+        return csv.Sniffer().sniff(complete, delimiters=CANDIDATE_DELIMITERS).delimiter
+    except csv.Error:
+        return best if counts[best] else ','
+
+
+def _progress(file, size):
+    return min(file.tell() / size, 1.0) if size else None
+
+
+def iter_csv_chunks(file, chunksize=CHUNK_SIZE):
+    """Lê o CSV em blocos. Gera (bloco, fração_lida).
+
+    Tudo é lido como texto: inferir o tipo bloco a bloco faria '1.234' virar 1.234 num
+    bloco só de decimais e 1234 em outro; a conversão fica com clean_frame.
+    """
+    sep = sniff_delimiter(file)
+    file.seek(0, 2)
+    size = file.tell()
+    file.seek(0)
+    for chunk in pd.read_csv(file, sep=sep, dtype=str, chunksize=chunksize):
+        yield chunk, _progress(file, size)
+
+
+def iter_excel_chunks(file, chunksize=CHUNK_SIZE):
+    """Lê a primeira planilha do Excel linha a linha (openpyxl read-only). Gera (bloco, fração_lida)."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        total_rows = sheet.max_row or 0
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c) if c is not None else f'COL_{i}' for i, c in enumerate(header)]
+
+        buffer, read = [], 0
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunksize:
+                read += len(buffer)
+                yield pd.DataFrame(buffer, columns=columns), (min(read / total_rows, 1.0) if total_rows else None)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns), 1.0
+    finally:
+        workbook.close()
+
+
+def iter_sqlite_chunks(file, chunksize=CHUNK_SIZE, table_name='performance_logistica'):
+    """Lê um banco SQLite enviado (a tabela `table_name` ou a primeira). Gera (bloco, fração_lida)."""
+    # O sqlite3 só abre arquivos em disco: o conteúdo vai para um arquivo temporário
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp:
+        file.seek(0)
+        tmp.write(file.read())
+        tmp_path = tmp.name
+    conn = sqlite3.connect(tmp_path)
+    try:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY rowid")
+                  if row[0] != 'sqlite_sequence']
+        if not tables:
+            raise ValueError("O arquivo .db não contém tabelas de dados válidas.")
+        target = next((t for t in tables if t.lower() == table_name.lower()), tables[0])
+        total_rows = conn.execute(f'SELECT COUNT(*) FROM "{target}"').fetchone()[0]
+        read = 0
+        for chunk in pd.read_sql_query(f'SELECT * FROM "{target}"', conn, chunksize=chunksize):
+            read += len(chunk)
+            yield chunk, (min(read / total_rows, 1.0) if total_rows else None)
+    finally:
+        conn.close()
+        os.remove(tmp_path)
+
+
+def iter_chunks(file, name, chunksize=CHUNK_SIZE):
+    """Escolhe o leitor em blocos pelo nome do arquivo (.csv, .db ou Excel)."""
+    if name.lower().endswith('.csv'):
+        return iter_csv_chunks(file, chunksize)
+    if name.lower().endswith('.db'):
+        return iter_sqlite_chunks(file, chunksize)
+    return iter_excel_chunks(file, chunksize)
+
+
+# Extensões aceitas na importação em lote (também dentro de arquivos .zip)
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.db')
+
+
+def expand_archives(files):
+    """Troca cada .zip da lista [(nome, bytes)] pelos arquivos que ele contém, com o nome
+    'pacote.zip/arquivo' (pastas, arquivos ocultos e metadados do macOS são ignorados)."""
+    expanded = []
+    for name, data in files:
+        if not name.lower().endswith('.zip'):
+            expanded.append((name, data))
+            continue
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for member in archive.infolist():
+                base = os.path.basename(member.filename)
+                if member.is_dir() or base.startswith('.') or member.filename.startswith('__MACOSX/'):
+                    continue
+                expanded.extend(expand_archives([(f'{name}/{member.filename}', archive.read(member))]))
+    return expanded
+
+
+def read_clean_file(name, data):
+    """Lê e limpa um arquivo inteiro (CSV, Excel ou .db). Retorna (df_limpo, linhas_lidas, linhas_invalidas).
+
+    Executada nos processos da importação em lote (jobs.ImportJobs.import_batch): recebe e
+    devolve só objetos serializáveis. Os blocos de iter_chunks compartilham o formato de data.
+    """
+    if not name.lower().endswith(SUPPORTED_EXTENSIONS):
+        raise ValueError("Formato não suportado (use CSV, Excel ou DB).")
+    date_formats = {}
+    partes, lidas, invalidas = [], 0, 0
+    for chunk, _ in iter_chunks(io.BytesIO(data), name):
+        lidas += len(chunk)
+        chunk, linhas_invalidas = clean_frame(chunk, date_formats)
+        invalidas += linhas_invalidas
+        partes.append(chunk)
+    if not partes:
+        return pd.DataFrame(), 0, 0
+    # Blocos com categorias diferentes viram object no concat; compact_frame refaz as categorias
+    return schema.compact_frame(pd.concat(partes, ignore_index=True)), lidas, invalidas
@@ -0,0 +1,307 @@
+"""Importações em segundo plano.
+
+O arquivo enviado é lido, limpo e gravado em blocos por um thread de trabalho, fora da
+execução do script: a sessão do administrador continua usando o dashboard enquanto a
+importação avança. Cada importação tem um id, contadores de progresso (linhas lidas,
+limpas, inseridas, ignoradas por já existirem e rejeitadas na limpeza) e pode ser
+cancelada entre um bloco e outro. As gravações passam pela fila única de escrita
+(writer.py), um bloco por vez, então a importação não segura o lock de escrita do banco.
+
+Os blocos já gravados permanecem no banco quando a importação é cancelada ou falha;
+importar o mesmo arquivo de novo não duplica linhas (ver queries.fingerprints). Com a opção
+de substituir, os blocos vão para uma tabela de preparo e só trocam as linhas do banco em uma
+única escrita no fim (queries.replace_from_staging): cancelada ou com erro, a importação
+deixa o banco como estava.
+
+Um banco .db no formato do dashboard é mesclado direto pelo SQLite, em uma única escrita
+(queries.merge_database) que o cancelamento desfaz por inteiro; os demais seguem o caminho
+em blocos pelo pandas.
+
+Na importação em lote (vários arquivos, inclusive dentro de .zip) cada arquivo é lido e
+limpo em um processo separado, em paralelo, e as linhas de todos são gravadas juntas em uma
+única escrita, sem duplicadas; cada arquivo recebe o seu resumo (ImportJob.arquivos).
+"""
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import queries
+
+MAX_WORKERS = 2
+# Processos que leem e limpam os arquivos de uma importação em lote. Até MAX_WORKERS lotes
+# rodam juntos, então cada um fica com sua parte dos núcleos (nunca mais processos que núcleos)
+MAX_PROCESSES = max(1, (os.cpu_count() or 1) // MAX_WORKERS)
+# Importações mantidas no histórico do processo (as mais antigas já encerradas saem primeiro)
+MAX_HISTORY = 20
+
+QUEUED, RUNNING, DONE, CANCELLED, FAILED = 'na fila', 'importando', 'concluída', 'cancelada', 'erro'
+FINISHED = {DONE, CANCELLED, FAILED}
+
+
+class ImportJob:
+    """Estado de uma importação. Os contadores são atualizados pelo thread de trabalho."""
+
+    def __init__(self, name, replace):
+        self.job_id = uuid.uuid4().hex[:8]
+        self.name = name
+        self.replace = replace
+        self.status = QUEUED
+        self.lidas = self.limpas = self.inseridas = self.ignoradas = self.rejeitadas = 0
+        # Blocos já gravados no banco do dashboard (ficam lá se a importação for cancelada)
+        self.blocos_gravados = 0
+        self.fraction = 0.0
+        # Importação em lote: um resumo por arquivo (ver file_summary)
+        self.arquivos = []
+        self.error = None
+        self.started = self.finished = None
+        self._cancel = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    def cancel(self):
+        """Pede o cancelamento; a importação para antes do próximo bloco."""
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+def file_summary(name, erro=None):
+    """Resumo de um arquivo da importação em lote."""
+    return {'arquivo': name, 'lidas': 0, 'rejeitadas': 0, 'inseridas': 0, 'ignoradas': 0, 'erro': erro}
+
+
+class ImportJobs:
+    """Executa importações em um pool de threads e guarda o estado de cada uma pelo id.
+
+    `insert_rows(conn, df, cols, replace)` grava um bloco e retorna (df_inserido, ignoradas);
+    é executada pela fila de escrita `write_queue`.
+    """
+
+    def __init__(self, write_queue, insert_rows, columns, max_workers=MAX_WORKERS):
+        self.write_queue = write_queue
+        self.insert_rows = insert_rows
+        self.columns = list(columns)
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='dashboard-import')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def import_file(self, name, data, replace=False):
+        """Importa o conteúdo (bytes) de um arquivo CSV, Excel ou .db, lido e limpo em blocos."""
+        return self._submit(name, replace, self._run, lambda: ingest.iter_chunks(io.BytesIO(data), name), True)
+
+    def import_frame(self, name, df, replace=False):
+        """Grava um DataFrame já limpo (ex.: o da pré-visualização do upload)."""
+        return self._submit(name, replace, self._run, lambda: iter([(df, 1.0)]), False)
+
+    def import_database(self, name, data, replace=False):
+        """Importa o conteúdo (bytes) de um banco .db: mesclado pelo SQLite quando a tabela está
+        no formato do dashboard, senão lido e limpo em blocos como em import_file."""
+        return self._submit(name, replace, self._run_database, data)
+
+    def import_batch(self, name, files, replace=False):
+        """Importa vários arquivos [(nome, bytes)] de uma vez (os .zip são abertos): lidos e
+        limpos em paralelo, em processos, e gravados juntos em uma única escrita sem duplicadas.
+
+        Quando a mesma linha aparece em mais de um arquivo, ela conta como inserida no
+        primeiro (na ordem da lista) e como ignorada nos demais.
+        """
+        return self._submit(name, replace, self._run_batch, list(files))
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _submit(self, name, replace, run, *args):
+        job = ImportJob(name, replace)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            finished = [key for key, old in self._jobs.items() if old.done]
+            for key in finished[:max(0, len(self._jobs) - MAX_HISTORY)]:
+                del self._jobs[key]
+        self._executor.submit(run, job, *args)
+        return job
+
+    def _run_database(self, job, data):
+        job.started = time.time()
+        job.status = RUNNING
+        status, error = DONE, None
+        # O SQLite só anexa arquivos em disco
+        with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp:
+            tmp.write(data)
+        try:
+            # Sozinha no lote: o cancelamento desfaz a transação inteira (ver merge_database)
+            counts = self.write_queue.run(queries.merge_database, tmp.name, job.replace,
+                                          lambda: job.cancel_requested, refresh=False, exclusive=True)
+        except Exception as exc:
+            # Cancelada ou com erro, a mesclagem é desfeita por inteiro
+            counts = {}
+            status, error = (CANCELLED, None) if job.cancel_requested else (FAILED, str(exc))
+        finally:
+            # O writer só devolve o resultado depois do DETACH
+            os.remove(tmp.name)
+
+        if counts is None:
+            # Tabela fora do formato que o SQL normaliza: caminho pelo pandas, em blocos
+            self._run(job, lambda: ingest.iter_chunks(io.BytesIO(data), job.name), True)
+            return
+        if counts:
+            job.lidas, job.rejeitadas = counts['lidas'], counts['rejeitadas']
+            job.limpas = job.lidas - job.rejeitadas
+            job.inseridas, job.ignoradas = counts['inseridas'], counts['ignoradas']
+            job.fraction = 1.0
+            self.write_queue.sync()
+        job.error, job.finished, job.status = error, time.time(), status
+
+    def _run(self, job, read_chunks, clean):
+        job.started = time.time()
+        job.status = RUNNING
+        status, error = DONE, None
+        # Formato de data detectado no primeiro bloco, reaproveitado nos seguintes
+        date_formats = {}
+        # Substituição: os blocos vão para a tabela de preparo e trocam as linhas do banco no fim
+        staging = f'{queries.STAGING_PREFIX}{job.job_id}' if job.replace else None
+        try:
+            for chunk, fraction in read_chunks():
+                if job.cancel_requested:
+                    status = CANCELLED
+                    break
+                job.lidas += len(chunk)
+                if clean:
+                    chunk, linhas_invalidas = ingest.clean_frame(chunk, date_formats)
+                    job.rejeitadas += linhas_invalidas
+                job.limpas += len(chunk)
+                cols = [c for c in self.columns if c in chunk.columns]
+                if not cols:
+                    raise ValueError("O arquivo não contém as colunas necessárias.")
+                # O esquema é conferido uma vez, no fim (write_queue.sync)
+                if staging:
+                    inserted = self.write_queue.run(queries.stage_rows, staging, chunk[cols], refresh=False)
+                    skipped = len(chunk) - len(inserted)
+                else:
+                    inserted, skipped = self.write_queue.run(self.insert_rows, chunk, cols, False, refresh=False)
+                    job.blocos_gravados += 1
+                job.inseridas += len(inserted)
+                job.ignoradas += skipped
+                if fraction is not None:
+                    job.fraction = fraction
+            if staging and status == DONE:
+                if job.cancel_requested:
+                    status = CANCELLED
+                else:
+                    job.inseridas = self.write_queue.run(queries.replace_from_staging, staging, refresh=False)
+        except Exception as exc:
+            status, error = FAILED, str(exc)
+        finally:
+            if staging and status != DONE:
+                # Nada do preparo chegou ao banco
+                job.inseridas = job.ignoradas = 0
+                try:
+                    self.write_queue.run(queries.drop_staging, staging, refresh=False)
+                except Exception:
+                    # Tabela de preparo esquecida no banco; não altera os dados do dashboard
+                    pass
+            self.write_queue.sync()
+            if status == DONE:
+                job.fraction = 1.0
+            # O status final vem por último: quem o vê encerrado já encontra o banco atualizado
+            job.error, job.finished, job.status = error, time.time(), status
+
+    def _run_batch(self, job, files):
+        job.started = time.time()
+        job.status = RUNNING
+        status, error = DONE, None
+        try:
+            # Um resumo por arquivo, na ordem do envio (os de cada .zip no lugar dele);
+            # _read_files preenche os dos arquivos lidos
+            summaries, members, member_summaries = [], [], []
+            for name, data in files:
+                try:
+                    expanded = ingest.expand_archives([(name, data)])
+                except zipfile.BadZipFile:
+                    summaries.append(file_summary(name, "Arquivo .zip inválido."))
+                    continue
+                for member, member_data in expanded:
+                    summary = file_summary(member)
+                    summaries.append(summary)
+                    members.append((member, member_data))
+                    member_summaries.append(summary)
+            job.arquivos = summaries
+            frames = self._read_files(job, members, member_summaries)
+            if job.cancel_requested:
+                status = CANCELLED
+            elif frames:
+                self._write_batch(job, frames)
+        except Exception as exc:
+            status, error = FAILED, str(exc)
+        finally:
+            if status == DONE:
+                job.fraction = 1.0
+            job.error, job.finished, job.status = error, time.time(), status
+
+    def _read_files(self, job, members, summaries):
+        """Lê e limpa os arquivos em paralelo, preenchendo o resumo de cada um (`summaries[i]` é
+        o de `members[i]`). Retorna [(resumo, df)] na ordem de `members`, só dos arquivos com
+        linhas válidas."""
+        if not members:
+            return []
+        results = [None] * len(members)
+        # spawn: o processo do Streamlit tem threads, e um fork copiaria os locks deles
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(min(MAX_PROCESSES, len(members)), mp_context=context) as pool:
+            futures = {pool.submit(ingest.read_clean_file, name, data): i for i, (name, data) in enumerate(members)}
+            for count, future in enumerate(as_completed(futures), 1):
+                if job.cancel_requested:
+                    pool.shutdown(cancel_futures=True)
+                    return []
+                i = futures[future]
+                summary = summaries[i]
+                try:
+                    df, lidas, rejeitadas = future.result()
+                except Exception as exc:
+                    summary['erro'] = str(exc)
+                    df = None
+                else:
+                    summary.update(lidas=lidas, rejeitadas=rejeitadas)
+                    if not any(c in df.columns for c in self.columns):
+                        summary['erro'] = "O arquivo não contém as colunas necessárias."
+                        df = None
+                    job.lidas += lidas
+                    job.rejeitadas += rejeitadas
+                    job.limpas += 0 if df is None else len(df)
+                results[i] = (summary, df)
+                # A leitura vale 90% do progresso; a gravação, o restante
+                job.fraction = 0.9 * count / len(members)
+        return [(summary, df) for summary, df in results if df is not None and not df.empty]
+
+    def _write_batch(self, job, frames):
+        """Grava as linhas de todos os arquivos em uma única escrita e distribui os contadores."""
+        merged = pd.concat([df for _, df in frames], ignore_index=True)
+        # Arquivo de origem de cada linha de `merged` (o índice das inseridas aponta para ele)
+        origem = np.repeat(np.arange(len(frames)), [len(df) for _, df in frames])
+        cols = [c for c in self.columns if c in merged.columns]
+        inserted, skipped = self.write_queue.run(self.insert_rows, merged, cols, job.replace)
+        por_arquivo = np.bincount(origem[inserted.index.to_numpy()], minlength=len(frames))
+        for (summary, df), inseridas in zip(frames, por_arquivo):
+            summary['inseridas'] = int(inseridas)
+            summary['ignoradas'] = len(df) - int(inseridas)
+        job.inseridas += len(inserted)
+        job.ignoradas += skipped
@@ -0,0 +1,46 @@
+"""Métricas do dashboard calculadas de forma vetorizada (coluna a coluna).
+
+Mesma regra da antiga calculate_retention_rate aplicada linha a linha:
+taxa de retenção = (MALHA / (LIBERADOS + MALHA)) * 100, arredondada em 2 casas,
+e 0.0 quando o total é zero.
+"""
+import numpy as np
+
+
+def retention_rate(liberados, malha):
+    """Taxa de retenção (%) elemento a elemento. Aceita Series, arrays ou escalares."""
+    liberados = np.asarray(liberados, dtype=float)
+    malha = np.asarray(malha, dtype=float)
+    total = liberados + malha
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.where(total == 0, 0.0, np.round(malha / total * 100, 2))
+    return rate if rate.ndim else float(rate)
+
+
+def with_retention(df, column='MALHA_PCT'):
+    """Retorna uma cópia do DataFrame com a coluna de taxa de retenção."""
+    return df.assign(**{column: retention_rate(df['LIBERADOS'], df['MALHA'])})
+
+
+def with_totals(df):
+    """Retorna uma cópia com TOTAL GERAL e % MALHA (colunas da tabela detalhada e do Excel)."""
+    return df.assign(**{
+        'TOTAL GERAL': df['LIBERADOS'] + df['MALHA'],
+        '% MALHA': retention_rate(df['LIBERADOS'], df['MALHA']),
+    })
+
+
+def summarize(liberados, malha):
+    """Totais de um período: veículos, liberados, malha e taxa global (sem arredondar)."""
+    veiculos = liberados + malha
+    return {
+        'veiculos': veiculos,
+        'liberados': liberados,
+        'malha': malha,
+        'taxa': (malha / veiculos * 100) if veiculos > 0 else 0,
+    }
+
+
+def period_deltas(current, previous):
+    """Diferença campo a campo entre dois resumos de período (ver summarize)."""
+    return {key: current[key] - previous[key] for key in current}
@@ -0,0 +1,129 @@
+"""Medição leve de tempo e memória por etapa de cada execução do dashboard.
+
+O script chama `mark('etapa')` nos pontos de divisa entre seções: cada marca fecha a etapa
+anterior (tempo de parede e variação da memória residente do processo) e abre a próxima.
+`finish()` devolve o registro da execução e, se o log de tempos estiver ligado (variável de
+ambiente DASHBOARD_TIMING_LOG com o caminho do arquivo), o grava como uma linha JSON. O log
+é rotacionado ao passar de MAX_LOG_BYTES e pode ser agregado entre sessões com
+`python profiling.py [arquivo.jsonl]`.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+
+# Desligado por padrão: cada rerun de cada sessão geraria uma linha
+LOG_PATH = os.environ.get('DASHBOARD_TIMING_LOG') or None
+DEFAULT_LOG_PATH = 'dashboard_timings.jsonl'
+# Ao passar deste tamanho o log vira '<arquivo>.1' (substituindo o anterior) e recomeça
+MAX_LOG_BYTES = 10 * 1024 ** 2
+_log_lock = threading.Lock()
+
+
+def rss_mb():
+    """Memória residente do processo em MB (None se não for possível medir)."""
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Sem /proc, só o pico está disponível (KB no Linux, bytes no macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        return None
+
+
+class RerunProfile:
+    """Etapas de uma execução do script: [{'etapa', 'segundos', 'memoria_mb'}]."""
+
+    def __init__(self, kind='rerun', session=None):
+        self.kind = kind
+        self.session = session
+        self.stages = []
+        self._started = time.perf_counter()
+        self._current = None
+
+    def mark(self, name):
+        """Fecha a etapa em andamento (se houver) e inicia `name`."""
+        now, memory = time.perf_counter(), rss_mb()
+        if self._current is not None:
+            stage, started, memory_start = self._current
+            delta = None if memory is None or memory_start is None else round(memory - memory_start, 2)
+            self.stages.append({'etapa': stage, 'segundos': round(now - started, 4), 'memoria_mb': delta})
+        self._current = (name, now, memory) if name is not None else None
+
+    def record(self):
+        memory = rss_mb()
+        return {
+            'ts': pd.Timestamp.now().isoformat(timespec='milliseconds'),
+            'tipo': self.kind,
+            'sessao': self.session,
+            'total_s': round(time.perf_counter() - self._started, 4),
+            'memoria_rss_mb': None if memory is None else round(memory, 1),
+            'etapas': self.stages,
+        }
+
+    def finish(self, log_path=LOG_PATH):
+        """Encerra a última etapa, grava o registro no log (se ligado) e o retorna."""
+        self.mark(None)
+        record = self.record()
+        append_log(record, log_path)
+        return record
+
+
+def append_log(record, log_path=LOG_PATH):
+    """Acrescenta um registro (uma linha JSON) ao log. Sem `log_path` não grava nada;
+    falhas de escrita não interrompem o dashboard."""
+    if not log_path:
+        return
+    line = json.dumps(record, ensure_ascii=False) + '\n'
+    try:
+        with _log_lock:
+            if os.path.exists(log_path) and os.path.getsize(log_path) >= MAX_LOG_BYTES:
+                os.replace(log_path, log_path + '.1')
+            with open(log_path, 'a', encoding='utf-8') as fp:
+                fp.write(line)
+    except OSError:
+        pass
+
+
+def timed_call(kind, func, *args, session=None, log_path=LOG_PATH):
+    """Executa func(*args) registrando seu tempo como um registro próprio (ex.: exportação)."""
+    profile = RerunProfile(kind, session)
+    profile.mark(kind)
+    try:
+        return func(*args)
+    finally:
+        profile.finish(log_path)
+
+
+def summarize_log(log_path=DEFAULT_LOG_PATH):
+    """Agrega o log: quantidade, média, p50, p95 e máximo (s) por tipo de registro e etapa."""
+    rows = []
+    with open(log_path, encoding='utf-8') as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            rows.append({'tipo': record['tipo'], 'etapa': 'TOTAL', 'segundos': record['total_s']})
+            rows += [{'tipo': record['tipo'], 'etapa': s['etapa'], 'segundos': s['segundos']} for s in record['etapas']]
+    if not rows:
+        return pd.DataFrame(columns=['tipo', 'etapa', 'execucoes', 'media_s', 'p50_s', 'p95_s', 'max_s'])
+    grouped = pd.DataFrame(rows).groupby(['tipo', 'etapa'], sort=False)['segundos']
+    return pd.DataFrame({
+        'execucoes': grouped.count(),
+        'media_s': grouped.mean(),
+        'p50_s': grouped.median(),
+        'p95_s': grouped.quantile(0.95),
+        'max_s': grouped.max(),
+    }).round(4).reset_index()
+
+
+if __name__ == '__main__':
+    print(summarize_log(sys.argv[1] if len(sys.argv) > 1 else LOG_PATH or DEFAULT_LOG_PATH).to_string(index=False))
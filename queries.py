@@ -0,0 +1,943 @@
+"""Camada de acesso ao banco do dashboard.
+
+Traduz os filtros da barra lateral (ano, período, operação e transportadora) em SQL
+parametrizado com GROUP BY, para que apenas resultados agregados saiam do banco.
+As agregações leem das tabelas de resumo (anual, mensal e diária), mantidas na mesma
+transação de cada escrita por append_rows/clear_rows.
+Não depende do Streamlit: recebe sempre a engine SQLAlchemy como parâmetro.
+"""
+import hashlib
+import itertools
+import sqlite3
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
+
+import schema
+
+TABLE_NAME = 'performance_logistica'
+
+# Tabela de controle com o contador de versão dos dados (incrementado a cada escrita)
+META_TABLE = 'dashboard_meta'
+
+# Resultados de consultas pré-calculados em lote (ver views.py), válidos só para a versão
+# dos dados em que foram gerados
+CACHE_TABLE = 'dashboard_cache'
+
+# Tempo máximo que uma conexão espera por um lock do SQLite antes de "database is locked"
+BUSY_TIMEOUT_S = 30
+
+# Índices criados na inicialização para acelerar os filtros mais usados. O de DATA inclui
+# TRANSPORTADORA para servir também à ordem padrão da tabela detalhada (ver fetch_page)
+INDEXES = {
+    'idx_performance_data_transportadora': ('DATA', 'TRANSPORTADORA'),
+    'idx_performance_transportadora': ('TRANSPORTADORA',),
+    'idx_performance_operacao': ('OPERAÇÃO',),
+}
+# Índices de versões anteriores, cobertos pelos atuais (removidos para não pesar nas escritas)
+OBSOLETE_INDEXES = ['idx_performance_data']
+# Sem estatísticas (ANALYZE) o SQLite escolhe o índice de OPERAÇÃO, pouco seletivo, para os
+# filtros combinados. Elas são refeitas quando o total de linhas muda mais que este fator
+STATS_DRIFT = 2
+# Chave de META_TABLE com o total de linhas de performance_logistica, mantido pelas escritas
+# (append_rows, clear_rows, merge_database) para não rodar COUNT(*) depois de cada lote
+ROW_COUNT_KEY = 'linhas'
+
+# Impressão digital de cada linha (ver fingerprints), com índice único: linhas repetidas são
+# descartadas pelo próprio banco, olhando só o lote inserido e não a tabela inteira
+FINGERPRINT_COLUMN = 'FINGERPRINT'
+FINGERPRINT_INDEX = 'idx_performance_fingerprint'
+FINGERPRINT_CHUNK_SIZE = 20_000
+# Parâmetros por consulta IN (abaixo do limite das versões antigas do SQLite)
+MAX_SQL_PARAMS = 900
+
+# Expressões SQL para cada chave de agrupamento usada nas abas
+GROUP_EXPRESSIONS = {
+    'DATA': 'date("DATA")',
+    'Mês_Ano': 'strftime(\'%Y-%m\', "DATA")',
+    'Ano': 'strftime(\'%Y\', "DATA")',
+    'Dia_Semana': 'CAST(strftime(\'%w\', "DATA") AS INTEGER)',
+    'TRANSPORTADORA': '"TRANSPORTADORA"',
+    'OPERAÇÃO': '"OPERAÇÃO"',
+}
+
+# Colunas pelas quais a tabela detalhada pode ser ordenada (ver fetch_page); as derivadas
+# repetem o cálculo de metrics.with_totals
+DETAIL_SORT_EXPRESSIONS = {
+    'DATA': '"DATA"',
+    'TRANSPORTADORA': '"TRANSPORTADORA"',
+    'OPERAÇÃO': '"OPERAÇÃO"',
+    'LIBERADOS': '"LIBERADOS"',
+    'MALHA': '"MALHA"',
+    'TOTAL GERAL': '("LIBERADOS" + "MALHA")',
+    '% MALHA': 'CASE WHEN "LIBERADOS" + "MALHA" = 0 THEN 0 ELSE ROUND("MALHA" * 100.0 / ("LIBERADOS" + "MALHA"), 2) END',
+}
+
+# strftime('%w') devolve 0 para domingo
+WEEKDAY_NAMES = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+# Tabelas de resumo por período x TRANSPORTADORA x OPERAÇÃO, da menor para a maior:
+# (tabela, formato do início do período, chaves de agrupamento que ela responde).
+# A coluna DATA guarda o início do período ('YYYY-01-01', 'YYYY-MM-01' ou 'YYYY-MM-DD'),
+# assim os mesmos filtros e GROUP_EXPRESSIONS servem para todas elas.
+ROLLUPS = [
+    ('performance_anual', '%Y-01-01', {'Ano', 'TRANSPORTADORA', 'OPERAÇÃO'}),
+    ('performance_mensal', '%Y-%m-01', {'Ano', 'Mês_Ano', 'TRANSPORTADORA', 'OPERAÇÃO'}),
+    ('performance_diaria', '%Y-%m-%d', set(GROUP_EXPRESSIONS)),
+]
+
+
+@dataclass(frozen=True)
+class QueryFilters:
+    """Filtros do dashboard. None significa 'sem filtro' naquela dimensão."""
+    anos: tuple = None
+    start_date: object = None
+    end_date: object = None
+    operacoes: tuple = None
+    transportadoras: tuple = None
+
+    def replace(self, **changes):
+        return replace(self, **changes)
+
+
+def _as_tuple(values):
+    if values is None:
+        return None
+    # Converte escalares numpy (ex.: anos vindos de .unique()) em tipos Python
+    return tuple(v.item() if hasattr(v, 'item') else v for v in values)
+
+
+def make_filters(anos=None, start_date=None, end_date=None, operacoes=None, transportadoras=None):
+    """Cria um QueryFilters convertendo listas/arrays em tuplas (hasheáveis)."""
+    return QueryFilters(
+        anos=_as_tuple(anos),
+        start_date=start_date,
+        end_date=end_date,
+        operacoes=_as_tuple(operacoes),
+        transportadoras=_as_tuple(transportadoras),
+    )
+
+
+def _day(value):
+    """Formata uma data como 'YYYY-MM-DD' (formato comparável com o texto salvo no SQLite)."""
+    return pd.to_datetime(value).strftime('%Y-%m-%d')
+
+
+def _next_day(value):
+    return (pd.to_datetime(value).normalize() + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def build_where(filters):
+    """Monta a cláusula WHERE, os parâmetros e os bindparams expansíveis do filtro."""
+    clauses, params, expanding = [], {}, []
+
+    if filters.anos is not None:
+        if not filters.anos:
+            clauses.append('1 = 0')
+        else:
+            # Cada ano vira um intervalo de datas, para aproveitar o índice em DATA
+            year_clauses = []
+            for i, ano in enumerate(sorted(int(a) for a in filters.anos)):
+                year_clauses.append(f'("DATA" >= :ano_ini_{i} AND "DATA" < :ano_fim_{i})')
+                params[f'ano_ini_{i}'] = f'{ano:04d}-01-01'
+                params[f'ano_fim_{i}'] = f'{ano + 1:04d}-01-01'
+            clauses.append('(' + ' OR '.join(year_clauses) + ')')
+
+    if filters.start_date is not None:
+        clauses.append('"DATA" >= :data_ini')
+        params['data_ini'] = _day(filters.start_date)
+    if filters.end_date is not None:
+        clauses.append('"DATA" < :data_fim')
+        params['data_fim'] = _next_day(filters.end_date)
+
+    for column, name, values in [('OPERAÇÃO', 'operacoes', filters.operacoes),
+                                 ('TRANSPORTADORA', 'transportadoras', filters.transportadoras)]:
+        if values is None:
+            continue
+        if not values:
+            clauses.append('1 = 0')
+        else:
+            clauses.append(f'"{column}" IN :{name}')
+            params[name] = list(values)
+            expanding.append(name)
+
+    where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+    return where, params, expanding
+
+
+def _is_period_start(value, date_format):
+    """Indica se a data é o início de um período do resumo (ex.: dia 1 para o mensal)."""
+    day = pd.to_datetime(value).normalize()
+    return day.strftime(date_format) == day.strftime('%Y-%m-%d')
+
+
+def source_table(filters, group_by=()):
+    """Escolhe a menor tabela de resumo capaz de responder à consulta.
+
+    Um resumo mensal/anual só serve se o período filtrado cobre meses/anos inteiros.
+    """
+    for table, date_format, keys in ROLLUPS:
+        if not set(group_by) <= keys:
+            continue
+        if filters.start_date is not None and not _is_period_start(filters.start_date, date_format):
+            continue
+        if filters.end_date is not None and not _is_period_start(_next_day(filters.end_date), date_format):
+            continue
+        return table
+    return TABLE_NAME
+
+
+def _statement(sql, expanding):
+    statement = text(sql)
+    if expanding:
+        statement = statement.bindparams(*[bindparam(name, expanding=True) for name in expanding])
+    return statement
+
+
+def _run(engine, sql, params, expanding):
+    statement = _statement(sql, expanding)
+    with engine.connect() as conn:
+        return pd.read_sql(statement, con=conn, params=params)
+
+
+def create_database_engine(url):
+    """Engine do banco principal: SQLite em modo WAL, com espera por locks (busy timeout).
+
+    No WAL os leitores continuam vendo a última versão confirmada enquanto uma escrita
+    está em andamento. O controle de transações sai do driver (que não suporta SAVEPOINT)
+    e passa para o SQLAlchemy; a opção de execução `immediate=True` abre a transação com
+    BEGIN IMMEDIATE, reservando o lock de escrita logo no início (ver begin_write).
+    """
+    engine = create_engine(url, connect_args={'timeout': BUSY_TIMEOUT_S})
+
+    @event.listens_for(engine, 'connect')
+    def _configure(dbapi_connection, _):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def _begin(conn):
+        conn.exec_driver_sql('BEGIN IMMEDIATE' if conn.get_execution_options().get('immediate') else 'BEGIN')
+
+    return engine
+
+
+def begin_write(engine):
+    """Transação de escrita: com BEGIN IMMEDIATE a espera pelo lock acontece no início
+    (dentro do busy timeout), e não na primeira escrita depois de uma leitura, quando o
+    SQLite desiste na hora se outra conexão gravou nesse meio tempo."""
+    return engine.execution_options(immediate=True).begin()
+
+
+def connect_write(engine):
+    """Conexão de escrita em que cada conn.begin() abre BEGIN IMMEDIATE (como begin_write).
+
+    Usada pela fila de escrita, que ainda executa na mesma conexão, depois do fim da
+    transação, os comandos agendados com after_transaction.
+    """
+    return engine.execution_options(immediate=True).connect()
+
+
+def after_transaction(conn, sql):
+    """Agenda `sql` para depois do COMMIT/ROLLBACK (ex.: DETACH, recusado dentro da transação)."""
+    conn.info.setdefault('depois_da_transacao', []).append(sql)
+
+
+def run_after_transaction(conn):
+    """Executa fora de transação, direto no driver (autocommit), o que after_transaction agendou."""
+    for sql in conn.info.pop('depois_da_transacao', []):
+        try:
+            conn.connection.driver_connection.execute(sql)
+        except sqlite3.Error:
+            # Ex.: DETACH que falhou; o banco anexado só sai quando a conexão fechar
+            # (os apelidos são únicos, então não atrapalha as próximas escritas)
+            pass
+
+
+def table_exists(engine):
+    return inspect(engine).has_table(TABLE_NAME)
+
+
+def ensure_schema(engine):
+    """Cria (se ainda não existirem) a tabela de controle, as tabelas de resumo e os índices.
+
+    Uma tabela de resumo criada agora é preenchida a partir de performance_logistica.
+    Também mantém as estatísticas dos índices, usadas pelo SQLite para escolher o índice
+    de cada consulta (ver _refresh_statistics).
+    """
+    with begin_write(engine) as conn:
+        apply_schema(conn)
+
+
+def apply_schema(conn):
+    """Corpo de ensure_schema para uma transação já aberta (ex.: um job da fila de escrita)."""
+    conn.execute(text(f'CREATE TABLE IF NOT EXISTS {META_TABLE} (chave TEXT PRIMARY KEY, valor INTEGER NOT NULL)'))
+    conn.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (chave TEXT PRIMARY KEY, data_version INTEGER NOT NULL, '
+        f'formato TEXT NOT NULL, conteudo BLOB NOT NULL, calculado_em TEXT NOT NULL)'
+    ))
+    has_base = inspect(conn).has_table(TABLE_NAME)
+    if has_base:
+        for index_name, columns in INDEXES.items():
+            column_list = ', '.join(f'"{column}"' for column in columns)
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS {index_name} ON {TABLE_NAME} ({column_list})'))
+        for index_name in OBSOLETE_INDEXES:
+            conn.execute(text(f'DROP INDEX IF EXISTS {index_name}'))
+        _ensure_fingerprints(conn)
+        _refresh_statistics(conn)
+    for table, date_format, _ in ROLLUPS:
+        if inspect(conn).has_table(table):
+            continue
+        conn.execute(text(
+            f'CREATE TABLE {table} ("DATA" TEXT, "TRANSPORTADORA" TEXT, "OPERAÇÃO" TEXT, '
+            f'"LIBERADOS" NUMERIC NOT NULL DEFAULT 0, "MALHA" NUMERIC NOT NULL DEFAULT 0, '
+            f'PRIMARY KEY ("DATA", "TRANSPORTADORA", "OPERAÇÃO"))'
+        ))
+        if has_base:
+            _fill_rollup(conn, table, date_format)
+
+
+def _refresh_statistics(conn):
+    """Roda ANALYZE na tabela base se ela nunca foi analisada ou mudou de tamanho (STATS_DRIFT).
+
+    O ANALYZE completo custa ~0,3 s por milhão de linhas, por isso não roda a cada escrita.
+    O total de linhas vem do contador de META_TABLE; o COUNT(*) só roda se ele não existir.
+    """
+    rows = conn.execute(text(f'SELECT valor FROM {META_TABLE} WHERE chave = :chave'), {'chave': ROW_COUNT_KEY}).scalar()
+    if rows is None:
+        rows = conn.execute(text(f'SELECT COUNT(*) FROM {TABLE_NAME}')).scalar()
+        _set_row_count(conn, rows)
+    analyzed = None
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")).first():
+        stat = conn.execute(text('SELECT stat FROM sqlite_stat1 WHERE tbl = :tabela LIMIT 1'),
+                            {'tabela': TABLE_NAME}).scalar()
+        analyzed = int(stat.split()[0]) if stat else None
+    if analyzed is None or not analyzed / STATS_DRIFT <= rows <= analyzed * STATS_DRIFT:
+        conn.execute(text(f'ANALYZE {TABLE_NAME}'))
+
+
+def _ensure_fingerprints(conn):
+    """Cria a coluna de impressão digital e o índice único, preenchendo as linhas existentes.
+
+    Se o banco já tiver linhas repetidas, só a primeira de cada grupo recebe a impressão
+    digital; as cópias ficam com NULL (não conflita no índice único) e nada é apagado.
+    """
+    columns = {column['name'] for column in inspect(conn).get_columns(TABLE_NAME)}
+    if FINGERPRINT_COLUMN not in columns:
+        conn.execute(text(f'ALTER TABLE {TABLE_NAME} ADD COLUMN "{FINGERPRINT_COLUMN}" BIGINT'))
+        seen = set()
+        sql = f'SELECT rowid AS id, "DATA", "TRANSPORTADORA", "OPERAÇÃO", "LIBERADOS", "MALHA" FROM {TABLE_NAME} ORDER BY rowid'
+        # Lê tudo antes de atualizar: o cursor não pode continuar aberto durante os UPDATEs
+        chunks = list(pd.read_sql(text(sql), con=conn, chunksize=FINGERPRINT_CHUNK_SIZE))
+        for chunk in chunks:
+            chunk = chunk.assign(fp=fingerprints(chunk))
+            first = chunk[~chunk['fp'].duplicated() & ~chunk['fp'].isin(seen)]
+            seen.update(first['fp'])
+            if not first.empty:
+                conn.execute(text(f'UPDATE {TABLE_NAME} SET "{FINGERPRINT_COLUMN}" = :fp WHERE rowid = :id'),
+                             first[['id', 'fp']].astype(object).to_dict('records'))
+    conn.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS {FINGERPRINT_INDEX} ON {TABLE_NAME} ("{FINGERPRINT_COLUMN}")'))
+
+
+def _rollup_select(date_format, source=TABLE_NAME, where=''):
+    return (
+        f'SELECT strftime(\'{date_format}\', "DATA") AS "DATA", "TRANSPORTADORA", "OPERAÇÃO", '
+        f'COALESCE(SUM("LIBERADOS"), 0) AS "LIBERADOS", COALESCE(SUM("MALHA"), 0) AS "MALHA" '
+        f'FROM {source} {where} GROUP BY 1, 2, 3'
+    )
+
+
+def _fill_rollup(conn, table, date_format):
+    conn.execute(text(
+        f'INSERT INTO {table} ("DATA", "TRANSPORTADORA", "OPERAÇÃO", "LIBERADOS", "MALHA") '
+        + _rollup_select(date_format)
+    ))
+
+
+def rebuild_rollups(engine):
+    """Recalcula todas as tabelas de resumo a partir de performance_logistica.
+
+    Também incrementa a versão dos dados, descartando caches e pré-cálculos
+    (o banco pode ter sido alterado fora do dashboard).
+    """
+    ensure_schema(engine)
+    with begin_write(engine) as conn:
+        refill_rollups(conn)
+
+
+def refill_rollups(conn):
+    """Corpo de rebuild_rollups para uma transação já aberta (tabelas de resumo já criadas).
+
+    Também reconta as linhas, já que o banco pode ter sido alterado fora do dashboard.
+    """
+    has_base = inspect(conn).has_table(TABLE_NAME)
+    for table, date_format, _ in ROLLUPS:
+        conn.execute(text(f'DELETE FROM {table}'))
+        if has_base:
+            _fill_rollup(conn, table, date_format)
+    _set_row_count(conn, conn.execute(text(f'SELECT COUNT(*) FROM {TABLE_NAME}')).scalar() if has_base else 0)
+    bump_data_version(conn)
+
+
+def get_data_version(engine):
+    """Versão atual dos dados. Muda apenas quando alguma escrita chama bump_data_version."""
+    try:
+        with engine.connect() as conn:
+            valor = conn.execute(text(f"SELECT valor FROM {META_TABLE} WHERE chave = 'data_version'")).scalar()
+    except OperationalError:
+        # Banco sem tabela de controle (ex.: pré-visualização de upload)
+        return 0
+    return valor or 0
+
+
+def _set_row_count(conn, rows):
+    conn.execute(text(
+        f'INSERT INTO {META_TABLE} (chave, valor) VALUES (:chave, :linhas) '
+        f'ON CONFLICT(chave) DO UPDATE SET valor = excluded.valor'
+    ), {'chave': ROW_COUNT_KEY, 'linhas': rows})
+
+
+def _add_row_count(conn, rows):
+    """Soma `rows` ao contador de linhas (se ainda não existir, _refresh_statistics o cria)."""
+    conn.execute(text(f'UPDATE {META_TABLE} SET valor = valor + :linhas WHERE chave = :chave'),
+                 {'chave': ROW_COUNT_KEY, 'linhas': rows})
+
+
+def bump_data_version(conn):
+    """Incrementa a versão dos dados. Deve ser chamada na mesma transação da escrita."""
+    conn.execute(text(
+        f"INSERT INTO {META_TABLE} (chave, valor) VALUES ('data_version', 1) "
+        f"ON CONFLICT(chave) DO UPDATE SET valor = valor + 1"
+    ))
+
+
+def read_cache(engine, key, data_version):
+    """Resultado pré-calculado (formato, conteúdo) da chave, ou None se não houver
+    um gerado na versão atual dos dados."""
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(
+                text(f'SELECT formato, conteudo FROM {CACHE_TABLE} WHERE chave = :chave AND data_version = :versao'),
+                {'chave': key, 'versao': data_version},
+            ).first()
+    except OperationalError:
+        return None
+    return tuple(row) if row else None
+
+
+def replace_cache(engine, data_version, entries):
+    """Substitui todo o conteúdo da tabela de cache. entries: {chave: (formato, conteúdo)}."""
+    calculado_em = pd.Timestamp.now().isoformat(timespec='seconds')
+    records = [{'chave': key, 'versao': data_version, 'formato': formato, 'conteudo': conteudo, 'calculado_em': calculado_em}
+               for key, (formato, conteudo) in entries.items()]
+    with begin_write(engine) as conn:
+        conn.execute(text(f'DELETE FROM {CACHE_TABLE}'))
+        if records:
+            conn.execute(text(
+                f'INSERT INTO {CACHE_TABLE} (chave, data_version, formato, conteudo, calculado_em) '
+                f'VALUES (:chave, :versao, :formato, :conteudo, :calculado_em)'
+            ), records)
+
+
+def aggregate(engine, filters, group_by):
+    """Soma LIBERADOS e MALHA agrupando pelas chaves pedidas (ver GROUP_EXPRESSIONS)."""
+    where, params, expanding = build_where(filters)
+    columns = [f'{GROUP_EXPRESSIONS[key]} AS "{key}"' for key in group_by]
+    columns += ['COALESCE(SUM("LIBERADOS"), 0) AS "LIBERADOS"', 'COALESCE(SUM("MALHA"), 0) AS "MALHA"']
+    group_clause = ('GROUP BY ' + ', '.join(f'"{key}"' for key in group_by)) if group_by else ''
+    sql = f'SELECT {", ".join(columns)} FROM {source_table(filters, group_by)} {where} {group_clause}'
+    result = _run(engine, sql, params, expanding)
+
+    if 'DATA' in result.columns:
+        result['DATA'] = pd.to_datetime(result['DATA'])
+    if 'Dia_Semana' in result.columns:
+        result['Dia_Semana'] = result['Dia_Semana'].map(lambda d: WEEKDAY_NAMES[int(d)])
+    return result
+
+
+def totals(engine, filters):
+    """Retorna (total_liberados, total_malha) do filtro."""
+    row = aggregate(engine, filters, []).iloc[0]
+    return row['LIBERADOS'], row['MALHA']
+
+
+def daily_rollup(engine):
+    """Resumo diário completo (DATA x TRANSPORTADORA x OPERAÇÃO), base das somas acumuladas."""
+    return _run(engine, 'SELECT "DATA", "TRANSPORTADORA", "OPERAÇÃO", "LIBERADOS", "MALHA" FROM performance_diaria', {}, [])
+
+
+def date_bounds(engine, filters):
+    """Retorna (data_minima, data_maxima) das linhas do filtro, ou (None, None) se vazio."""
+    where, params, expanding = build_where(filters)
+    table = source_table(filters, ['DATA'])
+    result = _run(engine, f'SELECT MIN(date("DATA")) AS min_data, MAX(date("DATA")) AS max_data FROM {table} {where}',
+                  params, expanding)
+    min_data, max_data = result.iloc[0]['min_data'], result.iloc[0]['max_data']
+    if min_data is None or pd.isna(min_data):
+        return None, None
+    return pd.to_datetime(min_data), pd.to_datetime(max_data)
+
+
+def distinct_values(engine, key, filters=None):
+    """Valores distintos de uma chave (ex.: 'OPERAÇÃO', 'Ano') dentro do filtro."""
+    filters = filters or QueryFilters()
+    where, params, expanding = build_where(filters)
+    expression = GROUP_EXPRESSIONS[key]
+    result = _run(engine, f'SELECT DISTINCT {expression} AS valor FROM {source_table(filters, [key])} {where} ORDER BY valor',
+                  params, expanding)
+    return result['valor'].dropna().tolist()
+
+
+def _rows_statement(filters):
+    where, params, expanding = build_where(filters)
+    sql = (f'SELECT "DATA", "TRANSPORTADORA", "OPERAÇÃO", "LIBERADOS", "MALHA", '
+           f'{GROUP_EXPRESSIONS["Mês_Ano"]} AS "Mês_Ano", {GROUP_EXPRESSIONS["Ano"]} AS "Ano" '
+           f'FROM {TABLE_NAME} {where}')
+    return sql, params, expanding
+
+
+def fetch_rows(engine, filters):
+    """Linhas do filtro (para a tabela detalhada), com as colunas de período."""
+    result = _run(engine, *_rows_statement(filters))
+    result['DATA'] = pd.to_datetime(result['DATA'], format='ISO8601')
+    return schema.compact_frame(result)
+
+
+def iter_rows(engine, filters, chunksize):
+    """Linhas do filtro em blocos de `chunksize` (para exportações em fluxo)."""
+    sql, params, expanding = _rows_statement(filters)
+    statement = _statement(sql, expanding)
+    with engine.connect() as conn:
+        for chunk in pd.read_sql(statement, con=conn, params=params, chunksize=chunksize):
+            chunk['DATA'] = pd.to_datetime(chunk['DATA'], format='ISO8601')
+            yield chunk
+
+
+def count_rows(engine, filters):
+    """Quantidade de linhas do filtro (total de páginas da tabela detalhada)."""
+    where, params, expanding = build_where(filters)
+    result = _run(engine, f'SELECT COUNT(*) AS linhas FROM {TABLE_NAME} {where}', params, expanding)
+    return int(result.iloc[0]['linhas'])
+
+
+def _order_clause(sort_by, descending, row_id='rowid'):
+    # Desempate por DATA, TRANSPORTADORA e rowid: a ordem das linhas é a mesma em toda página
+    keys = [sort_by] + [key for key in ('DATA', 'TRANSPORTADORA') if key != sort_by]
+    direction = 'DESC' if descending else 'ASC'
+    terms = [f'{DETAIL_SORT_EXPRESSIONS[key]} {direction}' for key in keys]
+    return 'ORDER BY ' + ', '.join(terms + [f'{row_id} {direction}'])
+
+
+def fetch_page(engine, filters, sort_by, descending, page, page_size, total_rows):
+    """Uma página das linhas do filtro, ordenada por `sort_by` (ver DETAIL_SORT_EXPRESSIONS).
+
+    A subconsulta escolhe só os rowids da página (pelo índice de DATA/TRANSPORTADORA na ordem
+    padrão) e apenas essas linhas são lidas. Páginas da segunda metade são buscadas de trás
+    para frente, para o OFFSET nunca passar da metade do total.
+    """
+    offset = page * page_size
+    limit = max(0, min(page_size, total_rows - offset))
+    reverse = offset + limit > total_rows - offset
+    if reverse:
+        descending, offset = not descending, total_rows - offset - limit
+    where, params, expanding = build_where(filters)
+    sql = (f'SELECT "DATA", "TRANSPORTADORA", "OPERAÇÃO", "LIBERADOS", "MALHA", '
+           f'{GROUP_EXPRESSIONS["Mês_Ano"]} AS "Mês_Ano", {GROUP_EXPRESSIONS["Ano"]} AS "Ano" '
+           f'FROM {TABLE_NAME} JOIN (SELECT rowid AS id FROM {TABLE_NAME} {where} {_order_clause(sort_by, descending)} '
+           f'LIMIT :limite OFFSET :inicio) AS pagina ON {TABLE_NAME}.rowid = pagina.id '
+           f'{_order_clause(sort_by, descending, "pagina.id")}')
+    result = _run(engine, sql, {**params, 'limite': limit, 'inicio': offset}, expanding)
+    if reverse:
+        result = result.iloc[::-1].reset_index(drop=True)
+    result['DATA'] = pd.to_datetime(result['DATA'], format='ISO8601')
+    return schema.compact_frame(result)
+
+
+def backup_to_file(engine, target_path):
+    """Copia o banco para target_path com a API de backup online do SQLite.
+
+    A cópia é consistente mesmo com outras conexões lendo/escrevendo e não passa pelo pandas.
+    """
+    raw = engine.raw_connection()
+    try:
+        target = sqlite3.connect(target_path)
+        try:
+            raw.driver_connection.backup(target)
+            # O arquivo baixado deve ser autossuficiente, sem depender de um -wal ao lado
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+    finally:
+        raw.close()
+
+
+# --- ESCRITA ---
+# Toda escrita passa por aqui para manter as tabelas de resumo e a versão dos dados
+# na mesma transação das linhas de performance_logistica.
+
+def _rollup_upsert_sql(table, source='VALUES (:data, :transportadora, :operacao, :liberados, :malha)'):
+    return (
+        f'INSERT INTO {table} ("DATA", "TRANSPORTADORA", "OPERAÇÃO", "LIBERADOS", "MALHA") '
+        f'{source} '
+        f'ON CONFLICT ("DATA", "TRANSPORTADORA", "OPERAÇÃO") DO UPDATE SET '
+        f'"LIBERADOS" = "LIBERADOS" + excluded."LIBERADOS", "MALHA" = "MALHA" + excluded."MALHA"'
+    )
+
+
+def _hash64(texto):
+    return int.from_bytes(hashlib.blake2b(texto.encode(), digest_size=8).digest(), 'big')
+
+
+def _column_hashes(values, normalize):
+    """Hash de 64 bits de cada valor da coluna, calculado uma vez por valor distinto."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    normalized = normalize(pd.Series(uniques, dtype=object))
+    return np.array([_hash64(texto) for texto in normalized], dtype=np.uint64)[codes]
+
+
+def _mix64(value):
+    """Finalizador do splitmix64: espalha os bits (aritmética uint64 com estouro)."""
+    value = (value ^ (value >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    value = (value ^ (value >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return value ^ (value >> np.uint64(31))
+
+
+def _normalize_day(values):
+    return pd.to_datetime(values, errors='coerce', format='ISO8601').dt.strftime('%Y-%m-%d').fillna('')
+
+
+def _normalize_text(values):
+    return values.where(values.notna(), '').astype(str).str.strip()
+
+
+def _normalize_number(values):
+    return pd.to_numeric(values, errors='coerce').astype(float).map(repr)
+
+
+FINGERPRINT_PARTS = [
+    ('DATA', _normalize_day),
+    ('TRANSPORTADORA', _normalize_text),
+    ('OPERAÇÃO', _normalize_text),
+    ('LIBERADOS', _normalize_number),
+    ('MALHA', _normalize_number),
+]
+
+
+def fingerprints(df):
+    """Impressão digital de cada linha (inteiro de 64 bits) sobre DATA (dia), TRANSPORTADORA,
+    OPERAÇÃO, LIBERADOS e MALHA normalizados (texto sem espaços nas pontas, números como float).
+
+    Cada valor distinto de uma coluna vira um hash (blake2b) uma única vez; os hashes das
+    colunas são combinados em ordem com o splitmix64. Não usa o hash do pandas para o valor
+    continuar igual entre versões das bibliotecas, já que ele fica gravado no banco.
+    """
+    rows = df.reindex(columns=[column for column, _ in FINGERPRINT_PARTS])
+    combined = np.zeros(len(rows), dtype=np.uint64)
+    for column, normalize in FINGERPRINT_PARTS:
+        values = rows[column]
+        if column == 'DATA' and pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.normalize()
+        combined = _mix64(combined ^ _column_hashes(values, normalize))
+    return pd.Series(combined.view(np.int64), index=df.index)
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64_int(value):
+    """_mix64 para um único inteiro Python (o estouro do uint64 vira a máscara de 64 bits)."""
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def _row_fingerprint_function():
+    """fingerprints() linha a linha, para registrar como função SQL (ver merge_database).
+
+    Recebe o dia já como 'YYYY-MM-DD' e os demais valores do SQLite; o hash de cada valor
+    distinto é guardado, então o custo por linha é só a combinação dos cinco hashes.
+    """
+    normalizers = [
+        lambda dia: dia or '',
+        lambda valor: '' if valor is None else str(valor).strip(),
+        lambda valor: '' if valor is None else str(valor).strip(),
+        lambda numero: repr(float(numero)),
+        lambda numero: repr(float(numero)),
+    ]
+    caches = [{} for _ in normalizers]
+
+    def fingerprint(*values):
+        combined = 0
+        for value, normalize, cache in zip(values, normalizers, caches):
+            hashed = cache.get(value)
+            if hashed is None:
+                hashed = cache[value] = _hash64(normalize(value))
+            combined = _mix64_int(combined ^ hashed)
+        # Mesmo inteiro com sinal que fingerprints() grava (view como int64)
+        return combined - (1 << 64) if combined >> 63 else combined
+
+    return fingerprint
+
+
+def _existing_fingerprints(conn, values, table=TABLE_NAME):
+    """Impressões digitais do lote que já estão em `table` (busca pelo índice único, em blocos)."""
+    values = [int(v) for v in values]
+    statement = _statement(f'SELECT "{FINGERPRINT_COLUMN}" FROM {table} WHERE "{FINGERPRINT_COLUMN}" IN :fps', ['fps'])
+    existing = set()
+    for start in range(0, len(values), MAX_SQL_PARAMS):
+        existing.update(conn.execute(statement, {'fps': values[start:start + MAX_SQL_PARAMS]}).scalars())
+    return existing
+
+
+def _insert_or_ignore(table, conn, keys, data_iter):
+    """Método de inserção do to_sql: INSERT OR IGNORE (o índice único descarta as repetidas)."""
+    result = conn.execute(table.table.insert().prefix_with('OR IGNORE'), [dict(zip(keys, row)) for row in data_iter])
+    return result.rowcount
+
+
+def append_rows(conn, df):
+    """Insere as linhas novas em performance_logistica e soma os totais delas nas tabelas de resumo.
+
+    Linhas repetidas (mesma impressão digital, dentro do lote ou já no banco) são ignoradas:
+    o custo depende do tamanho do lote, não da tabela. Retorna as linhas de fato inseridas.
+    Deve ser chamada dentro de uma transação (begin_write ou a fila do writer.py).
+    """
+    if df.empty:
+        return df
+    rows = df.assign(**{FINGERPRINT_COLUMN: fingerprints(df)}).drop_duplicates(FINGERPRINT_COLUMN)
+    has_base = inspect(conn).has_table(TABLE_NAME)
+    if has_base:
+        _ensure_fingerprints(conn)
+        rows = rows[~rows[FINGERPRINT_COLUMN].isin(_existing_fingerprints(conn, rows[FINGERPRINT_COLUMN]))]
+    if rows.empty:
+        return rows.drop(columns=FINGERPRINT_COLUMN)
+    rows.to_sql(TABLE_NAME, conn, if_exists='append', index=False, method=_insert_or_ignore)
+    if has_base:
+        _add_row_count(conn, len(rows))
+    else:
+        # Tabela criada agora pelo to_sql: falta o índice único
+        _ensure_fingerprints(conn)
+        _set_row_count(conn, len(rows))
+
+    rows = rows.drop(columns=FINGERPRINT_COLUMN)
+    resumo = rows.reindex(columns=['DATA', 'TRANSPORTADORA', 'OPERAÇÃO', 'LIBERADOS', 'MALHA'])
+    datas = pd.to_datetime(resumo['DATA'])
+    valores = resumo[['LIBERADOS', 'MALHA']].apply(pd.to_numeric, errors='coerce').fillna(0)
+    for table, date_format, _ in ROLLUPS:
+        grouped = (
+            valores.assign(data=datas.dt.strftime(date_format),
+                           transportadora=resumo['TRANSPORTADORA'], operacao=resumo['OPERAÇÃO'])
+            .groupby(['data', 'transportadora', 'operacao'], dropna=False, observed=True)[['LIBERADOS', 'MALHA']].sum()
+            .reset_index()
+            .rename(columns={'LIBERADOS': 'liberados', 'MALHA': 'malha'})
+        )
+        records = grouped.astype(object).where(grouped.notna(), None).to_dict('records')
+        conn.execute(text(_rollup_upsert_sql(table)), records)
+    bump_data_version(conn)
+    return rows
+
+
+def clear_rows(conn):
+    """Apaga todas as linhas e os resumos (usado ao substituir o banco). Requer transação."""
+    if inspect(conn).has_table(TABLE_NAME):
+        conn.execute(text(f'DELETE FROM {TABLE_NAME}'))
+    for table, _, _ in ROLLUPS:
+        conn.execute(text(f'DELETE FROM {table}'))
+    _set_row_count(conn, 0)
+    bump_data_version(conn)
+
+
+# --- SUBSTITUIÇÃO EM BLOCOS ---
+
+# Tabelas de preparo da importação em blocos com a opção de substituir (uma por importação)
+STAGING_PREFIX = 'importacao_'
+
+
+def _create_rows_table(conn, table):
+    """Cria `table` com as colunas de performance_logistica (mesmos tipos que o to_sql usa)."""
+    conn.execute(text(
+        f'CREATE TABLE {table} ("DATA" DATETIME, "TRANSPORTADORA" TEXT, "OPERAÇÃO" TEXT, '
+        f'"LIBERADOS" BIGINT, "MALHA" BIGINT)'
+    ))
+
+
+def stage_rows(conn, table, df):
+    """Grava um bloco na tabela de preparo `table` de uma substituição (ver replace_from_staging).
+
+    As linhas repetidas, no bloco ou em blocos anteriores, são ignoradas como em append_rows;
+    o banco do dashboard não é tocado. Retorna as linhas gravadas. Requer transação.
+    """
+    if not inspect(conn).has_table(table):
+        _create_rows_table(conn, table)
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN "{FINGERPRINT_COLUMN}" BIGINT'))
+        conn.execute(text(f'CREATE UNIQUE INDEX {table}_fingerprint ON {table} ("{FINGERPRINT_COLUMN}")'))
+    if df.empty:
+        return df
+    rows = df.assign(**{FINGERPRINT_COLUMN: fingerprints(df)}).drop_duplicates(FINGERPRINT_COLUMN)
+    rows = rows[~rows[FINGERPRINT_COLUMN].isin(_existing_fingerprints(conn, rows[FINGERPRINT_COLUMN], table))]
+    if not rows.empty:
+        rows.to_sql(table, conn, if_exists='append', index=False, method=_insert_or_ignore)
+    return rows.drop(columns=FINGERPRINT_COLUMN)
+
+
+def replace_from_staging(conn, table):
+    """Troca as linhas do banco pelas da tabela de preparo `table` e a apaga, em uma única escrita.
+
+    Até aqui a importação só gravou em `table`: cancelada ou com erro antes desta chamada, ela
+    deixa o banco como estava (ver drop_staging). Os resumos e o contador de linhas são
+    recalculados. Retorna as linhas inseridas. Requer transação.
+    """
+    if inspect(conn).has_table(TABLE_NAME):
+        conn.execute(text(f'DELETE FROM {TABLE_NAME}'))
+    else:
+        _create_rows_table(conn, TABLE_NAME)
+    _ensure_fingerprints(conn)
+    columns = ', '.join(f'"{column}"' for column in ['DATA', 'TRANSPORTADORA', 'OPERAÇÃO', 'LIBERADOS', 'MALHA',
+                                                     FINGERPRINT_COLUMN])
+    inseridas = 0
+    if inspect(conn).has_table(table):
+        inseridas = conn.execute(text(f'INSERT INTO {TABLE_NAME} ({columns}) SELECT {columns} FROM {table}')).rowcount
+        conn.execute(text(f'DROP TABLE {table}'))
+    refill_rollups(conn)
+    return inseridas
+
+
+def drop_staging(conn, table):
+    """Apaga a tabela de preparo de uma substituição cancelada ou com erro. Requer transação."""
+    conn.execute(text(f'DROP TABLE IF EXISTS {table}'))
+
+
+# --- MESCLAGEM DE BANCOS .db ---
+
+# Apelidos dos bancos anexados: únicos, porque o DETACH só acontece depois do COMMIT do
+# lote da fila de escrita, que pode ter mais de uma mesclagem
+_upload_aliases = itertools.count()
+
+# Datas que o SQL leva ao dia exatamente como ingest.parse_date_column: só os formatos ISO de
+# ingest.KNOWN_DATE_FORMATS ('YYYY-MM-DD', com ' HH:MM:SS' e com microssegundos). Os demais
+# passariam pela inferência do pandas, então o arquivo vai pelo caminho do pandas
+# (julianday normaliza datas como 30/02, que date() sozinho devolve como vieram)
+_ISO_DAY_SQL = (
+    "(typeof({data}) = 'text' AND date(julianday({data})) IS NOT NULL "
+    "AND date(julianday({data})) = substr({data}, 1, 10) "
+    "AND (length({data}) = 10 OR (substr({data}, 11, 9) GLOB ' [0-9][0-9]:[0-9][0-9]:[0-9][0-9]' "
+    "AND time(julianday({data})) = substr({data}, 12, 8) "
+    "AND (length({data}) = 19 OR (length({data}) BETWEEN 21 AND 26 AND substr({data}, 20, 1) = '.' "
+    "AND substr({data}, 21) NOT GLOB '*[^0-9]*')))))"
+)
+
+# Intervalo (em instruções da VM do SQLite) entre as consultas ao pedido de cancelamento
+MERGE_PROGRESS_STEPS = 100_000
+
+
+def _upload_columns(conn, alias):
+    """Tabela do banco anexado (performance_logistica ou a primeira, como ingest.iter_sqlite_chunks)
+    e o nome real de cada coluna esperada. Retorna (None, None) se faltar alguma coluna."""
+    tables = [row[0] for row in conn.execute(text(f"SELECT name FROM {alias}.sqlite_master WHERE type = 'table' ORDER BY rowid"))
+              if row[0] != 'sqlite_sequence']
+    if not tables:
+        raise ValueError("O arquivo .db não contém tabelas de dados válidas.")
+    table = next((t for t in tables if t.lower() == TABLE_NAME.lower()), tables[0])
+    names = {row[1].strip().upper(): row[1] for row in conn.execute(text(f'PRAGMA {alias}.table_info("{table}")'))}
+    columns = {column: names.get(column) for column, _ in FINGERPRINT_PARTS}
+    if None in columns.values():
+        return None, None
+    return table, {column: f'"{name}"' for column, name in columns.items()}
+
+
+def _upload_counts(conn, alias, table, c):
+    """Conta as linhas do banco anexado: total, sem DATA (rejeitadas, como na limpeza) e fora do
+    formato que o SQL normaliza igual ao pandas (data ISO, contagens numéricas, nomes em texto).
+
+    As datas são conferidas uma vez por valor distinto (GROUP BY), os tipos linha a linha.
+    """
+    sem_data = "(data IS NULL OR (typeof(data) = 'text' AND trim(data) = ''))"
+    tipos = ' AND '.join(
+        [f"typeof({c[col]}) IN ('integer', 'real', 'null')" for col in ('LIBERADOS', 'MALHA')]
+        + [f"typeof({c[col]}) IN ('text', 'null')" for col in ('TRANSPORTADORA', 'OPERAÇÃO')]
+    )
+    # CASE em vez de NOT: a condição pode dar NULL (ex.: date() de um texto inválido)
+    row = conn.execute(text(
+        f'SELECT COALESCE(SUM(linhas), 0), COALESCE(SUM(CASE WHEN {sem_data} THEN linhas ELSE 0 END), 0), '
+        f'COALESCE(SUM(CASE WHEN ({sem_data} OR {_ISO_DAY_SQL.format(data="data")}) AND tipos_ok = linhas '
+        f'THEN 0 ELSE linhas END), 0) '
+        f'FROM (SELECT {c["DATA"]} AS data, COUNT(*) AS linhas, SUM(CASE WHEN {tipos} THEN 1 ELSE 0 END) AS tipos_ok '
+        f'FROM {alias}."{table}" GROUP BY 1)'
+    )).one()
+    return tuple(int(v) for v in row)
+
+
+def merge_database(conn, path, replace=False, cancelled=None):
+    """Mescla o banco SQLite em `path` (um .db enviado) direto no banco do dashboard.
+
+    O arquivo é anexado (ATTACH) e as linhas entram com um único INSERT OR IGNORE ... SELECT:
+    DATA é levada ao dia, contagens nulas viram 0 e linhas sem DATA são rejeitadas, como em
+    ingest.clean_frame, e o índice único de FINGERPRINT descarta as repetidas. Os resumos
+    recebem só as linhas inseridas (INSERT ... SELECT ... GROUP BY com ON CONFLICT).
+
+    Só vale para tabelas no formato que o próprio dashboard grava (datas ISO, contagens
+    numéricas); para qualquer outra retorna None sem gravar nada, e quem chama usa o caminho
+    pelo pandas. `cancelled()` é consultada durante a execução: se retornar True o comando em
+    andamento é interrompido e o SQLite desfaz a transação inteira, por isso a mesclagem deve
+    rodar sozinha em um lote da fila de escrita (writer.py, exclusive=True), que também faz o
+    DETACH depois do COMMIT. Retorna um dict com os contadores (lidas, rejeitadas, inseridas,
+    ignoradas).
+    """
+    alias = f'upload_{next(_upload_aliases)}'
+    conn.exec_driver_sql(f'ATTACH DATABASE ? AS {alias}', (path,))
+    after_transaction(conn, f'DETACH DATABASE {alias}')
+
+    table, c = _upload_columns(conn, alias)
+    if table is None:
+        return None
+    lidas, rejeitadas, fora_do_formato = _upload_counts(conn, alias, table, c)
+    if fora_do_formato:
+        return None
+
+    if replace:
+        clear_rows(conn)
+    if not inspect(conn).has_table(TABLE_NAME):
+        _create_rows_table(conn, TABLE_NAME)
+        _set_row_count(conn, 0)
+    _ensure_fingerprints(conn)
+
+    driver = conn.connection.driver_connection
+    driver.create_function('dashboard_fingerprint', 5, _row_fingerprint_function(), deterministic=True)
+    if cancelled is not None:
+        driver.set_progress_handler(lambda: int(cancelled()), MERGE_PROGRESS_STEPS)
+    try:
+        ultima = conn.execute(text(f'SELECT COALESCE(MAX(rowid), 0) FROM main.{TABLE_NAME}')).scalar()
+        inseridas = conn.execute(text(
+            f'INSERT OR IGNORE INTO main.{TABLE_NAME} '
+            f'("DATA", "TRANSPORTADORA", "OPERAÇÃO", "LIBERADOS", "MALHA", "{FINGERPRINT_COLUMN}") '
+            f'SELECT strftime(\'%Y-%m-%d 00:00:00.000000\', dia), transportadora, operacao, liberados, malha, '
+            f'dashboard_fingerprint(dia, transportadora, operacao, liberados, malha) '
+            f'FROM (SELECT date({c["DATA"]}) AS dia, {c["TRANSPORTADORA"]} AS transportadora, '
+            f'{c["OPERAÇÃO"]} AS operacao, COALESCE({c["LIBERADOS"]}, 0) AS liberados, '
+            f'COALESCE({c["MALHA"]}, 0) AS malha FROM {alias}."{table}") '
+            f'WHERE dia IS NOT NULL'
+        )).rowcount
+        if inseridas:
+            # Sem INTEGER PRIMARY KEY, as linhas novas recebem rowids acima do maior existente.
+            # Elas são somadas por dia uma vez só; os três resumos saem desse total
+            conn.execute(text(
+                f'CREATE TEMP TABLE novas_por_dia AS '
+                f'{_rollup_select("%Y-%m-%d", f"main.{TABLE_NAME}", "WHERE rowid > :ultima")}'
+            ), {'ultima': ultima})
+            for rollup, date_format, _ in ROLLUPS:
+                conn.execute(text(_rollup_upsert_sql(rollup, _rollup_select(date_format, 'temp.novas_por_dia', 'WHERE true'))))
+            conn.execute(text('DROP TABLE temp.novas_por_dia'))
+            _add_row_count(conn, inseridas)
+            bump_data_version(conn)
+    finally:
+        if cancelled is not None:
+            driver.set_progress_handler(None, 0)
+
+    limpas = lidas - rejeitadas
+    return {'lidas': lidas, 'rejeitadas': rejeitadas, 'inseridas': inseridas, 'ignoradas': limpas - inseridas}
@@ -0,0 +1,97 @@
+"""Somas acumuladas diárias para os totais de qualquer período (KPIs e comparativos).
+
+A partir do resumo diário (performance_diaria), monta uma matriz dias x grupos com a soma
+acumulada de LIBERADOS e MALHA, em que cada grupo é um par OPERAÇÃO x TRANSPORTADORA
+existente nos dados. O total de um período é a diferença entre duas linhas da matriz,
+achadas por busca binária nas datas, somada só nos grupos selecionados pelo filtro: cada
+período extra (anterior, mesmo período do ano passado, mês até hoje...) custa
+O(log dias + grupos) e não lê nenhuma linha do banco.
+"""
+import numpy as np
+import pandas as pd
+
+import queries
+
+VALUE_COLUMNS = ['LIBERADOS', 'MALHA']
+
+
+def _day_number(value):
+    """Dia da data (sem a hora) como número de dias desde 1970-01-01."""
+    return np.datetime64(pd.Timestamp(value).date(), 'D').astype(np.int64)
+
+
+class DailyPrefixSums:
+    """Somas acumuladas por dia e por par OPERAÇÃO x TRANSPORTADORA."""
+
+    def __init__(self, daily):
+        daily = daily.astype({column: float for column in VALUE_COLUMNS})
+        # Nulos viram o código -1, que cai na posição extra (sempre False) das consultas
+        op_codes, operacoes = pd.factorize(daily['OPERAÇÃO'])
+        carrier_codes, transportadoras = pd.factorize(daily['TRANSPORTADORA'])
+        self.positions = {
+            'OPERAÇÃO': {value: i for i, value in enumerate(operacoes)},
+            'TRANSPORTADORA': {value: i for i, value in enumerate(transportadoras)},
+        }
+        width = len(transportadoras) + 1
+        pair_codes, pairs = pd.factorize((op_codes + 1) * width + (carrier_codes + 1))
+        self.pair_operacao = pairs // width - 1
+        self.pair_transportadora = pairs % width - 1
+
+        days = pd.to_datetime(daily['DATA'], format='ISO8601')
+        dated = days.notna().to_numpy()
+        day_numbers = days[dated].to_numpy().astype('datetime64[D]').astype(np.int64)
+        self.days, day_codes = np.unique(day_numbers, return_inverse=True)
+        values = daily[VALUE_COLUMNS].to_numpy()
+
+        # Linha 0 = antes do primeiro dia; linha i = soma até o dia i-1 (inclusive)
+        sums = np.zeros((len(self.days) + 1, len(pairs), len(VALUE_COLUMNS)))
+        np.add.at(sums, (day_codes + 1, pair_codes[dated]), values[dated])
+        self.cumulative = np.cumsum(sums, axis=0)
+        # Dias nulos só entram quando o filtro não tem nenhuma restrição de data
+        self.undated = np.zeros((len(pairs), len(VALUE_COLUMNS)))
+        np.add.at(self.undated, pair_codes[~dated], values[~dated])
+
+    @classmethod
+    def load(cls, engine):
+        return cls(queries.daily_rollup(engine))
+
+    def _position(self, day_number):
+        return int(np.searchsorted(self.days, day_number, side='left'))
+
+    def day_ranges(self, filters):
+        """Intervalos [início, fim) de posições em self.days dentro do período do filtro."""
+        if filters.anos is not None:
+            ranges = [(self._position(_day_number(f'{a}-01-01')), self._position(_day_number(f'{a + 1}-01-01')))
+                      for a in sorted({int(a) for a in filters.anos})]
+        else:
+            ranges = [(0, len(self.days))]
+        low = self._position(_day_number(filters.start_date)) if filters.start_date is not None else 0
+        high = self._position(_day_number(filters.end_date) + 1) if filters.end_date is not None else len(self.days)
+        ranges = [(max(start, low), min(end, high)) for start, end in ranges]
+        return [(start, end) for start, end in ranges if start < end]
+
+    def _lookup(self, column, values):
+        """Tabela de consulta por código: True para os valores selecionados.
+        Sem filtro (None) inclui tudo, inclusive os nulos (última posição)."""
+        positions = self.positions[column]
+        if values is None:
+            return np.ones(len(positions) + 1, dtype=bool)
+        lookup = np.zeros(len(positions) + 1, dtype=bool)
+        lookup[[positions[v] for v in {str(v) for v in values} if v in positions]] = True
+        return lookup
+
+    def pair_mask(self, filters):
+        """Pares OPERAÇÃO x TRANSPORTADORA incluídos pelo filtro."""
+        operacoes = self._lookup('OPERAÇÃO', filters.operacoes)
+        transportadoras = self._lookup('TRANSPORTADORA', filters.transportadoras)
+        return operacoes[self.pair_operacao] & transportadoras[self.pair_transportadora]
+
+    def totals(self, filters):
+        """(total_liberados, total_malha) do filtro, como queries.totals."""
+        sums = np.zeros((len(self.pair_operacao), len(VALUE_COLUMNS)))
+        for start, end in self.day_ranges(filters):
+            sums += self.cumulative[end] - self.cumulative[start]
+        if filters.anos is None and filters.start_date is None and filters.end_date is None:
+            sums += self.undated
+        liberados, malha = sums[self.pair_mask(filters)].sum(axis=0)
+        return float(liberados), float(malha)
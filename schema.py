@@ -0,0 +1,85 @@
+"""Esquema tipado e compacto dos DataFrames de performance_logistica.
+
+Aplicado nos DataFrames que ficam em memória (upload limpo e linhas filtradas):
+- TRANSPORTADORA, OPERAÇÃO (e as colunas de período) viram categóricas;
+- LIBERADOS e MALHA usam o menor inteiro sem sinal que comporta o total da linha
+  (LIBERADOS + MALHA), mantendo float quando há valores fracionários ou negativos;
+- DATA fica normalizada no dia, com resolução de segundos (datetime64[s]).
+
+Executar `python schema.py [linhas]` imprime o relatório de memória antes/depois.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+CATEGORY_COLUMNS = ['TRANSPORTADORA', 'OPERAÇÃO', 'Mês_Ano', 'Ano']
+COUNT_COLUMNS = ['LIBERADOS', 'MALHA']
+UNSIGNED_TYPES = [np.uint8, np.uint16, np.uint32, np.uint64]
+
+
+def _smallest_count_dtype(df, columns):
+    """Menor dtype inteiro sem sinal seguro para as colunas, ou None se não houver um."""
+    values = [pd.to_numeric(df[c], errors='coerce') for c in columns]
+    if not values or any(v.isna().any() for v in values):
+        return None
+    if any((v < 0).any() or (v % 1 != 0).any() for v in values):
+        return None
+    # O total por linha (TOTAL GERAL) também precisa caber no tipo escolhido
+    row_total = sum(v.astype(float) for v in values).max() if len(values[0]) else 0
+    for dtype in UNSIGNED_TYPES:
+        if row_total <= np.iinfo(dtype).max:
+            return dtype
+    return None
+
+
+def compact_frame(df):
+    """Converte as colunas conhecidas para os tipos compactos. Altera e retorna o próprio df."""
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+
+    counts = [c for c in COUNT_COLUMNS if c in df.columns]
+    dtype = _smallest_count_dtype(df, counts)
+    for col in counts:
+        if dtype is not None:
+            df[col] = pd.to_numeric(df[col]).astype(dtype)
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(float)
+
+    if 'DATA' in df.columns:
+        df['DATA'] = pd.to_datetime(df['DATA']).dt.normalize().astype('datetime64[s]')
+    return df
+
+
+def memory_usage_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def memory_report(rows=1_000_000, seed=42):
+    """Compara a memória de um DataFrame sintético no formato antigo e no compacto."""
+    rng = np.random.default_rng(seed)
+    transportadoras = [f'Transportadora {i:02d}' for i in range(30)]
+    operacoes = ['LML', 'Direta', 'Reversa', 'Outros']
+    # Formato antigo: strings object, contagens float64 (após fillna) e DATA em nanossegundos
+    df = pd.DataFrame({
+        'DATA': pd.to_datetime('2020-01-01') + pd.to_timedelta(rng.integers(0, 6 * 365, rows), unit='D'),
+        'TRANSPORTADORA': pd.Series(rng.choice(transportadoras, rows), dtype=object),
+        'OPERAÇÃO': pd.Series(rng.choice(operacoes, rows), dtype=object),
+        'LIBERADOS': rng.integers(0, 300, rows).astype(float),
+        'MALHA': rng.integers(0, 40, rows).astype(float),
+    })
+    before = memory_usage_mb(df)
+    compact = compact_frame(df.copy())
+    after = memory_usage_mb(compact)
+    return {
+        'linhas': rows,
+        'antes_mb': round(float(before), 1),
+        'depois_mb': round(float(after), 1),
+        'reducao_pct': round(float(1 - after / before) * 100, 1),
+        'dtypes': {c: str(t) for c, t in compact.dtypes.items()},
+    }
+
+
+if __name__ == '__main__':
+    print(memory_report(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000))
@@ -0,0 +1,5 @@
+"""Coloca a raiz do repositório no sys.path (os módulos do dashboard ficam soltos na raiz)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
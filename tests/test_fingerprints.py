@@ -0,0 +1,67 @@
+"""Impressões digitais: valores fixos (ficam gravados no banco) e iguais nos dois caminhos de gravação."""
+import io
+import sqlite3
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import ingest
+import queries
+import writer
+
+
+def test_fingerprints_are_pinned():
+    # Mudar estes valores invalida as impressões digitais já gravadas nos bancos existentes
+    df = pd.DataFrame({'DATA': pd.to_datetime(['2025-01-02', '2025-01-02 13:45', '2024-12-31'], format='ISO8601'),
+                       'TRANSPORTADORA': ['A', ' A ', None], 'OPERAÇÃO': ['LML', 'LML', 'Direta'],
+                       'LIBERADOS': [10, 10.0, 0], 'MALHA': [0, 0, 3]})
+    expected = [-1928232996104326278, -1928232996104326278, -5761559133881927762]
+    assert queries.fingerprints(df).tolist() == expected
+    fingerprint = queries._row_fingerprint_function()
+    assert [fingerprint('2025-01-02', 'A', 'LML', 10, 0), fingerprint('2025-01-02', ' A ', 'LML', 10.0, 0),
+            fingerprint('2024-12-31', None, 'Direta', 0, 3)] == expected
+
+
+@pytest.fixture
+def upload(tmp_path):
+    # Espaços nas pontas, contagens nulas e o mesmo número como inteiro e como real
+    path = tmp_path / 'upload.db'
+    with sqlite3.connect(path) as db:
+        db.execute('CREATE TABLE performance_logistica ("DATA" TEXT, "TRANSPORTADORA" TEXT, '
+                   '"OPERAÇÃO" TEXT, "LIBERADOS" NUMERIC, "MALHA" NUMERIC)')
+        db.executemany('INSERT INTO performance_logistica VALUES (?, ?, ?, ?, ?)', [
+            ('2025-01-02', ' A ', 'LML', 10, 0),
+            ('2025-01-02 00:00:00', 'B', ' Direta', 2.0, None),
+            ('2025-01-03 00:00:00.000000', None, 'LML', None, 1.5),
+            ('2025-01-04', 'C ', 'LML', 3, 4.0),
+        ])
+    return path
+
+
+def _write_queue(tmp_path, name):
+    engine = queries.create_database_engine(f'sqlite:///{tmp_path / name}')
+    queries.ensure_schema(engine)
+    return writer.WriteQueue(engine)
+
+
+def _stored(write_queue):
+    with write_queue.engine.connect() as conn:
+        return sorted(conn.execute(text(f'SELECT "{queries.FINGERPRINT_COLUMN}" FROM {queries.TABLE_NAME}')).scalars())
+
+
+def test_merge_and_append_store_the_same_fingerprints(tmp_path, upload):
+    merged = _write_queue(tmp_path, 'sql.db')
+    counts = merged.run(queries.merge_database, str(upload), False, exclusive=True)
+    assert counts['inseridas'] == 4
+
+    appended = _write_queue(tmp_path, 'pandas.db')
+    for chunk, _ in ingest.iter_chunks(io.BytesIO(upload.read_bytes()), upload.name):
+        chunk, _ = ingest.clean_frame(chunk)
+        appended.run(queries.append_rows, chunk[ingest.ENTRY_COLUMNS])
+
+    assert _stored(merged) == _stored(appended)
+    assert None not in _stored(merged)
+    # As linhas gravadas pelo pandas são reconhecidas como repetidas pela mesclagem
+    again = appended.run(queries.merge_database, str(upload), False, exclusive=True)
+    assert (again['inseridas'], again['ignoradas']) == (0, 4)
@@ -0,0 +1,68 @@
+"""Leitura em blocos e conversão de datas da importação."""
+import io
+
+import pandas as pd
+
+import ingest
+
+
+def _clean_chunks(data, chunksize):
+    date_formats = {}
+    parts = [ingest.clean_frame(chunk, date_formats)[0]
+             for chunk, _ in ingest.iter_csv_chunks(io.BytesIO(data), chunksize)]
+    return pd.concat(parts, ignore_index=True)
+
+
+def test_csv_chunks_parse_numbers_like_whole_file():
+    # Primeiro bloco só com '1.234' (milhar), segundo com vírgula decimal e vazios
+    data = (
+        "DATA;LIBERADOS;MALHA\n"
+        "01/02/2025;1.234;5\n"
+        "02/02/2025;2.500;7\n"
+        "03/02/2025;10;\n"
+        "04/02/2025;1,5;3\n"
+    ).encode()
+    chunked = _clean_chunks(data, chunksize=2)
+    assert chunked['LIBERADOS'].tolist() == [1234, 2500, 10, 1.5]
+    assert chunked['MALHA'].tolist() == [5, 7, 0, 3]
+    whole = _clean_chunks(data, chunksize=100)
+    assert chunked['LIBERADOS'].tolist() == whole['LIBERADOS'].tolist()
+
+
+def test_csv_with_dot_decimals_keeps_the_decimal_point():
+    # Delimitador ',' e '.' decimal: o '.' só é milhar quando agrupa três dígitos
+    data = (
+        "DATA,LIBERADOS,MALHA\n"
+        "01/02/2025,10.0,1.5\n"
+        "02/02/2025,2.25,0.5\n"
+        "03/02/2025,1.234,\"1.234,5\"\n"
+        "04/02/2025,\"12.345.678\",\"2,5\"\n"
+    ).encode()
+    for chunksize in (1, 100):
+        cleaned = _clean_chunks(data, chunksize=chunksize)
+        assert cleaned['LIBERADOS'].tolist() == [10, 2.25, 1234, 12345678]
+        assert cleaned['MALHA'].tolist() == [1.5, 0.5, 1234.5, 2.5]
+
+
+def test_iso_dates_are_not_read_day_first():
+    values = pd.Series([
+        '2025-01-02T00:00:00', '2025-01-02 00:00', '2025/01/02', '2025-01-02T00:00',
+        '2025-01-02 00:00:00.000000', '2025-01-02 00:00:00+00:00', '02/01/2025',
+    ])
+    parsed = ingest.parse_date_column(values, {})
+    assert parsed.dt.normalize().eq(pd.Timestamp('2025-01-02')).all()
+    assert parsed.dt.tz is None
+
+
+def test_timezone_dates_are_converted_to_utc():
+    values = pd.Series(['2025-01-02T22:30:00-03:00', '2025-01-02 10:00:00+02:00'])
+    parsed = ingest.parse_date_column(values, {})
+    assert parsed.tolist() == [pd.Timestamp('2025-01-03 01:30'), pd.Timestamp('2025-01-02 08:00')]
+
+
+def test_day_first_fallback_and_invalid_dates():
+    values = pd.Series(['4/1/2025 10:00', '45321', 'lixo', None])
+    parsed = ingest.parse_date_column(values, {})
+    assert parsed[0] == pd.Timestamp('2025-01-04 10:00')
+    assert parsed[1] == pd.Timestamp('2024-01-30')
+    assert parsed[2:].isna().all()
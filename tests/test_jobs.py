@@ -0,0 +1,114 @@
+"""Importações em segundo plano: substituição atômica e resumos da importação em lote."""
+import io
+import threading
+import time
+import zipfile
+
+import pandas as pd
+import pytest
+from sqlalchemy import inspect, text
+
+import ingest
+import jobs
+import queries
+import writer
+
+
+def _rows(*transportadoras):
+    return pd.DataFrame({'DATA': pd.Timestamp('2025-01-02'), 'TRANSPORTADORA': list(transportadoras),
+                         'OPERAÇÃO': 'LML', 'LIBERADOS': 1, 'MALHA': 0})
+
+
+def _insert_rows(conn, df, cols, replace=False):
+    # Mesmo contrato de dashboard.insert_new_rows
+    if replace:
+        queries.clear_rows(conn)
+    inserted = queries.append_rows(conn, df[cols])
+    return inserted, len(df) - len(inserted)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = queries.create_database_engine(f'sqlite:///{tmp_path / "dados.db"}')
+    queries.ensure_schema(engine)
+    writer.WriteQueue(engine).run(queries.append_rows, _rows('ANTIGA'))
+    yield engine
+    engine.dispose()
+
+
+def _import(engine, monkeypatch, chunks):
+    """Importa (substituindo) os blocos gerados por `chunks(job)` e espera o fim."""
+    import_jobs = jobs.ImportJobs(writer.WriteQueue(engine), _insert_rows, ingest.ENTRY_COLUMNS)
+    started = threading.Event()
+    holder = {}
+
+    def iter_chunks(file, name):
+        started.wait(10)
+        return chunks(holder['job'])
+
+    monkeypatch.setattr(ingest, 'iter_chunks', iter_chunks)
+    holder['job'] = import_jobs.import_file('novo.csv', b'', replace=True)
+    started.set()
+    return _wait(holder['job'])
+
+
+def _wait(job, timeout=10):
+    deadline = time.time() + timeout
+    while not job.done and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def _state(engine):
+    with engine.connect() as conn:
+        carriers = sorted(conn.execute(text(f'SELECT "TRANSPORTADORA" FROM {queries.TABLE_NAME}')).scalars())
+        rollup = conn.execute(text('SELECT SUM("LIBERADOS") FROM performance_anual')).scalar()
+        count = conn.execute(text(f'SELECT valor FROM {queries.META_TABLE} WHERE chave = :chave'),
+                             {'chave': queries.ROW_COUNT_KEY}).scalar()
+        staging = [name for name in inspect(conn).get_table_names() if name.startswith(queries.STAGING_PREFIX)]
+    return carriers, rollup, count, staging
+
+
+def test_replace_swaps_rows_at_the_end(engine, monkeypatch):
+    job = _import(engine, monkeypatch, lambda job: iter([(_rows('A', 'B', 'A'), 0.5), (_rows('B', 'C'), 1.0)]))
+    assert job.status == jobs.DONE
+    assert (job.inseridas, job.ignoradas) == (3, 2)
+    assert _state(engine) == (['A', 'B', 'C'], 3, 3, [])
+
+
+def test_failed_replace_leaves_the_database_untouched(engine, monkeypatch):
+    def chunks(job):
+        yield _rows('A', 'B'), 0.5
+        raise ValueError('arquivo corrompido')
+
+    job = _import(engine, monkeypatch, chunks)
+    assert job.status == jobs.FAILED
+    assert _state(engine) == (['ANTIGA'], 1, 1, [])
+
+
+def test_cancelled_replace_leaves_the_database_untouched(engine, monkeypatch):
+    def chunks(job):
+        yield _rows('A', 'B'), 0.5
+        job.cancel()
+        yield _rows('C'), 1.0
+
+    job = _import(engine, monkeypatch, chunks)
+    assert job.status == jobs.CANCELLED
+    assert (job.blocos_gravados, job.inseridas) == (0, 0)
+    assert _state(engine) == (['ANTIGA'], 1, 1, [])
+
+
+def test_batch_summaries_follow_upload_order(engine):
+    import_jobs = jobs.ImportJobs(writer.WriteQueue(engine), _insert_rows, ingest.ENTRY_COLUMNS)
+    csv = 'DATA;TRANSPORTADORA;OPERAÇÃO;LIBERADOS;MALHA\n02/01/2025;A;LML;1;0\n'.encode()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('c.csv', csv.replace(b';A;', b';C;'))
+        zf.writestr('d.csv', csv.replace(b';A;', b';D;'))
+    files = [('a.csv', csv), ('ruim.zip', b'isto nao e um zip'), ('pacote.zip', archive.getvalue()),
+             ('e.csv', csv.replace(b';A;', b';E;'))]
+    job = _wait(import_jobs.import_batch('lote', files), timeout=120)
+    assert job.status == jobs.DONE
+    assert [(arquivo['arquivo'], arquivo['inseridas']) for arquivo in job.arquivos] == [
+        ('a.csv', 1), ('ruim.zip', 0), ('pacote.zip/c.csv', 1), ('pacote.zip/d.csv', 1), ('e.csv', 1)]
+    assert job.arquivos[1]['erro'] == "Arquivo .zip inválido."
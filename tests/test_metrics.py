@@ -0,0 +1,53 @@
+"""Paridade da taxa de retenção vetorizada com o cálculo antigo linha a linha."""
+import numpy as np
+import pandas as pd
+
+import metrics
+
+
+def calculate_retention_rate(row):
+    """Versão original do dashboard: (Malha / Total Geral) * 100."""
+    total = row['LIBERADOS'] + row['MALHA']
+    if total == 0:
+        return 0.0
+    return round((row['MALHA'] / total) * 100, 2)
+
+
+def _assert_same(df):
+    expected = df.apply(calculate_retention_rate, axis=1).to_numpy(dtype=float)
+    result = metrics.retention_rate(df['LIBERADOS'], df['MALHA'])
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_retention_rate_matches_row_wise():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'LIBERADOS': rng.integers(0, 5000, 20000).astype(float),
+        'MALHA': rng.integers(0, 300, 20000).astype(float),
+    })
+    _assert_same(df)
+
+
+def test_retention_rate_zero_total_and_nan():
+    df = pd.DataFrame({
+        'LIBERADOS': [0.0, 10.0, np.nan, 5.0, np.nan, 0.0],
+        'MALHA': [0.0, 0.0, 3.0, np.nan, np.nan, 7.0],
+    })
+    _assert_same(df)
+    result = metrics.retention_rate(df['LIBERADOS'], df['MALHA'])
+    assert result[0] == 0.0
+    assert np.isnan(result[2:5]).all()
+
+
+def test_retention_rate_scalar():
+    assert metrics.retention_rate(0, 0) == 0.0
+    assert metrics.retention_rate(2, 1) == calculate_retention_rate({'LIBERADOS': 2, 'MALHA': 1})
+    assert isinstance(metrics.retention_rate(3, 1), float)
+
+
+def test_with_totals_columns():
+    df = pd.DataFrame({'LIBERADOS': [8.0, 0.0], 'MALHA': [2.0, 0.0]})
+    out = metrics.with_totals(df)
+    assert out['TOTAL GERAL'].tolist() == [10.0, 0.0]
+    assert out['% MALHA'].tolist() == [20.0, 0.0]
+    assert 'TOTAL GERAL' not in df
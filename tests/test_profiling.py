@@ -0,0 +1,21 @@
+"""Log de tempos: desligado sem caminho e rotacionado ao passar do limite."""
+import profiling
+
+
+def test_finish_without_log_path_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    profile = profiling.RerunProfile(session='s')
+    profile.mark('etapa')
+    record = profile.finish(None)
+    assert [s['etapa'] for s in record['etapas']] == ['etapa']
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_log_is_rotated_when_too_big(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'MAX_LOG_BYTES', 200)
+    log_path = str(tmp_path / 'tempos.jsonl')
+    for _ in range(10):
+        profiling.RerunProfile().finish(log_path)
+    assert (tmp_path / 'tempos.jsonl').stat().st_size < 400
+    assert (tmp_path / 'tempos.jsonl.1').exists()
+    assert len(profiling.summarize_log(log_path)) == 1
@@ -0,0 +1,143 @@
+"""Fila de escrita: erros de conexão/BEGIN e transações desfeitas chegam a todos os jobs do lote."""
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import queries
+import writer
+
+
+def _rows(transportadora, liberados=1):
+    return pd.DataFrame({'DATA': [pd.Timestamp('2025-01-02')], 'TRANSPORTADORA': [transportadora],
+                         'OPERAÇÃO': ['LML'], 'LIBERADOS': [liberados], 'MALHA': [0]})
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(queries, 'BUSY_TIMEOUT_S', 0.2)
+    engine = queries.create_database_engine(f'sqlite:///{tmp_path / "dados.db"}')
+    queries.ensure_schema(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_begin_failure_fails_every_job_of_the_batch(engine, tmp_path):
+    write_queue = writer.WriteQueue(engine)
+    # Outra conexão segura o lock de escrita: o BEGIN IMMEDIATE do lote estoura o busy timeout
+    blocker = sqlite3.connect(tmp_path / 'dados.db', isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')
+    try:
+        futures = [write_queue.submit(queries.append_rows, _rows(f'T{i}')) for i in range(3)]
+        for future in futures:
+            with pytest.raises(Exception, match='locked'):
+                future.result(timeout=10)
+    finally:
+        blocker.execute('ROLLBACK')
+        blocker.close()
+
+    # Liberado o lock, a fila continua gravando normalmente
+    assert len(write_queue.run(queries.append_rows, _rows('T9'))) == 1
+
+
+def test_failed_job_keeps_its_own_error(engine):
+    write_queue = writer.WriteQueue(engine)
+
+    def bad(conn):
+        raise ValueError('falha proposital')
+
+    with pytest.raises(ValueError):
+        write_queue.run(bad)
+    assert len(write_queue.run(queries.append_rows, _rows('A'))) == 1
+
+
+def _row_count(engine):
+    with engine.connect() as conn:
+        return conn.execute(text(f'SELECT valor FROM {queries.META_TABLE} WHERE chave = :chave'),
+                            {'chave': queries.ROW_COUNT_KEY}).scalar()
+
+
+def test_row_count_follows_writes(engine):
+    write_queue = writer.WriteQueue(engine, after_commit=lambda: queries.ensure_schema(engine))
+    write_queue.run(queries.append_rows, pd.concat([_rows('A'), _rows('B'), _rows('A')]))
+    write_queue.sync()
+    assert _row_count(engine) == 2
+    write_queue.run(queries.append_rows, pd.concat([_rows('A'), _rows('C')]))
+    assert _row_count(engine) == 3
+    write_queue.run(queries.clear_rows)
+    assert _row_count(engine) == 0
+    write_queue.run(queries.append_rows, _rows('D'))
+    write_queue.run(queries.refill_rollups)
+    assert _row_count(engine) == 1
+
+
+def _hold(write_queue):
+    """Ocupa o escritor até o evento retornado ser liberado (os próximos jobs se acumulam)."""
+    release, started = threading.Event(), threading.Event()
+
+    def wait(conn):
+        started.set()
+        release.wait(10)
+
+    write_queue.submit(wait)
+    started.wait(10)
+    return release
+
+
+def _carriers(engine):
+    with engine.connect() as conn:
+        return sorted(conn.execute(text(f'SELECT "TRANSPORTADORA" FROM {queries.TABLE_NAME}')).scalars())
+
+
+def test_cancelled_merge_does_not_undo_other_jobs(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(queries, 'MERGE_PROGRESS_STEPS', 1)
+    upload = tmp_path / 'upload.db'
+    with sqlite3.connect(upload) as db:
+        db.execute('CREATE TABLE performance_logistica ("DATA" TEXT, "TRANSPORTADORA" TEXT, '
+                   '"OPERAÇÃO" TEXT, "LIBERADOS" INTEGER, "MALHA" INTEGER)')
+        db.executemany('INSERT INTO performance_logistica VALUES (?, ?, ?, ?, ?)',
+                       [('2025-01-03', f'U{i}', 'LML', i, 0) for i in range(50)])
+    write_queue = writer.WriteQueue(engine)
+    write_queue.run(queries.append_rows, _rows('SEED'))
+
+    release = _hold(write_queue)
+    first = write_queue.submit(queries.append_rows, _rows('A'))
+    merge = write_queue.submit(queries.merge_database, str(upload), False, lambda: True, exclusive=True)
+    last = write_queue.submit(queries.append_rows, _rows('B'))
+    release.set()
+
+    assert len(first.result(timeout=10)) == 1
+    with pytest.raises(Exception, match='interrupted'):
+        merge.result(timeout=10)
+    assert len(last.result(timeout=10)) == 1
+    assert _carriers(engine) == ['A', 'B', 'SEED']
+
+
+def test_transaction_undone_by_sqlite_fails_the_whole_batch(engine):
+    write_queue = writer.WriteQueue(engine)
+    write_queue.run(queries.append_rows, _rows('SEED'))
+
+    def interrupted(conn):
+        # Um INSERT interrompido faz o SQLite desfazer a transação inteira, não só o savepoint
+        driver = conn.connection.driver_connection
+        driver.set_progress_handler(lambda: 1, 1)
+        try:
+            conn.execute(text(f'INSERT INTO {queries.TABLE_NAME} ("TRANSPORTADORA") VALUES (\'X\')'))
+        finally:
+            driver.set_progress_handler(None, 0)
+
+    release = _hold(write_queue)
+    futures = [write_queue.submit(queries.append_rows, _rows('A')),
+               write_queue.submit(interrupted),
+               write_queue.submit(queries.append_rows, _rows('B'))]
+    release.set()
+
+    for future in (futures[0], futures[2]):
+        with pytest.raises(writer.BatchAborted):
+            future.result(timeout=10)
+    with pytest.raises(Exception, match='interrupted'):
+        futures[1].result(timeout=10)
+    assert _carriers(engine) == ['SEED']
+    assert len(write_queue.run(queries.append_rows, _rows('C'))) == 1
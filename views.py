@@ -0,0 +1,291 @@
+"""Conjuntos de dados do dashboard (KPIs, rankings, funil, mapa de calor e visões por período)
+calculados sem Streamlit, e o pré-cálculo em lote das visões padrão.
+
+Cada função recebe `run(nome_da_consulta, *args)`, que executa uma consulta de queries.py:
+o dashboard passa o cache compartilhado (shared_query) e o pré-cálculo passa um executor
+que guarda os resultados. Como as duas pontas fazem exatamente as mesmas chamadas, o que
+foi pré-calculado na tabela dashboard_cache é servido ao dashboard sem recalcular.
+
+Executar `python views.py [--db dados.db] [--data AAAA-MM-DD]` (ex.: em um job noturno)
+pré-calcula a visão completa, a semana atual, os últimos 3 meses e cada ano.
+"""
+import argparse
+import io
+import json
+from dataclasses import fields
+
+import pandas as pd
+import pyarrow as pa
+
+import metrics
+import queries
+
+ORDER_DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DAILY_WINDOW_DAYS = 5
+
+# Limites do tamanho das figuras: acima de MAX_DAILY_DATES dias os gráficos diários passam
+# a somar por semana, e acima de DENSE_POINTS pontos são desenhados em WebGL
+OTHERS_LABEL = 'Outras'
+MAX_DAILY_DATES = 180
+DENSE_POINTS = 600
+VALUE_COLUMNS = ['LIBERADOS', 'MALHA', 'MALHA_PCT']
+
+
+# --- CONJUNTOS DE DADOS ---
+
+def period_filters(min_date, max_date, anos, start_date, end_date, operacoes, transportadoras):
+    """Filtros da barra lateral. Período que cobre todo o histórico equivale a "sem filtro de
+    data", o que permite responder com os resumos mensais/anuais."""
+    filter_start = None if pd.to_datetime(start_date) <= min_date else start_date
+    filter_end = None if pd.to_datetime(end_date) >= max_date else end_date
+    return queries.make_filters(anos, filter_start, filter_end, operacoes, transportadoras)
+
+
+def previous_period_filters(filters, start_date, end_date):
+    """Mesmos filtros de categoria, sem o filtro de ano, na janela imediatamente anterior."""
+    periodo_dias = (pd.to_datetime(end_date) - pd.to_datetime(start_date)).days + 1
+    data_inicio_prev = pd.to_datetime(start_date) - pd.Timedelta(days=periodo_dias)
+    data_fim_prev = pd.to_datetime(start_date) - pd.Timedelta(days=1)
+    return filters.replace(anos=None, start_date=data_inicio_prev, end_date=data_fim_prev)
+
+
+def kpis(totals, filters, start_date, end_date):
+    """Resumos do período atual e do anterior, e a diferença entre eles: (atual, anterior, delta).
+
+    `totals(filtros)` retorna (liberados, malha), ex.: rangesums.DailyPrefixSums.totals.
+    """
+    atual = metrics.summarize(*totals(filters))
+    anterior = metrics.summarize(*totals(previous_period_filters(filters, start_date, end_date)))
+    return atual, anterior, metrics.period_deltas(atual, anterior)
+
+
+def funnel(atual):
+    """Etapas do funil do sorteio a partir do resumo do período."""
+    return dict(
+        number=[atual['veiculos'], atual['liberados'], atual['malha']],
+        stage=["Veículos na Portaria", "🟢 Liberados (Viagem)", "🔴 Retidos (Malha Fina)"]
+    )
+
+
+def carrier_totals(run, filters):
+    """Totais por transportadora (rankings e share de volume)."""
+    return run('aggregate', filters, ['TRANSPORTADORA'])
+
+
+def operation_totals(run, filters):
+    return run('aggregate', filters, ['OPERAÇÃO'])
+
+
+def weekday_heatmap(run, filters):
+    """Taxa de retenção por dia da semana x transportadora."""
+    return metrics.with_retention(run('aggregate', filters, ['Dia_Semana', 'TRANSPORTADORA']))
+
+
+def daily_totals(run, filters):
+    """Totais e taxa de retenção por dia x transportadora."""
+    return metrics.with_retention(run('aggregate', filters, ['DATA', 'TRANSPORTADORA']))
+
+
+def monthly_totals(run, filters):
+    return metrics.with_retention(run('aggregate', filters, ['Mês_Ano', 'TRANSPORTADORA']))
+
+
+def yearly_totals(run, filters):
+    return metrics.with_retention(run('aggregate', filters, ['Ano', 'TRANSPORTADORA']))
+
+
+def daily_window(run, filters):
+    """Limites do filtro e início padrão dos gráficos diários (últimos 5 dias):
+    (data_minima, data_maxima, inicio_padrao)."""
+    min_date, max_date = run('date_bounds', filters)
+    default_start = max(max_date - pd.Timedelta(days=DAILY_WINDOW_DAYS - 1), min_date)
+    return min_date, max_date, default_start
+
+
+def current_week(run, filters, start_date):
+    """Dias da semana mais recente do filtro: (totais_diarios, inicio_da_semana, data_maxima)."""
+    _, max_date = run('date_bounds', filters)
+    start_of_week = max_date - pd.Timedelta(days=max_date.weekday())
+    filters_semana = filters.replace(start_date=max(pd.to_datetime(start_date), start_of_week))
+    return daily_totals(run, filters_semana), start_of_week, max_date
+
+
+def top_carriers(carriers, n):
+    """As n transportadoras de maior fluxo (LIBERADOS + MALHA) em carrier_totals,
+    ou None quando não há o que agrupar (n = 0 ou até n transportadoras)."""
+    if not n or len(carriers) <= n:
+        return None
+    total = carriers['LIBERADOS'] + carriers['MALHA']
+    return carriers.loc[total.sort_values(ascending=False, kind='stable').index[:n], 'TRANSPORTADORA'].tolist()
+
+
+def _regroup(df, keys):
+    grouped = df.groupby(keys, sort=False, as_index=False, dropna=False)[['LIBERADOS', 'MALHA']].sum()
+    return metrics.with_retention(grouped) if 'MALHA_PCT' in df.columns else grouped
+
+
+def group_other_carriers(df, keep):
+    """Soma as transportadoras fora de `keep` em uma única linha "Outras" por chave de agrupamento."""
+    if keep is None or 'TRANSPORTADORA' not in df.columns:
+        return df
+    keys = [c for c in df.columns if c not in VALUE_COLUMNS]
+    return _regroup(df.assign(TRANSPORTADORA=df['TRANSPORTADORA'].where(df['TRANSPORTADORA'].isin(keep), OTHERS_LABEL)), keys)
+
+
+def limit_daily_resolution(df, max_dates=MAX_DAILY_DATES):
+    """Totais diários com mais de max_dates dias viram semanais (DATA = segunda-feira da semana).
+    Retorna (df, semanal)."""
+    if df.empty or df['DATA'].nunique() <= max_dates:
+        return df, False
+    week = df['DATA'] - pd.to_timedelta(df['DATA'].dt.weekday, unit='D')
+    keys = [c for c in df.columns if c not in VALUE_COLUMNS]
+    return _regroup(df.assign(DATA=week), keys), True
+
+
+def independent_filters(operacoes, transportadoras):
+    """Filtros da análise de dia específico: só as categorias, sem ano nem período."""
+    return queries.make_filters(operacoes=operacoes, transportadoras=transportadoras)
+
+
+def first_render(run, filters, start_date, end_date, operacoes=None, transportadoras=None):
+    """Executa tudo o que a página pede na primeira renderização com esses filtros."""
+    # Os KPIs saem das somas acumuladas (rangesums.py), sem consulta
+    anos_filtrados = run('distinct_values', 'Ano', filters)
+    carrier_totals(run, filters)
+    operation_totals(run, filters)
+    weekday_heatmap(run, filters)
+    monthly_totals(run, filters)
+    yearly_totals(run, filters)
+    if anos_filtrados:
+        _, max_date, default_start = daily_window(run, filters)
+        daily_totals(run, filters.replace(start_date=default_start.date(), end_date=max_date.date()))
+        current_week(run, filters, start_date)
+    filters_indep = independent_filters(operacoes, transportadoras)
+    _, max_date_indep = run('date_bounds', filters_indep)
+    if max_date_indep is not None:
+        dia = max_date_indep.date()
+        daily_totals(run, filters_indep.replace(start_date=dia, end_date=dia))
+
+
+# --- CACHE EM TABELA ---
+
+def _canonical(value):
+    if isinstance(value, queries.QueryFilters):
+        canonical = {}
+        for field in fields(value):
+            item = getattr(value, field.name)
+            if item is None:
+                canonical[field.name] = None
+            elif field.name in ('start_date', 'end_date'):
+                canonical[field.name] = queries._day(item)
+            else:
+                # Seleções são conjuntos: a ordem escolhida na tela não muda o resultado
+                canonical[field.name] = sorted(str(v) for v in item)
+        return canonical
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def cache_key(query_name, args):
+    """Chave estável de uma chamada de consulta (mesmos filtros -> mesma chave)."""
+    return json.dumps([query_name, _canonical(list(args))], ensure_ascii=False, sort_keys=True)
+
+
+def _json_default(value):
+    if isinstance(value, pd.Timestamp):
+        return {'$ts': value.isoformat()}
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f'Tipo não serializável: {type(value)!r}')
+
+
+def _json_hook(value):
+    return pd.Timestamp(value['$ts']) if set(value) == {'$ts'} else value
+
+
+def encode_result(result):
+    """Serializa o resultado de uma consulta: DataFrames em Arrow IPC, o resto em JSON."""
+    if isinstance(result, pd.DataFrame):
+        sink = io.BytesIO()
+        table = pa.Table.from_pandas(result, preserve_index=False)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return 'arrow', sink.getvalue()
+    return 'json', json.dumps(result, default=_json_default).encode()
+
+
+def decode_result(formato, conteudo):
+    if formato == 'arrow':
+        return pa.ipc.open_stream(conteudo).read_all().to_pandas()
+    return json.loads(conteudo, object_hook=_json_hook)
+
+
+def cached_result(engine, data_version, query_name, args):
+    """Resultado pré-calculado da chamada na versão atual dos dados, ou None."""
+    row = queries.read_cache(engine, cache_key(query_name, args), data_version)
+    return decode_result(*row) if row else None
+
+
+# --- PRÉ-CÁLCULO EM LOTE ---
+
+def standard_views(run, reference_date=None):
+    """Visões padrão: (filtros, início, fim, operações, transportadoras) como o dashboard as monta.
+
+    Sem login: histórico completo, sem filtros. Com login (todos os anos, operações e
+    transportadoras marcados): histórico completo, semana atual, últimos 3 meses e cada ano.
+    """
+    min_date, max_date = run('date_bounds', queries.QueryFilters())
+    if min_date is None:
+        return
+    reference = min(pd.to_datetime(reference_date), max_date) if reference_date else max_date
+    anos = sorted((int(a) for a in run('distinct_values', 'Ano')), reverse=True)
+    operacoes = run('distinct_values', 'OPERAÇÃO')
+    transportadoras = run('distinct_values', 'TRANSPORTADORA')
+
+    def admin_view(view_anos, start_date, end_date):
+        start_date, end_date = max(start_date, min_date), min(end_date, max_date)
+        filters = period_filters(min_date, max_date, view_anos, start_date.date(), end_date.date(), operacoes, transportadoras)
+        return filters, start_date.date(), end_date.date(), operacoes, transportadoras
+
+    yield queries.QueryFilters(), min_date, max_date, None, None
+    yield admin_view(anos, min_date, max_date)
+    yield admin_view(anos, reference - pd.Timedelta(days=reference.weekday()), reference)
+    yield admin_view(anos, (reference - pd.DateOffset(months=2)).replace(day=1), reference)
+    for ano in anos:
+        # Ano até a data de referência, com o período da barra lateral no histórico completo
+        yield admin_view([ano], min_date, max_date)
+
+
+def precompute(engine, reference_date=None):
+    """Calcula as visões padrão e grava os resultados na tabela de cache. Retorna (versão, consultas)."""
+    queries.ensure_schema(engine)
+    # A versão é lida antes das consultas: se uma escrita acontecer no meio,
+    # o resultado fica marcado com a versão antiga e não é usado
+    version = queries.get_data_version(engine)
+    results = {}
+
+    def run(query_name, *args):
+        key = cache_key(query_name, args)
+        if key not in results:
+            results[key] = getattr(queries, query_name)(engine, *args)
+        return results[key]
+
+    if queries.table_exists(engine):
+        for filters, start_date, end_date, operacoes, transportadoras in list(standard_views(run, reference_date)):
+            first_render(run, filters, start_date, end_date, operacoes, transportadoras)
+    queries.replace_cache(engine, version, {key: encode_result(result) for key, result in results.items()})
+    return version, len(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pré-calcula as visões padrão do dashboard na tabela de cache.")
+    parser.add_argument('--db', default='dados.db', help="arquivo SQLite (padrão: dados.db)")
+    parser.add_argument('--data', default=None, help="data de referência AAAA-MM-DD (padrão: última data do banco)")
+    args = parser.parse_args(argv)
+    version, total = precompute(queries.create_database_engine(f"sqlite:///{args.db}"), args.data)
+    print(f"{total} consultas pré-calculadas para a versão {version} dos dados.")
+
+
+if __name__ == '__main__':
+    main()
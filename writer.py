@@ -0,0 +1,136 @@
+"""Fila única de escrita no banco do dashboard.
+
+Todas as escritas (formulário manual, uploads, importação em blocos, recálculo dos resumos)
+são enfileiradas e executadas por um único thread escritor. O que estiver pendente quando
+o escritor fica livre vai junto em uma só transação (BEGIN IMMEDIATE, um commit por lote),
+com um SAVEPOINT por escrita: se uma falhar, só ela é desfeita e as demais são gravadas.
+Assim duas sessões nunca disputam o lock de escrita e, com o banco em WAL (ver
+queries.create_database_engine), os leitores não esperam pelas escritas.
+
+Uma escrita que pode ser interrompida no meio de um comando (ex.: o cancelamento de
+queries.merge_database) é enfileirada com exclusive=True e vai sozinha em um lote: o SQLite
+responde à interrupção desfazendo a transação inteira, e não só o SAVEPOINT da escrita. Se
+a transação de um lote comum for desfeita assim, todas as escritas do lote recebem erro.
+
+Depois de cada lote confirmado o escritor chama `after_commit` uma vez (ex.: conferir os
+índices), o que também evita duas sessões fazendo a mesma manutenção ao mesmo tempo.
+O que o SQLite só aceita fora de transação (DETACH) é agendado com
+queries.after_transaction e executado logo depois do fim do lote, na mesma conexão.
+"""
+import queue
+import threading
+from concurrent.futures import Future
+
+import queries
+
+MAX_BATCH = 64
+
+
+class BatchAborted(RuntimeError):
+    """O SQLite desfez a transação do lote (ex.: comando interrompido); nada dele foi gravado."""
+
+
+class WriteQueue:
+    """Thread escritor. `submit(func, *args)` enfileira func(conn, *args) e retorna um Future."""
+
+    def __init__(self, engine, after_commit=None, max_batch=MAX_BATCH):
+        self.engine = engine
+        self.after_commit = after_commit
+        self.max_batch = max_batch
+        self._jobs = queue.Queue()
+        # Escrita exclusiva retirada da fila enquanto se montava um lote: abre o próximo
+        self._held = None
+        self._thread = threading.Thread(target=self._loop, name='dashboard-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, refresh=True, exclusive=False):
+        """Enfileira a escrita. Com refresh=False o lote não chama after_commit por causa dela
+        (ex.: blocos intermediários de uma importação; ver sync). Com exclusive=True ela roda
+        sozinha em um lote, direto na transação, sem SAVEPOINT."""
+        future = Future()
+        self._jobs.put((func, args, refresh, exclusive, future))
+        return future
+
+    def run(self, func, *args, refresh=True, exclusive=False):
+        """Enfileira a escrita e espera o resultado (erros da escrita são relançados aqui)."""
+        return self.submit(func, *args, refresh=refresh, exclusive=exclusive).result()
+
+    def sync(self):
+        """Espera as escritas já enfileiradas e executa after_commit no thread escritor."""
+        return self.submit(None).result()
+
+    def _next_batch(self):
+        if self._held is not None:
+            batch, self._held = [self._held], None
+        else:
+            batch = [self._jobs.get()]
+        while not batch[0][3] and len(batch) < self.max_batch:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job[3]:
+                self._held = job
+                break
+            batch.append(job)
+        return batch
+
+    def _loop(self):
+        while True:
+            self._write(self._next_batch())
+
+    def _write(self, batch):
+        results, refresh = [], False
+        try:
+            with queries.connect_write(self.engine) as conn:
+                try:
+                    with conn.begin() as transaction:
+                        for func, args, job_refresh, exclusive, future in batch:
+                            if not future.set_running_or_notify_cancel():
+                                continue
+                            if func is None:
+                                results.append((future, None, None))
+                                refresh = True
+                                continue
+                            # Sozinha no lote, a escrita exclusiva usa a própria transação
+                            savepoint = None if exclusive else conn.begin_nested()
+                            try:
+                                result = func(conn, *args)
+                            except Exception as exc:
+                                results.append((future, None, exc))
+                                if not conn.connection.driver_connection.in_transaction:
+                                    # O SQLite já desfez a transação (e o savepoint): as escritas
+                                    # anteriores do lote se perderam e as seguintes rodariam fora dela
+                                    raise BatchAborted("A transação do lote foi desfeita pelo SQLite; "
+                                                       "nenhuma escrita do lote foi gravada.") from exc
+                                (savepoint or transaction).rollback()
+                            else:
+                                if savepoint is not None:
+                                    savepoint.commit()
+                                results.append((future, result, None))
+                                refresh = refresh or job_refresh
+                finally:
+                    # Ex.: DETACH dos bancos anexados por queries.merge_database
+                    queries.run_after_transaction(conn)
+        except Exception as exc:
+            # Falha ao conectar, no BEGIN ou no COMMIT, ou transação desfeita: nada do lote foi
+            # gravado. Todo job que ainda não terminou recebe o erro (o do próprio job, se ele já
+            # tinha falhado)
+            errors = {id(future): error for future, _, error in results}
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(errors.get(id(future)) or exc)
+            return
+        if refresh and self.after_commit is not None:
+            try:
+                self.after_commit()
+            except Exception:
+                # Ex.: índices não conferidos; a próxima escrita tenta de novo
+                pass
+        # Os resultados (e erros) só saem depois do fim da transação: quem espera já pode,
+        # por exemplo, apagar o arquivo que a escrita tinha anexado
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)